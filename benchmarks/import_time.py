@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+# Copyright 2023 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+  Import time budget of the pcdviz entry points.
+
+  Each module is imported in a fresh interpreter with "-X importtime".
+  The check fails if an import takes longer than its budget or pulls in
+  a heavy module, e.g. open3d for "pcdviz --help".
+
+      python benchmarks/import_time.py
+"""
+
+import argparse
+import subprocess
+import sys
+
+# module: (budget in ms, modules it must not import)
+BUDGETS = {
+    "pcdviz.main": (150, ("numpy", "open3d", "PIL", "skimage")),
+    "pcdviz.dataset.factory": (300, ("open3d", "PIL", "skimage")),
+    "pcdviz.statistics.statistics": (300, ("open3d", "PIL", "skimage",
+                                           "matplotlib", "seaborn")),
+    "pcdviz.render": (400, ("open3d", "skimage")),
+}
+
+
+def import_time(module):
+    """Import module in a new interpreter
+
+    Returns:
+        (float, set): cumulative import time in ms and the imported modules,
+            raise ImportError if the import fails
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        stderr=subprocess.PIPE, universal_newlines=True)
+    output = process.stderr
+    if process.returncode:
+        raise ImportError(output.strip().splitlines()[-1])
+    total, modules = 0, set()
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        modules.add(name.strip().split(".")[0])
+        # top level imports are not indented
+        if not name[1:].startswith(" "):
+            total += int(cumulative)
+    return total / 1000, modules
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument(
+        "-n", "--repeat", action="store", type=int, default=3,
+        help="Imports per module, the fastest counts")
+    parser.add_argument(
+        "--scale", action="store", type=float, default=1.0,
+        help="Multiply the budgets, for slow machines")
+    args = parser.parse_args(args)
+
+    failed = False
+    for module, (budget, forbidden) in BUDGETS.items():
+        try:
+            runs = [import_time(module) for _ in range(args.repeat)]
+        except ImportError as e:
+            failed = True
+            print("{:<32}{}".format(module, e))
+            continue
+        elapsed = min(run[0] for run in runs)
+        heavy = sorted(set(forbidden) & runs[0][1])
+        ok = elapsed <= budget * args.scale and not heavy
+        failed |= not ok
+        print("{:<32}{:>8.1f} ms  budget {:>6.0f} ms  {}{}".format(
+            module, elapsed, budget * args.scale, "ok" if ok else "FAIL",
+            "  imports " + ", ".join(heavy) if heavy else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
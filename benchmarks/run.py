@@ -0,0 +1,535 @@
+#!/usr/bin/env python
+
+# Copyright 2023 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+  Benchmarks of the read, parse and geometry paths of pcdviz.
+
+  Synthetic KITTI, nuScenes and custom datasets are written to --root
+  (kept and reused while the scale is the same), then every case is timed
+  --repeat times. The median time, throughput and the peak memory
+  allocated by one run are written as JSON, and --compare prints the
+  speedup against an earlier result file.
+
+      python benchmarks/run.py --frames 20 --points 120000 --out new.json
+      python benchmarks/run.py --compare old.json -k proj
+"""
+
+import argparse
+import fnmatch
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic  # noqa: E402
+
+CASES = {}
+
+
+def case(name, unit="frames", requires=()):
+    """Register a benchmark
+
+    The decorated function gets the Context and returns (run, items): run
+    is timed and items, in unit, gives the throughput.
+    """
+    def register(func):
+        CASES[name] = (func, unit, tuple(requires))
+        return func
+    return register
+
+
+class Context:
+    """Synthetic datasets and their decoded frames, shared by the cases"""
+
+    def __init__(self, root, frames, points, boxes):
+        self.root = root
+        self.frames = frames
+        self.points = points
+        self.boxes = boxes
+        self._cache = {}
+
+    def path(self, layout):
+        return os.path.join(self.root, layout)
+
+    def dataset(self, layout):
+        key = ("dataset", layout)
+        if key not in self._cache:
+            from pcdviz.registry import DATASETS
+            name = {"kitti": "KITTI", "nuscenes": "nuScenes",
+                    "custom": "custom"}[layout]
+            self._cache[key] = DATASETS.get(name)(self.path(layout))
+        return self._cache[key]
+
+    def frame_data(self, layout):
+        """[(points, labels)] of all frames, points copied to memory"""
+        key = ("frames", layout)
+        if key not in self._cache:
+            dataset = self.dataset(layout)
+            self._cache[key] = [
+                (np.array(dataset.read_points(i)), dataset.read_labels(i))
+                for i in range(len(dataset))]
+        return self._cache[key]
+
+    def xyz(self, layout="kitti"):
+        from pcdviz.io import lidar
+        return [np.ascontiguousarray(lidar.xyz(points))
+                for points, _ in self.frame_data(layout)]
+
+
+def prepare(root, frames, points, boxes):
+    """Write the synthetic datasets unless root already has this scale"""
+    scale = {"frames": frames, "points": points, "boxes": boxes,
+             "format": 1}
+    stamp = os.path.join(root, "scale.json")
+    if os.path.exists(stamp):
+        with open(stamp) as f:
+            if json.load(f) == scale:
+                return
+    shutil.rmtree(root, ignore_errors=True)
+    os.makedirs(root)
+    start = time.perf_counter()
+    synthetic.kitti(os.path.join(root, "kitti"), frames, points, boxes)
+    synthetic.custom(os.path.join(root, "custom"), frames, points, boxes)
+    # nuScenes sweeps have about a quarter of the points
+    synthetic.nuscenes(os.path.join(root, "nuscenes"), frames,
+                       max(points // 4, 1), boxes * 2)
+    with open(stamp, 'w') as f:
+        json.dump(scale, f)
+    print("Wrote datasets to {} in {:.1f}s".format(
+        root, time.perf_counter() - start))
+
+
+# read and parse
+
+
+@case("read.kitti_velodyne", unit="points")
+def read_kitti_velodyne(ctx):
+    from pcdviz.dataset.kitti import KITTI
+    from pcdviz.io import lidar
+    files = [os.path.join(ctx.path("kitti"), "velodyne", name)
+             for name in sorted(os.listdir(os.path.join(
+                 ctx.path("kitti"), "velodyne")))]
+
+    def run():
+        for file_path in files:
+            np.ascontiguousarray(lidar.xyz(KITTI.read_velodyne(file_path)))
+    return run, ctx.frames * ctx.points
+
+
+@case("read.nuscenes_pcd", unit="points")
+def read_nuscenes_pcd(ctx):
+    from pcdviz.dataset.nuscenes import Nuscenes
+    from pcdviz.io import lidar
+    lidar_dir = os.path.join(ctx.path("nuscenes"), "samples", "LIDAR_TOP")
+    files = [os.path.join(lidar_dir, name)
+             for name in sorted(os.listdir(lidar_dir))]
+
+    def run():
+        for file_path in files:
+            np.ascontiguousarray(lidar.xyz(Nuscenes.read_pcd(file_path)))
+    return run, ctx.frames * max(ctx.points // 4, 1)
+
+
+@case("read.custom_lidar", unit="points")
+def read_custom_lidar(ctx):
+    from pcdviz.dataset.custom_dataset import CustomDataset
+    from pcdviz.io import lidar
+    dataset = ctx.dataset("custom")
+    files = [dataset.manifest.path("velodyne", i)
+             for i in range(len(dataset))]
+
+    def run():
+        for file_path in files:
+            np.ascontiguousarray(lidar.xyz(
+                CustomDataset.read_lidar(file_path)))
+    return run, ctx.frames * ctx.points
+
+
+@case("parse.kitti_label")
+def parse_kitti_label(ctx):
+    from pcdviz.dataset.kitti import KITTI
+    dataset = ctx.dataset("kitti")
+    calib = KITTI.read_calib(dataset.label_files(0)[0])
+    files = [dataset.label_files(i)[1] for i in range(len(dataset))]
+
+    def run():
+        for file_path in files:
+            KITTI.read_label(file_path, calib)
+    return run, ctx.frames
+
+
+@case("parse.kitti_calib")
+def parse_kitti_calib(ctx):
+    from pcdviz.dataset.kitti import KITTI
+    dataset = ctx.dataset("kitti")
+    files = [dataset.label_files(i)[0] for i in range(len(dataset))]
+
+    def run():
+        # every synthetic calib is the same, parse each one
+        for file_path in files:
+            KITTI._parse_calib.cache_clear()
+            KITTI.read_calib(file_path)
+    return run, ctx.frames
+
+
+@case("parse.custom_label")
+def parse_custom_label(ctx):
+    from pcdviz.dataset.custom_dataset import CustomDataset
+    dataset = ctx.dataset("custom")
+    files = [dataset.manifest.path("label", i) for i in range(len(dataset))]
+
+    def run():
+        for file_path in files:
+            CustomDataset.read_label(file_path, None)
+    return run, ctx.frames
+
+
+@case("parse.nuscenes_labels")
+def parse_nuscenes_labels(ctx):
+    dataset = ctx.dataset("nuscenes")
+
+    def run():
+        for i in range(len(dataset)):
+            dataset.read_labels(i)
+    return run, ctx.frames
+
+
+@case("open.nuscenes_cold")
+def open_nuscenes_cold(ctx):
+    from pcdviz.dataset.nuscenes import Nuscenes
+    from pcdviz.dataset.nuscenes_index import NuscenesIndex
+    index_dir = NuscenesIndex.open(ctx.path("nuscenes"), "v1.0-mini") \
+        .index_dir
+
+    def run():
+        shutil.rmtree(index_dir, ignore_errors=True)
+        Nuscenes(ctx.path("nuscenes"))
+    return run, ctx.frames
+
+
+@case("open.nuscenes_warm")
+def open_nuscenes_warm(ctx):
+    from pcdviz.dataset.nuscenes import Nuscenes
+    Nuscenes(ctx.path("nuscenes"))
+
+    def run():
+        Nuscenes(ctx.path("nuscenes"))
+    return run, ctx.frames
+
+
+@case("open.kitti_manifest")
+def open_kitti_manifest(ctx):
+    from pcdviz.dataset.kitti import KITTI
+    cache_file = ctx.dataset("kitti").manifest.cache_file
+
+    def run():
+        os.remove(cache_file)
+        KITTI(ctx.path("kitti"))
+    return run, ctx.frames
+
+
+@case("index.kitti_labels")
+def index_kitti_labels(ctx):
+    from pcdviz.dataset.label_index import LabelIndex
+    dataset = ctx.dataset("kitti")
+
+    def run():
+        index = LabelIndex(dataset, workers=1)
+        if os.path.exists(index.cache_file):
+            os.remove(index.cache_file)
+        index.refresh()
+    return run, ctx.frames
+
+
+# geometry
+
+
+@case("geometry.box_corners", unit="boxes")
+def geometry_box_corners(ctx):
+    from pcdviz.geometry.box import box_corners
+    labels = [labels for _, labels in ctx.frame_data("kitti")]
+
+    def run():
+        for label in labels:
+            box_corners(label["center"], label["extent"], label["R"])
+    return run, sum(len(label["type"]) for label in labels)
+
+
+@case("geometry.create_boxes", unit="boxes", requires=("open3d",))
+def geometry_create_boxes(ctx):
+    from pcdviz.geometry.box import create_boxes
+    labels = [labels for _, labels in ctx.frame_data("kitti")]
+
+    def run():
+        for label in labels:
+            create_boxes(label)
+    return run, sum(len(label["type"]) for label in labels)
+
+
+@case("geometry.create_pointcloud", unit="points", requires=("open3d",))
+def geometry_create_pointcloud(ctx):
+    from pcdviz.geometry.pointcloud import create_pointcloud
+    frames = ctx.frame_data("kitti")
+
+    def run():
+        for points, _ in frames:
+            create_pointcloud(points)
+    return run, ctx.frames * ctx.points
+
+
+@case("geometry.points_in_boxes", unit="points")
+def geometry_points_in_boxes(ctx):
+    from pcdviz.geometry.points_in_boxes import points_in_boxes
+    frames = list(zip(ctx.xyz("kitti"),
+                      [labels for _, labels in ctx.frame_data("kitti")]))
+
+    def run():
+        for xyz, labels in frames:
+            points_in_boxes(xyz, labels["center"], labels["extent"],
+                            labels["R"])
+    return run, ctx.frames * ctx.points
+
+
+@case("geometry.lod_budget", unit="points")
+def geometry_lod_budget(ctx):
+    from pcdviz.geometry.lod import budget_indices
+    frames = ctx.xyz("kitti")
+
+    def run():
+        for xyz in frames:
+            budget_indices(xyz, len(xyz) // 4)
+    return run, ctx.frames * ctx.points
+
+
+@case("geometry.colormap", unit="points")
+def geometry_colormap(ctx):
+    from pcdviz.geometry.colormap import ColorMap
+    colormaps = [ColorMap("intensity"), ColorMap("range", range=[0, 80])]
+    frames = ctx.frame_data("kitti")
+
+    def run():
+        for points, _ in frames:
+            for colormap in colormaps:
+                colormap(points)
+    return run, ctx.frames * ctx.points
+
+
+@case("filter.pipeline", unit="points")
+def filter_pipeline(ctx):
+    from pcdviz.filter.pipeline import FilterPipeline
+    pipeline = FilterPipeline.from_config([
+        {"name": "range_filter", "range": [-40, -40, -3, 40, 40, 1],
+         "radius": [2, 60]},
+        {"name": "threshold_filter", "threshold": {"intensity": 0.1}},
+        {"name": "type_filter", "black_type": ["DontCare"]}])
+    frames = ctx.frame_data("kitti")
+
+    def run():
+        for points, labels in frames:
+            pipeline.apply(points, labels)
+    return run, ctx.frames * ctx.points
+
+
+# projections
+
+
+@case("proj.bev", unit="points")
+def proj_bev(ctx):
+    from pcdviz.proj.bev import BEV
+    bev = BEV()
+    frames = ctx.frame_data("kitti")
+
+    def run():
+        for points, labels in frames:
+            bev.render(points, labels)
+    return run, ctx.frames * ctx.points
+
+
+@case("proj.range_image", unit="points")
+def proj_range_image(ctx):
+    from pcdviz.proj.range_img import RangeImage
+    range_image = RangeImage.from_sensor("kitti")
+    frames = ctx.frame_data("kitti")
+
+    def run():
+        for points, _ in frames:
+            range_image.project(points)
+    return run, ctx.frames * ctx.points
+
+
+@case("proj.camera", unit="points")
+def proj_camera(ctx):
+    from pcdviz.dataset.kitti import KITTI
+    from pcdviz.proj.img import CameraProjection
+    calib = KITTI.read_calib(ctx.dataset("kitti").label_files(0)[0])
+    projection = CameraProjection.from_kitti(calib, (375, 1242))
+    frames = ctx.xyz("kitti")
+
+    def run():
+        for xyz in frames:
+            projection.zbuffer(xyz)
+    return run, ctx.frames * ctx.points
+
+
+def missing(requires):
+    return [name for name in requires if importlib.util.find_spec(name)
+            is None]
+
+
+def measure(ctx, name, repeat):
+    func, unit, requires = CASES[name]
+    absent = missing(requires)
+    if absent:
+        return {"skipped": "needs " + ", ".join(absent)}
+    run, items = func(ctx)
+    # warm up the page cache and lazy imports
+    run()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    median = statistics.median(times)
+    return {"unit": unit, "items": items,
+            "median_s": median, "min_s": min(times), "max_s": max(times),
+            "throughput": items / median if median > 0 else None,
+            "peak_mb": peak / (1024 * 1024)}
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _max_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # KB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def report(results, baseline=None):
+    print("{:<30}{:>11}{:>16}{:>10}{}".format(
+        "case", "median ms", "throughput/s", "peak MB",
+        "   vs baseline" if baseline else ""))
+    for name, result in results.items():
+        if "skipped" in result:
+            print("{:<30}  skipped, {}".format(name, result["skipped"]))
+            continue
+        line = "{:<30}{:>11.2f}{:>16}{:>10.1f}".format(
+            name, result["median_s"] * 1000,
+            "{:.3g} {}".format(result["throughput"], result["unit"]),
+            result["peak_mb"])
+        old = (baseline or {}).get(name, {})
+        if old.get("median_s"):
+            line += "   {:.2f}x".format(old["median_s"] / result["median_s"])
+        print(line)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark pcdviz on synthetic datasets.")
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--points", type=int, default=120000,
+                        help="Points per KITTI and custom sweep, nuScenes "
+                             "sweeps have a quarter")
+    parser.add_argument("--boxes", type=int, default=20,
+                        help="Boxes per frame, twice as many for nuScenes")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--root", help="Dataset directory, a temporary "
+                                       "one is used and removed if not set")
+    parser.add_argument("-k", "--cases", action="append",
+                        help="Only run the cases matching a pattern, e.g. "
+                             "'proj.*' or 'read'")
+    parser.add_argument("-o", "--out", help="Write the results as JSON")
+    parser.add_argument("--compare", help="Earlier JSON result to compare")
+    parser.add_argument("--list", action="store_true",
+                        help="List the cases")
+    args = parser.parse_args(args)
+
+    if args.list:
+        for name, (_, unit, requires) in CASES.items():
+            print("{:<30}{:<8}{}".format(name, unit, " ".join(requires)))
+        return 0
+
+    names = [name for name in CASES if not args.cases or any(
+        fnmatch.fnmatch(name, pattern) or pattern in name
+        for pattern in args.cases)]
+    root = args.root or tempfile.mkdtemp(prefix="pcdviz-bench-")
+    # caches of the run stay out of the user cache
+    os.environ["PCDVIZ_CACHE_DIR"] = os.path.join(root, "cache")
+    try:
+        prepare(os.path.join(root, "data"), args.frames, args.points,
+                args.boxes)
+        ctx = Context(os.path.join(root, "data"), args.frames, args.points,
+                      args.boxes)
+        results = {}
+        for name in names:
+            results[name] = measure(ctx, name, args.repeat)
+    finally:
+        if not args.root:
+            shutil.rmtree(root, ignore_errors=True)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    report(results, baseline)
+
+    if args.out:
+        output = {
+            "meta": {"revision": _git_revision(),
+                     "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                     "python": platform.python_version(),
+                     "numpy": np.__version__,
+                     "platform": platform.platform(),
+                     "cpus": os.cpu_count(),
+                     "max_rss_mb": _max_rss_mb()},
+            "scale": {"frames": args.frames, "points": args.points,
+                      "boxes": args.boxes, "repeat": args.repeat},
+            "results": results}
+        with open(args.out, 'w') as f:
+            json.dump(output, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
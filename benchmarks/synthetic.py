@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+
+# Copyright 2023 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+  Synthetic datasets in the KITTI, nuScenes and custom layouts.
+
+  Sweeps are rings of points at lidar-like elevations and ranges, boxes are
+  placed around the sensor with random types, sizes and headings. The same
+  seed gives the same files, so timings of different versions compare.
+
+      python benchmarks/synthetic.py kitti /tmp/kitti --frames 100
+"""
+
+import argparse
+import json
+import os
+import uuid
+
+import numpy as np
+
+KITTI_TYPES = ("Car", "Van", "Truck", "Pedestrian", "Cyclist", "DontCare")
+NUSCENES_CATEGORIES = ("vehicle.car", "vehicle.truck", "vehicle.bicycle",
+                       "human.pedestrian.adult", "movable_object.barrier")
+# (length, width, height) of the boxes, KITTI_TYPES order
+_SIZES = np.array([[4.2, 1.8, 1.5], [5.0, 2.0, 2.1], [9.0, 2.6, 3.4],
+                   [0.8, 0.7, 1.8], [1.8, 0.6, 1.7], [2.0, 2.0, 2.0]])
+
+# KITTI training/calib/000003.txt
+KITTI_CALIB = """\
+P0: 7.215377000000e+02 0.000000000000e+00 6.095593000000e+02 0.000000000000e+00 0.000000000000e+00 7.215377000000e+02 1.728540000000e+02 0.000000000000e+00 0.000000000000e+00 0.000000000000e+00 1.000000000000e+00 0.000000000000e+00
+P1: 7.215377000000e+02 0.000000000000e+00 6.095593000000e+02 -3.875744000000e+02 0.000000000000e+00 7.215377000000e+02 1.728540000000e+02 0.000000000000e+00 0.000000000000e+00 0.000000000000e+00 1.000000000000e+00 0.000000000000e+00
+P2: 7.215377000000e+02 0.000000000000e+00 6.095593000000e+02 4.485728000000e+01 0.000000000000e+00 7.215377000000e+02 1.728540000000e+02 2.163791000000e-01 0.000000000000e+00 0.000000000000e+00 1.000000000000e+00 2.745884000000e-03
+P3: 7.215377000000e+02 0.000000000000e+00 6.095593000000e+02 -3.395242000000e+02 0.000000000000e+00 7.215377000000e+02 1.728540000000e+02 2.199936000000e+00 0.000000000000e+00 0.000000000000e+00 1.000000000000e+00 2.729905000000e-03
+R0_rect: 9.999239000000e-01 9.837760000000e-03 -7.445048000000e-03 -9.869795000000e-03 9.999421000000e-01 -4.278459000000e-03 7.402527000000e-03 4.351614000000e-03 9.999631000000e-01
+Tr_velo_to_cam: 7.533745000000e-03 -9.999714000000e-01 -6.166020000000e-04 -4.069766000000e-03 1.480249000000e-02 7.280733000000e-04 -9.998902000000e-01 -7.631618000000e-02 9.998621000000e-01 7.523790000000e-03 1.480755000000e-02 -2.717806000000e-01
+Tr_imu_to_velo: 9.999976000000e-01 7.553071000000e-04 -2.035826000000e-03 -8.086759000000e-01 -7.854027000000e-04 9.998898000000e-01 -1.482298000000e-02 3.195559000000e-01 2.024406000000e-03 1.482454000000e-02 9.998881000000e-01 -7.997231000000e-01
+"""
+
+
+def sweep(rng, num_points, num_fields=4, rings=64, fov=(-24.8, 2.0)):
+    """(num_points, num_fields) float32 sweep, x y z intensity [ring ...]"""
+    ring = rng.integers(0, rings, num_points)
+    elevation = np.radians(fov[0] + (fov[1] - fov[0]) * ring / (rings - 1))
+    azimuth = rng.uniform(-np.pi, np.pi, num_points)
+    distance = np.minimum(2.0 + rng.exponential(15.0, num_points), 120.0)
+    # rings below the horizon hit the ground 1.73 m under the sensor
+    ground = np.where(elevation < 0, 1.73 / -np.sin(np.minimum(elevation, -1e-3)),
+                      np.inf)
+    distance = np.minimum(distance, ground)
+    points = np.empty((num_points, num_fields), dtype=np.float32)
+    points[:, 0] = distance * np.cos(elevation) * np.cos(azimuth)
+    points[:, 1] = distance * np.cos(elevation) * np.sin(azimuth)
+    points[:, 2] = distance * np.sin(elevation)
+    points[:, 3] = rng.random(num_points)
+    if num_fields > 4:
+        points[:, 4] = ring
+    if num_fields > 5:
+        points[:, 5:] = 0
+    return points
+
+
+def boxes(rng, num_boxes, num_types=len(KITTI_TYPES)):
+    """Random boxes around the sensor
+
+    Returns:
+        (np.ndarray, np.ndarray, np.ndarray, np.ndarray): type codes (N,),
+            centers (N, 3), sizes (N, 3) as (length, width, height) and
+            yaw (N,)
+    """
+    types = rng.integers(0, num_types, num_boxes)
+    sizes = _SIZES[types % len(_SIZES)] * rng.uniform(0.9, 1.1, (num_boxes, 1))
+    distance = rng.uniform(3.0, 60.0, num_boxes)
+    azimuth = rng.uniform(-np.pi, np.pi, num_boxes)
+    centers = np.stack([distance * np.cos(azimuth),
+                        distance * np.sin(azimuth),
+                        sizes[:, 2] / 2 - 1.73], axis=1)
+    yaw = rng.uniform(-np.pi, np.pi, num_boxes)
+    return types, centers, sizes, yaw
+
+
+def kitti(root, frames=100, points=120000, num_boxes=20, seed=0):
+    """KITTI training split: velodyne, calib and label_2"""
+    rng = np.random.default_rng(seed)
+    for subdir in ("velodyne", "calib", "label_2"):
+        os.makedirs(os.path.join(root, subdir), exist_ok=True)
+    values = [line.split()[1:] for line in KITTI_CALIB.splitlines()]
+    velo_to_cam = np.eye(4)
+    velo_to_cam[:3] = np.array(values[5], dtype=np.float64).reshape(3, 4)
+
+    for i in range(frames):
+        name = "{:06d}".format(i)
+        sweep(rng, points).tofile(
+            os.path.join(root, "velodyne", name + ".bin"))
+        with open(os.path.join(root, "calib", name + ".txt"), 'w') as f:
+            f.write(KITTI_CALIB)
+
+        types, centers, sizes, yaw = boxes(rng, num_boxes)
+        # bottom center in camera coordinates, rotation_y from yaw
+        bottom = np.c_[centers[:, :2], centers[:, 2] - sizes[:, 2] / 2,
+                       np.ones(num_boxes)]
+        location = (bottom @ velo_to_cam.T)[:, :3]
+        rotation_y = np.pi / 2 - yaw
+        lines = []
+        for j in range(num_boxes):
+            length, width, height = sizes[j]
+            lines.append(
+                "{} 0.00 0 0.00 0.00 0.00 100.00 100.00 "
+                "{:.2f} {:.2f} {:.2f} {:.2f} {:.2f} {:.2f} {:.2f}".format(
+                    KITTI_TYPES[types[j]], height, width, length,
+                    *location[j], rotation_y[j]))
+        with open(os.path.join(root, "label_2", name + ".txt"), 'w') as f:
+            f.write("\n".join(lines) + "\n")
+    return root
+
+
+def custom(root, frames=100, points=120000, num_boxes=20, seed=0,
+           predictions=True):
+    """pcdviz custom layout: velodyne, label and prediction"""
+    rng = np.random.default_rng(seed)
+    subdirs = ("velodyne", "label") + (("prediction",) if predictions else ())
+    for subdir in subdirs:
+        os.makedirs(os.path.join(root, subdir), exist_ok=True)
+
+    def write_boxes(file_path, scored):
+        types, centers, sizes, yaw = boxes(rng, num_boxes, len(_SIZES) - 1)
+        lines = []
+        for j in range(num_boxes):
+            line = "{} {:.3f} {:.3f} {:.3f} 0.0 0.0 {:.4f} {:.2f} {:.2f} " \
+                "{:.2f}".format(KITTI_TYPES[types[j]], *centers[j], yaw[j],
+                                *sizes[j])
+            if scored:
+                line += " {:.3f}".format(rng.random())
+            lines.append(line)
+        with open(file_path, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+
+    for i in range(frames):
+        name = "{:06d}".format(i)
+        sweep(rng, points).tofile(
+            os.path.join(root, "velodyne", name + ".bin"))
+        write_boxes(os.path.join(root, "label", name + ".txt"), False)
+        if predictions:
+            write_boxes(os.path.join(root, "prediction", name + ".txt"), True)
+    return root
+
+
+def nuscenes(root, frames=100, points=34000, num_boxes=40, seed=0,
+             scenes=None, version="v1.0-mini"):
+    """nuScenes tables and LIDAR_TOP key frames
+
+    Each sample also has a CAM_FRONT sample_data and a non key frame sweep,
+    so the tables have the shape of the real ones. frames are split over
+    scenes of at most 40 samples.
+    """
+    rng = np.random.default_rng(seed)
+    table_dir = os.path.join(root, version)
+    lidar_dir = os.path.join(root, "samples", "LIDAR_TOP")
+    os.makedirs(table_dir, exist_ok=True)
+    os.makedirs(lidar_dir, exist_ok=True)
+
+    def token():
+        return uuid.UUID(bytes=rng.bytes(16)).hex
+
+    tables = {name: [] for name in (
+        "category", "attribute", "visibility", "instance", "sensor",
+        "calibrated_sensor", "ego_pose", "log", "scene", "sample",
+        "sample_data", "sample_annotation", "map")}
+    for name in NUSCENES_CATEGORIES:
+        tables["category"].append({"token": token(), "name": name,
+                                   "description": ""})
+    sensors = {}
+    for channel, modality, translation, rotation in (
+            ("LIDAR_TOP", "lidar", [0.94, 0.0, 1.84],
+             [0.7071, 0.0, 0.0, -0.7071]),
+            ("CAM_FRONT", "camera", [1.70, 0.02, 1.51],
+             [0.5, -0.5, 0.5, -0.5])):
+        sensor = {"token": token(), "channel": channel, "modality": modality}
+        calibrated = {"token": token(), "sensor_token": sensor["token"],
+                      "translation": translation, "rotation": rotation,
+                      "camera_intrinsic": []}
+        tables["sensor"].append(sensor)
+        tables["calibrated_sensor"].append(calibrated)
+        sensors[channel] = calibrated["token"]
+    log = {"token": token(), "logfile": "synthetic", "vehicle": "synthetic",
+           "date_captured": "2020-01-01", "location": "synthetic"}
+    tables["log"].append(log)
+
+    scene_size = scenes and int(np.ceil(frames / scenes)) or 40
+    num_scenes = int(np.ceil(frames / scene_size))
+    frame = 0
+    for s in range(num_scenes):
+        size = min(scene_size, frames - frame)
+        sample_tokens = [token() for _ in range(size)]
+        scene = {"token": token(), "log_token": log["token"],
+                 "nbr_samples": size, "name": "scene-{:04d}".format(s),
+                 "first_sample_token": sample_tokens[0],
+                 "last_sample_token": sample_tokens[-1], "description": ""}
+        tables["scene"].append(scene)
+        instances = []
+        for _ in range(num_boxes):
+            instance = {"token": token(), "category_token": tables[
+                "category"][rng.integers(len(NUSCENES_CATEGORIES))]["token"],
+                "nbr_annotations": size}
+            tables["instance"].append(instance)
+            instances.append(instance["token"])
+
+        for k, sample_token in enumerate(sample_tokens):
+            timestamp = 1500000000000000 + frame * 500000
+            tables["sample"].append({
+                "token": sample_token, "timestamp": timestamp,
+                "scene_token": scene["token"],
+                "prev": sample_tokens[k - 1] if k else "",
+                "next": sample_tokens[k + 1] if k + 1 < size else ""})
+            heading = 0.05 * k
+            ego_translation = [10.0 * k, 0.0, 0.0]
+            ego_rotation = [np.cos(heading / 2), 0.0, 0.0,
+                            np.sin(heading / 2)]
+            for channel, key_frame in (("LIDAR_TOP", True),
+                                       ("LIDAR_TOP", False),
+                                       ("CAM_FRONT", True)):
+                ego_pose = {"token": token(), "timestamp": timestamp,
+                            "translation": ego_translation,
+                            "rotation": ego_rotation}
+                tables["ego_pose"].append(ego_pose)
+                file_name = "{}/{}/{}".format(
+                    "samples" if key_frame else "sweeps", channel,
+                    sample_token + (".pcd.bin" if channel == "LIDAR_TOP"
+                                    else ".jpg"))
+                tables["sample_data"].append({
+                    "token": token(), "sample_token": sample_token,
+                    "ego_pose_token": ego_pose["token"],
+                    "calibrated_sensor_token": sensors[channel],
+                    "timestamp": timestamp, "fileformat": "pcd",
+                    "is_key_frame": key_frame, "height": 0, "width": 0,
+                    "filename": file_name, "prev": "", "next": ""})
+            sweep(rng, points, num_fields=5, rings=32, fov=(-30.0, 10.0)) \
+                .tofile(os.path.join(lidar_dir, sample_token + ".pcd.bin"))
+
+            _, centers, sizes, yaw = boxes(rng, num_boxes)
+            for j in range(num_boxes):
+                tables["sample_annotation"].append({
+                    "token": token(), "sample_token": sample_token,
+                    "instance_token": instances[j],
+                    "visibility_token": "4", "attribute_tokens": [],
+                    "translation": (centers[j] + ego_translation).tolist(),
+                    "size": sizes[j, [1, 0, 2]].tolist(),
+                    "rotation": [np.cos(yaw[j] / 2), 0.0, 0.0,
+                                 np.sin(yaw[j] / 2)],
+                    "prev": "", "next": "", "num_lidar_pts": 10,
+                    "num_radar_pts": 0})
+            frame += 1
+
+    for name, records in tables.items():
+        with open(os.path.join(table_dir, name + ".json"), 'w') as f:
+            json.dump(records, f, indent=0)
+    return root
+
+
+GENERATORS = {"kitti": kitti, "nuscenes": nuscenes, "custom": custom}
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Write a synthetic dataset.")
+    parser.add_argument("layout", choices=sorted(GENERATORS))
+    parser.add_argument("root", help="Output directory")
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--points", type=int, default=120000,
+                        help="Points per sweep")
+    parser.add_argument("--boxes", type=int, default=20,
+                        help="Boxes per frame")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(args)
+    GENERATORS[args.layout](args.root, args.frames, args.points, args.boxes,
+                            args.seed)
+
+
+if __name__ == "__main__":
+    main()
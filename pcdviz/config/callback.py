@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+# Copyright 2023 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+  Label callbacks of config files.
+
+  A callback is Python source that reads a label file. It runs with
+  file_name, and the outputs of earlier callbacks such as calib, as
+  globals and leaves its result in a variable, "labels" by default:
+
+      callback: |
+        def read_labels(file_name):
+            ...
+        labels = read_labels(file_name)
+
+  The source is compiled once. Results are pickled to the pcdviz cache
+  keyed by the source, the path, size and mtime of the file and the
+  inputs, so a label file is only parsed again when it or the callback
+  changes. Modules imported by the callback are not part of the key,
+  change the cache_version of the callback after editing them.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import threading
+
+from pcdviz.util import get_cache_dir
+
+
+class Callback:
+    """Compiled callback
+
+    Args:
+        source (str): Python source of the callback
+        output (str): global holding the result, "labels" or "calib"
+        name (str): shown in tracebacks
+        cache (bool): memoize results on disk
+        version (optional): part of the cache key, changing it drops the
+            results cached by earlier versions
+    """
+
+    VERSION = 1
+
+    def __init__(self, source, output="labels", name="callback",
+                 cache=True, version=None):
+        self.source = source
+        self.output = output
+        self.name = name
+        self.cache = cache
+        self.digest = hashlib.sha1("{}|{}|{}|{}".format(
+            self.VERSION, version, output, source).encode(
+                'utf-8')).hexdigest()
+        self._compile()
+
+    def _compile(self):
+        self.code = compile(self.source, "<{}>".format(self.name), "exec")
+
+    def __getstate__(self):
+        # code objects do not pickle, e.g. to label index workers
+        state = dict(self.__dict__)
+        del state["code"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._compile()
+
+    def run(self, file_name, **inputs):
+        """Run the callback on file_name without the cache"""
+        namespace = dict(inputs, file_name=file_name)
+        exec(self.code, namespace)
+        if self.output not in namespace:
+            raise ValueError("{} does not set '{}'".format(
+                self.name, self.output))
+        return namespace[self.output]
+
+    def key(self, file_name, **inputs):
+        """Cache key of the result, None if file_name does not exist"""
+        try:
+            stat = os.stat(file_name)
+        except OSError:
+            return None
+        h = hashlib.sha1(self.digest.encode('utf-8'))
+        h.update("|{}|{}|{}".format(os.path.abspath(file_name), stat.st_size,
+                                    stat.st_mtime_ns).encode('utf-8'))
+        if inputs:
+            h.update(pickle.dumps(sorted(inputs.items()), protocol=4))
+        return h.hexdigest()
+
+    def cache_file(self, key):
+        return os.path.join(get_cache_dir("callbacks", key[:2]),
+                            key + ".pkl")
+
+    def __call__(self, file_name, **inputs):
+        """Result of the callback on file_name, from the cache if stored"""
+        key = self.key(file_name, **inputs) if self.cache else None
+        if key is None:
+            return self.run(file_name, **inputs)
+
+        cache_file = self.cache_file(key)
+        if os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'rb') as f:
+                    return pickle.load(f)
+            except Exception as e:
+                logging.warning("Ignore broken callback cache {}! {}".format(
+                    cache_file, e))
+
+        result = self.run(file_name, **inputs)
+        tmp_file = "{}.{}.{}.tmp".format(cache_file, os.getpid(),
+                                         threading.get_ident())
+        try:
+            with open(tmp_file, 'wb') as f:
+                pickle.dump(result, f, protocol=4)
+            os.replace(tmp_file, cache_file)
+        except (OSError, pickle.PicklingError, TypeError) as e:
+            logging.warning("Cache {} result failed! {}".format(
+                self.name, e))
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+        return result
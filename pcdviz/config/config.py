@@ -20,6 +20,8 @@ import yaml
 class Config:
     def __init__(self, config_path) -> None:
         self.config_path = config_path
+        # {(source, output): Callback}, compiled once per config
+        self._callbacks = {}
         self.parse(config_path)
 
     def parse(self, config_path):
@@ -38,8 +40,41 @@ class Config:
     def filters(self):
         return self.config.get('filters')
 
+    @property
+    def lod(self):
+        return self.config.get('lod')
+
+    @property
+    def render(self):
+        return self.config.get('render') or {}
+
     @property
     def bounding_box(self):
         for input in self.config.get('inputs'):
             if input.get("name") == "bounding_box":
                 return input
+
+    @property
+    def calib(self):
+        for input in self.config.get('inputs') or []:
+            if input.get("name") == "calib":
+                return input
+
+    def callback(self, input):
+        """Compiled callback of an input, None if it has none
+
+        A calib callback sets "calib", the others set "labels". The
+        cache_version of the input is part of the cache key of the results.
+        """
+        source = (input or {}).get("callback")
+        if not source:
+            return None
+        output = "calib" if input.get("name") == "calib" else "labels"
+        version = input.get("cache_version")
+        key = (source, output, version)
+        if key not in self._callbacks:
+            from pcdviz.config.callback import Callback
+            self._callbacks[key] = Callback(
+                source, output, "{} callback".format(input.get("name")),
+                version=version)
+        return self._callbacks[key]
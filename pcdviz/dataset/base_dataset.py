@@ -14,7 +14,197 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import numpy as np
+
+from pcdviz import profiler
+from pcdviz.geometry.box import create_boxes
+from pcdviz.geometry.pointcloud import create_pointcloud, set_colors
+from pcdviz.dataset.label_index import LabelIndex
+from pcdviz.geometry import points_in_boxes as pib
+from pcdviz.io import lidar
+
 
 class BaseDataset:
+    """
+      A frame is a dict with
+        "points": structured point array, see pcdviz.io.lidar
+        "labels": columns of N boxes in the lidar frame, "type" (N,),
+            "center" (N, 3), "extent" (N, 3) as (length, width, height),
+            "R" (N, 3, 3) and "score" (N,), NaN for ground truth
+        "pointcloud", "bboxes": open3d geometries to display
+        "box_ids": box of each point, -1 outside, with color_mode "box"
+    """
+
+    # FilterPipeline applied to every frame
+    filters = None
+    # "box" colors the points of each box like the box
+    color_mode = None
+    # ColorMap of the points by a field, e.g. intensity
+    colormap = None
+    # build float32 o3d.t.geometry point clouds, see create_pointcloud
+    tensor = False
+
     def __init__(self) -> None:
         pass
+
+    def apply_filters(self, points, labels=None):
+        if self.filters is None:
+            return points, labels
+        return self.filters.apply(points, labels)
+
+    def make_frame(self, points, labels=None, color=None):
+        """Filter a frame and build its geometries
+
+        Args:
+            points: structured point array
+            labels (dict): box columns, see above
+            color (optional): RGB color of the boxes
+        """
+        points, labels = self.apply_filters(points, labels)
+        pointcloud = create_pointcloud(points, self.tensor)
+        frame = {"points": points, "labels": labels}
+        if self.color_mode == "box" and labels is not None:
+            with profiler.span("points_in_boxes"):
+                box_ids = self.point_box_ids(frame)
+            set_colors(pointcloud, pib.point_colors(box_ids))
+            color = pib.box_colors(len(labels["type"]))
+            frame["box_ids"] = box_ids
+        elif self.colormap is not None:
+            with profiler.span("colormap", points=len(points)):
+                colors = self.colormap(points)
+            if colors is not None:
+                set_colors(pointcloud, colors)
+        frame["pointcloud"] = pointcloud
+        frame["bboxes"] = create_boxes(labels, color)
+        return frame
+
+    def _frame(self, frame):
+        return self[frame] if isinstance(frame, int) else frame
+
+    def points_in_boxes(self, frame):
+        """(point, box) index pairs with the point inside the label box
+
+        Args:
+            frame: frame dict or frame index
+
+        Returns:
+            (np.ndarray, np.ndarray): point indexes and box indexes
+        """
+        return pib.points_in_boxes(*self._box_args(frame))
+
+    def point_box_ids(self, frame):
+        """Label box of each point, -1 outside every box"""
+        return pib.point_box_ids(*self._box_args(frame))
+
+    def box_point_counts(self, frame):
+        """Number of points inside each label box"""
+        return pib.box_point_counts(*self._box_args(frame))
+
+    def _box_args(self, frame):
+        """Arguments of the pcdviz.geometry.points_in_boxes functions"""
+        frame = self._frame(frame)
+        xyz = lidar.xyz(frame["points"])
+        labels = frame["labels"]
+        if labels is None:
+            return xyz, [], [], []
+        return xyz, labels["center"], labels["extent"], labels["R"]
+
+    def sparse_labels(self, frame, min_points=1):
+        """Indexes of the label boxes with less than min_points points"""
+        return np.flatnonzero(self.box_point_counts(frame) < min_points)
+
+    def __getitem__(self, index):
+        return self.load(self.keys()[index])
+
+    def __len__(self):
+        return len(self.keys())
+
+    def keys(self):
+        """Keys of all frames in display order"""
+        raise NotImplementedError
+
+    def index(self, key):
+        """Position of the frame key, raise KeyError if it does not exist"""
+        try:
+            return list(self.keys()).index(key)
+        except ValueError:
+            raise KeyError(key)
+
+    def load(self, key):
+        """Read and decode one frame
+
+        Returns:
+            dict: {"pointcloud": ..., "bboxes": [...]} or None to skip it
+        """
+        raise NotImplementedError
+
+    def read_points(self, index):
+        """Points of the frame at index, without filters or geometries"""
+        frame = self[index]
+        return None if frame is None else frame["points"]
+
+    def read_labels(self, index):
+        """Labels of the frame at index, without building the frame"""
+        frame = self[index]
+        return None if frame is None else frame["labels"]
+
+    def read_predictions(self, index):
+        """Predicted boxes of the frame at index, None if there are none"""
+        return None
+
+    def label_files(self, index):
+        """Files read_labels(index) depends on, see LabelIndex"""
+        return []
+
+    def label_index(self, workers=None):
+        """LabelIndex of all frames, updated on first use"""
+        if getattr(self, "_label_index", None) is None:
+            self._label_index = LabelIndex.open(self, workers)
+        return self._label_index
+
+    def query(self, expression):
+        """Frames matching a label query, see pcdviz.dataset.label_index
+
+        Returns:
+            Subset: the matching frames in display order
+        """
+        return Subset(self, self.label_index().select(expression))
+
+    def items(self):
+        for key in self.keys():
+            frame = self.load(key)
+            if frame:
+                yield frame
+
+
+class Subset(BaseDataset):
+    """Frames of a dataset at the given indexes"""
+
+    def __init__(self, dataset, indexes):
+        self.dataset = dataset
+        self.indexes = np.asarray(indexes, dtype=np.int64)
+        self.name = getattr(dataset, "name", None)
+
+    def keys(self):
+        return np.asarray(self.dataset.keys())[self.indexes]
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def __getitem__(self, index):
+        return self.dataset[int(self.indexes[index])]
+
+    def load(self, key):
+        return self.dataset.load(key)
+
+    def read_points(self, index):
+        return self.dataset.read_points(int(self.indexes[index]))
+
+    def read_labels(self, index):
+        return self.dataset.read_labels(int(self.indexes[index]))
+
+    def read_predictions(self, index):
+        return self.dataset.read_predictions(int(self.indexes[index]))
+
+    def label_files(self, index):
+        return self.dataset.label_files(int(self.indexes[index]))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+# Copyright 2023 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+
+import numpy as np
+
+# Buffers held by open3d geometries (PointCloud, LineSet, TriangleMesh)
+_GEOMETRY_BUFFERS = ("points", "colors", "normals", "lines", "vertices",
+                     "triangles")
+# Rough size of a geometry without buffers, e.g. OrientedBoundingBox
+_GEOMETRY_OVERHEAD = 256
+
+
+def frame_nbytes(obj):
+    """Estimate the memory held by a decoded frame
+
+    Counts numpy arrays and the point/line buffers of open3d geometries,
+    recursing into dicts and lists.
+    """
+    if obj is None:
+        return 0
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, dict):
+        return sum(frame_nbytes(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(frame_nbytes(v) for v in obj)
+    if isinstance(obj, (str, bytes, int, float)):
+        return 0
+
+    nbytes = _GEOMETRY_OVERHEAD
+    # o3d.t.geometry attributes, e.g. positions, colors, intensity
+    attributes = getattr(obj, "point", None)
+    if attributes is not None:
+        return nbytes + sum(tensor.numpy().nbytes
+                            for _, tensor in attributes.items())
+    for name in _GEOMETRY_BUFFERS:
+        buffer = getattr(obj, name, None)
+        if buffer is not None and not callable(buffer):
+            nbytes += np.asarray(buffer).nbytes
+    return nbytes
+
+
+class FrameCache:
+    """LRU cache of decoded frames bounded by their size in bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self.nbytes = 0
+        # {key: (frame, nbytes)}, least recently used first
+        self._frames = OrderedDict()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __contains__(self, key):
+        return key in self._frames
+
+    def get(self, key):
+        item = self._frames.get(key)
+        if item is None:
+            return None
+        self._frames.move_to_end(key)
+        return item[0]
+
+    def put(self, key, frame):
+        self.pop(key)
+        nbytes = frame_nbytes(frame)
+        # Never evict everything for a single frame over budget
+        if nbytes > self.max_bytes:
+            return
+        self._frames[key] = (frame, nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes:
+            _, (_, size) = self._frames.popitem(last=False)
+            self.nbytes -= size
+
+    def update(self, key):
+        """Size again a cached frame changed in place, e.g. given a LOD
+        cloud. It becomes the most recently used frame.
+        """
+        frame = self.pop(key)
+        if frame is not None:
+            self.put(key, frame)
+
+    def pop(self, key):
+        item = self._frames.pop(key, None)
+        if item is None:
+            return None
+        self.nbytes -= item[1]
+        return item[0]
+
+    def clear(self):
+        self._frames.clear()
+        self.nbytes = 0
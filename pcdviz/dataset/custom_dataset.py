@@ -14,16 +14,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import logging
-from pathlib import Path
-
 import numpy as np
-import open3d as o3d
-from PIL import Image
 
+from pcdviz.config.callback import Callback
 from pcdviz.dataset.base_dataset import BaseDataset
-from pcdviz.util import COLOR_MAP
-from skimage.draw import rectangle_perimeter, polygon, set_color
+from pcdviz.dataset.manifest import Manifest
+from pcdviz.geometry.box import create_boxes
+from pcdviz.geometry.colormap import ColorMap
+from pcdviz.geometry.pointcloud import (create_pointcloud, positions, select,
+                                        set_colors)
+from pcdviz.io import lidar
+from pcdviz.io.label import read_table
+from pcdviz.registry import READERS
+from pcdviz.util import COLOR_MAP, euler_to_rotation_matrices
 
 def _fill_color(pointcloud, color):
     color = COLOR_MAP.get(color)
@@ -32,24 +35,118 @@ def _fill_color(pointcloud, color):
 
 
 class CustomDataset(BaseDataset):
-    def __init__(self) -> None:
-        pass
+    """
+      Frame files share the file name in each directory
+
+      custom
+      ├── velodyne/000005.bin
+      ├── label/000005.txt
+      └── prediction/000005.txt
+    """
+
+    def __init__(self, dataset_path=None, fields=None, callback=None,
+                 cache_version=None, **kwargs) -> None:
+        self.name = 'custom'
+        self.dataset_path = dataset_path
+        self.fields = fields
+        # reads the label and prediction files instead of read_label
+        self.label_callback = Callback(
+            callback, name="dataset callback",
+            version=cache_version) if callback else None
+        self.manifest = None
+        if dataset_path:
+            self.manifest = Manifest.open(dataset_path, {
+                "velodyne": ("velodyne", ".bin"),
+                "label": ("label", ".txt"),
+                "prediction": ("prediction", ".txt")}, primary="velodyne")
+            assert len(self.manifest) != 0, "File not found in {}".format(
+                self.dataset_path)
+
+    def keys(self):
+        return self.manifest.ids
+
+    def index(self, file_name):
+        return self.manifest.index(file_name)
+
+    def __getitem__(self, index):
+        return self._load_index(index)
+
+    def load(self, file_name):
+        return self._load_index(self.manifest.index(file_name))
+
+    def _load_index(self, index):
+        predictions = self.read_predictions(index)
+        frame = self.make_frame(self.read_points(index),
+                                self.read_labels(index), COLOR_MAP["red"])
+        if self.filters is not None and predictions is not None:
+            predictions = self.filters.apply_labels(predictions)
+        frame["predictions"] = predictions
+        frame["bboxes"] += create_boxes(predictions, COLOR_MAP["blue"])
+        return frame
+
+    def read_points(self, index):
+        return self.read_lidar(self.manifest.path("velodyne", index),
+                               self.fields)
+
+    def read_labels(self, index):
+        return self._read_boxes(self.manifest.path("label", index))
+
+    def read_predictions(self, index):
+        return self._read_boxes(self.manifest.path("prediction", index))
+
+    def label_files(self, index):
+        return [self.manifest.path("label", index)]
+
+    def _read_boxes(self, label_file):
+        if not label_file:
+            return None
+        if self.label_callback is not None:
+            return self.label_callback(label_file)
+        return CustomDataset.read_label(label_file, None)
 
     @staticmethod
     def create_pointcloud(lidar_file, file_type, fields=None, color=None,
-                          transform=None):
-        if file_type == "bin":
-            points = CustomDataset.read_lidar(lidar_file, fields)
-            pointcloud = o3d.geometry.PointCloud()
-            pointcloud.points = o3d.utility.Vector3dVector(points[:, :3])
+                          transform=None, filters=None, tensor=False):
+        """Point cloud of a lidar file, see create_pointcloud for tensor
+
+        color is a name of COLOR_MAP or a field to color the points by,
+        see ColorMap.from_config. Files read by open3d only have x, y, z,
+        "height" and "range".
+        """
+        points = None
+        reader = READERS.get(file_type) if file_type in READERS else None
+        if reader is not None:
+            points = reader(lidar_file, fields)
+            if filters is not None:
+                points = filters.apply_points(points)
+            pointcloud = create_pointcloud(points, tensor)
         else:
-            pointcloud = o3d.io.read_point_cloud(lidar_file)
-
-        _fill_color(pointcloud, color)
+            import open3d as o3d
+
+            # other formats, e.g. pcd and ply, are read by open3d
+            if tensor:
+                pointcloud = o3d.t.io.read_point_cloud(lidar_file)
+            else:
+                pointcloud = o3d.io.read_point_cloud(lidar_file)
+            if filters is not None:
+                mask = filters.point_mask(positions(pointcloud))
+                pointcloud = select(pointcloud, np.flatnonzero(mask))
+
+        colormap = ColorMap.from_config(color)
+        if colormap is None:
+            _fill_color(pointcloud, color)
+            return pointcloud
+        colors = colormap(positions(pointcloud) if points is None else points)
+        if colors is not None:
+            set_colors(pointcloud, colors)
         return pointcloud
 
     @staticmethod
     def create_image(image_file, labels=None):
+        import open3d as o3d
+        from PIL import Image
+        from skimage.draw import rectangle_perimeter, set_color
+
         img = Image.open(image_file)
         data = np.asarray(img, dtype=np.uint8)
         if labels:
@@ -62,48 +159,43 @@ class CustomDataset(BaseDataset):
 
     @staticmethod
     def create_oriented_bounding_box(label_file, format, color=None,
-                                     transform=None, scale=None):
-        objs = CustomDataset.read_label(label_file, format)
-
-        color = COLOR_MAP.get(color)
-        bboxes = []
-        for obj in objs:
-            bbox = o3d.geometry.OrientedBoundingBox(
-                obj["center"], obj["R"], obj["extent"])
-
-            if color:
-                bbox.color = color
-            bboxes.append(bbox)
-        return bboxes
+                                     transform=None, scale=None,
+                                     filters=None, callback=None, **inputs):
+        """Boxes of a label file, read by callback with inputs if set"""
+        if callback is not None:
+            labels = callback(label_file, **inputs)
+        else:
+            labels = CustomDataset.read_label(label_file, format)
+        if filters is not None:
+            labels = filters.apply_labels(labels)
+        return create_boxes(labels, COLOR_MAP.get(color))
 
     @staticmethod
     def read_lidar(file_path, fields=None):
-        if not Path(file_path).exists():
-            logging.error("File not exist! {}".format(file_path))
-            return None
-        # Todo(zero): need complete fields
-        dim = int(fields) if fields else 4
-        return np.fromfile(file_path, dtype=np.float32).reshape(-1, dim)
+        return lidar.read_bin(file_path, fields)
 
     @staticmethod
     def read_label(file_path, format):
-        labels = np.loadtxt(file_path, delimiter=' ', dtype=str)
-        objs = []
-        for label in labels:
-            # x, y, z
-            center = np.array(
-                [label[1], label[2], label[3]], dtype=np.float32)
-
-            # R
-            # R = np.array([label[4], label[5], label[6]], dtype=np.float32)
-            R = np.eye(3, 3)
-
-            # length, width, height
-            size = np.array([label[7], label[8], label[9]], dtype=np.float32)
-
-            objs.append({
-                "type": label[0],
-                "center": center,
+        """Read all objects of a label file as arrays
+
+        Each line is "type x y z roll pitch yaw length width height" with an
+        optional score at the end.
+
+        Returns:
+            dict: "type" (N,), "center" (N, 3), "rotation" (N, 3) as
+                (roll, pitch, yaw), "R" (N, 3, 3), "extent" (N, 3) and
+                "score" (N,), NaN if missing
+        """
+        types, values = read_table(file_path, min_columns=11)
+        if types is None:
+            return None
+
+        rotation = values[:, 3:6]
+        R = euler_to_rotation_matrices(
+            rotation[:, 0], rotation[:, 1], rotation[:, 2])
+        return {"type": types,
+                "center": values[:, 0:3],
+                "rotation": rotation,
                 "R": R,
-                "extent": size})
-        return objs
+                "extent": values[:, 6:9],
+                "score": values[:, 9]}
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+# Copyright 2023 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+
+from pcdviz.filter.pipeline import FilterPipeline
+from pcdviz.geometry.colormap import ColorMap
+from pcdviz.registry import DATASETS
+
+
+def create_dataset(config):
+    """Dataset of the "dataset" block of a config, with its filters
+
+    The class is looked up by name in `pcdviz.registry.DATASETS` and gets
+    the path and the other keys of the block, e.g. version or fields.
+
+    Returns:
+        BaseDataset: None if the dataset name is unknown
+    """
+    dataset_conf = config.dataset
+    dataset_name = dataset_conf.get("name")
+    dataset_cls = DATASETS.get(dataset_name)
+    if dataset_cls is None:
+        logging.error("Unknown dataset! {}, choose from {}".format(
+            dataset_name, ", ".join(DATASETS.names())))
+        return None
+    options = {key: value for key, value in dataset_conf.items()
+               if key not in ("name", "path")}
+    dataset = dataset_cls(dataset_conf.get("path"), **options)
+
+    dataset.filters = FilterPipeline.from_config(config.filters)
+    dataset.color_mode = dataset_conf.get("color")
+    dataset.colormap = ColorMap.from_config(dataset.color_mode)
+    dataset.tensor = bool(dataset_conf.get("tensor"))
+    return dataset
@@ -14,16 +14,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import glob
+import functools
 import logging
-import math
-import os
 from pathlib import Path
 
 import numpy as np
-import open3d as o3d
+from pcdviz import profiler
 from pcdviz.dataset.base_dataset import BaseDataset
-from pcdviz.util import euler_to_rotation_matrix
+from pcdviz.dataset.manifest import Manifest
+from pcdviz.geometry.box import create_boxes
+from pcdviz.geometry.pointcloud import create_pointcloud
+from pcdviz.io import lidar
+from pcdviz.io.label import encode_types, read_table
+from pcdviz.proj.img import CameraProjection
+from pcdviz.util import yaw_to_rotation_matrices
 
 
 class KITTI(BaseDataset):
@@ -39,116 +43,150 @@ class KITTI(BaseDataset):
       DontCare = 9
     """
 
+    TYPE_IDS = {"Car": 1, "Van": 2, "Truck": 3, "Pedestrian": 4,
+                "Person_sitting": 5, "Cyclist": 6, "Tram": 7, "Misc": 8,
+                "DontCare": 9}
+
     def __init__(self, dataset_path, **kwargs):
         self.name = 'KITTI'
         self.dataset_path = dataset_path
-        self.file_names = self.get_sorted_file_names()
+        self.manifest = Manifest.open(dataset_path, {
+            "velodyne": ("velodyne", ".bin"),
+            "calib": ("calib", ".txt"),
+            "label": ("label_2", ".txt"),
+            "image": ("image_2", ".png")}, primary="velodyne")
+        self.file_names = self.manifest.ids
 
         assert len(self.file_names) != 0, "File not found in {}".format(
             self.dataset_path)
 
     def get_sorted_file_names(self):
-        velodyne_path = os.path.join(self.dataset_path, "velodyne/")
-        file_names = []
-        for velodyne_file in glob.glob("{}*.bin".format(velodyne_path)):
-            file_name = Path(velodyne_file).stem
-            file_names.append(file_name)
-        file_names.sort()
-        return file_names
-
-    def __getitem__(self):
-        pass
-
-    def __len__(self):
-        return len(self.file_names)
-
-    def items(self):
-        for file_name in self.file_names:
-            # create PointCloud
-            velodyne_file = os.path.join(
-                self.dataset_path, "velodyne/{}.bin".format(file_name))
-            pointcloud = self.create_pointcloud(velodyne_file)
-
-            # create OrientedBoundingBox
-            calib_file = velodyne_file.replace(
-                'velodyne', 'calib').replace('.bin', '.txt')
-            label_file = calib_file.replace('calib', 'label_2')
-            bboxes = self.create_oriented_bounding_box(label_file, calib_file)
-
-            yield {"pointcloud": pointcloud,
-                   "bboxes": bboxes}
+        return list(self.manifest.ids)
+
+    def keys(self):
+        return self.file_names
+
+    def index(self, file_name):
+        return self.manifest.index(file_name)
+
+    def __getitem__(self, index):
+        return self._load_index(index)
+
+    def load(self, file_name):
+        return self._load_index(self.manifest.index(file_name))
+
+    def _load_index(self, index):
+        return self.make_frame(self.read_points(index),
+                               self.read_labels(index))
+
+    def read_points(self, index):
+        return self.read_velodyne(self.manifest.path("velodyne", index))
+
+    def read_labels(self, index):
+        # the testing split has no labels
+        calib_file, label_file = self.label_files(index)
+        if not (calib_file and label_file):
+            return None
+        return self.read_boxes(label_file, calib_file)
+
+    def label_files(self, index):
+        return [self.manifest.path("calib", index),
+                self.manifest.path("label", index)]
 
     @staticmethod
     def create_pointcloud(velodyne_file):
         points = KITTI.read_velodyne(velodyne_file)
-        pcd = o3d.geometry.PointCloud()
-        pcd.points = o3d.utility.Vector3dVector(points[:, :3])
-        return pcd
+        return create_pointcloud(points)
 
     @staticmethod
     def create_oriented_bounding_box(label_file, calib_file):
-        # read calib
-        calib = KITTI.read_calib(calib_file)
+        # all objects of the frame in one geometry
+        return create_boxes(KITTI.read_boxes(label_file, calib_file))
 
-        # create OrientedBoundingBox
+    @staticmethod
+    def read_boxes(label_file, calib_file):
+        """Boxes of a label file in velodyne coordinates, without DontCare"""
+        calib = KITTI.read_calib(calib_file)
         objs = KITTI.read_label(label_file, calib)
-        bboxes = []
-        for obj in objs:
-            if obj["type"] != "DontCare":
-                bbox = o3d.geometry.OrientedBoundingBox(
-                    obj["location"], obj["rotation_mat"], obj["dimensions"])
-                # todo(zero): add color
-                # bbox.color
-                bboxes.append(bbox)
-        return bboxes
+        mask = objs["type"] != "DontCare"
+        return {"type": objs["type"][mask],
+                "center": objs["location"][mask],
+                "extent": objs["dimensions"][mask],
+                "R": objs["rotation_mat"][mask],
+                "score": objs["score"][mask]}
+
+    def render_camera(self, index, color_by="depth", camera=2):
+        """Camera image of the frame at index with its points and boxes
+
+        Returns:
+            np.ndarray: (H, W, 3) uint8, None if the image or calib is
+                missing
+        """
+        image_file = self.manifest.path("image", index)
+        calib_file, label_file = self.label_files(index)
+        if not (image_file and calib_file):
+            return None
+        image = self.read_image(image_file)
+        projection = CameraProjection.from_kitti(
+            self.read_calib(calib_file), image.shape, camera)
+        points, labels = self.apply_filters(self.read_points(index),
+                                            self.read_labels(index))
+        return projection.render(image, points, labels, color_by=color_by)
 
     @staticmethod
     def read_image(file_path):
-        pass
-
-    @staticmethod
-    def read_velodyne(file_path):
+        """Read a camera image as (H, W, 3) uint8, None if missing"""
         if not Path(file_path).exists():
             logging.error("File not exist! {}".format(file_path))
             return None
-        return np.fromfile(file_path, dtype=np.float32).reshape(-1, 4)
+        from PIL import Image
+
+        with Image.open(file_path) as image:
+            return np.asarray(image.convert("RGB"))
+
+    @staticmethod
+    def read_velodyne(file_path, fields="kitti"):
+        return lidar.read_bin(file_path, fields)
 
     @staticmethod
     def read_label(file_path, calib):
-        labels = np.loadtxt(file_path, delimiter=' ', dtype=str, ndmin=2)
-        objs = []
-        for label in labels:
-            # KITTI image coordinates
-            image_bbox = np.array(
-                [label[4], label[5], label[6], label[7]], dtype=np.float32)
-            # x,y,z in KITTI camera coordinates
-            camera_center = np.array(
-                [label[11], label[12], label[13], 1.0], dtype=np.float32)
-
-            # KITTI order is (height, width, length)
-            size = np.array([label[10], label[9], label[8]], dtype=np.float32)
-
-            # KITTI camera to velodyne coordinates
-            velo_to_cam = np.transpose(
-                calib['rect_4x4'] @ calib['Tr_velo_to_cam'])
-            points = camera_center @ np.linalg.inv(velo_to_cam)
-            velodyne_center = [points[0], points[1], points[2] + (size[2] / 2)]
-
-            # KITTI rotation_y to velodyne mat
-            yaw = np.pi/2 - float(label[14])
-            rotation_mat = euler_to_rotation_matrix(0, 0, yaw)
-
-            objs.append({
-                "type": label[0],
-                "truncated": float(label[1]),
-                "occluded": int(label[2]),
-                "alpha": float(label[3]),
-                "bbox": image_bbox,
+        """Read all objects of a label file as arrays
+
+        Returns:
+            dict: columns of N objects, "type" (N,), "type_id" (N,),
+                "truncated", "occluded", "alpha", "bbox" (N, 4),
+                "dimensions" (N, 3) as (length, width, height), "location"
+                (N, 3) and "rotation_mat" (N, 3, 3) in velodyne coordinates,
+                "yaw" (N,) and "score" (N,), NaN for ground truth
+        """
+        types, values = read_table(file_path, min_columns=16)
+        if types is None:
+            return None
+
+        # KITTI order is (height, width, length)
+        size = values[:, [9, 8, 7]]
+
+        # x,y,z in KITTI camera coordinates to velodyne coordinates
+        camera_center = np.ones((len(values), 4), dtype=np.float32)
+        camera_center[:, :3] = values[:, 10:13]
+        location = (camera_center @ calib['cam_to_velo'].T)[:, :3]
+        location[:, 2] += size[:, 2] / 2
+
+        # KITTI rotation_y to velodyne mat
+        yaw = np.pi/2 - values[:, 13]
+        rotation_mat = yaw_to_rotation_matrices(yaw)
+
+        return {"type": types,
+                "type_id": encode_types(types, KITTI.TYPE_IDS),
+                "truncated": values[:, 0],
+                "occluded": values[:, 1].astype(np.int32),
+                "alpha": values[:, 2],
+                "bbox": values[:, 3:7],
                 "dimensions": size,
-                "location": velodyne_center,
+                "location": location,
+                "yaw": yaw,
                 "rotation_mat": rotation_mat,
-                "score": None})
-        return objs
+                "score": values[:, 14]}
 
     @staticmethod
     def _extend_matrix(mat):
@@ -158,12 +196,24 @@ class KITTI(BaseDataset):
 
     @staticmethod
     def read_calib(file_path):
+        """Read a calib file, files with the same content share the result
+
+        The returned matrices are read-only since they are shared.
+        """
         if not Path(file_path).exists():
             logging.error("File not exist! {}".format(file_path))
             return None
 
-        with open(file_path, 'r') as f:
-            lines = f.readlines()
+        with profiler.span("read_calib") as span:
+            with open(file_path, 'rb') as f:
+                content = f.read()
+            span.set(bytes=len(content))
+            return KITTI._parse_calib(content)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=128)
+    def _parse_calib(content):
+        lines = content.decode('utf-8').splitlines()
 
         obj = lines[0].strip().split(' ')[1:]
         P0 = np.array(obj, dtype=np.float32).reshape(3, 4)
@@ -195,10 +245,19 @@ class KITTI(BaseDataset):
         Tr_imu_to_velo = np.eye(4, dtype=np.float32)
         Tr_imu_to_velo[:3] = np.array(obj, dtype=np.float32).reshape(3, 4)
 
-        return {"P0": P0,
-                "P1": P1,
-                "P2": P2,
-                "P3": P3,
-                "rect_4x4": rect_4x4,
-                "Tr_velo_to_cam": Tr_velo_to_cam,
-                "Tr_imu_to_velo": Tr_imu_to_velo}
+        # velodyne to rectified camera coordinates and back
+        velo_to_cam = rect_4x4 @ Tr_velo_to_cam
+        cam_to_velo = np.linalg.inv(velo_to_cam)
+
+        calib = {"P0": P0,
+                 "P1": P1,
+                 "P2": P2,
+                 "P3": P3,
+                 "rect_4x4": rect_4x4,
+                 "Tr_velo_to_cam": Tr_velo_to_cam,
+                 "Tr_imu_to_velo": Tr_imu_to_velo,
+                 "velo_to_cam": velo_to_cam,
+                 "cam_to_velo": cam_to_velo}
+        for mat in calib.values():
+            mat.flags.writeable = False
+        return calib
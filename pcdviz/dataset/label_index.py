@@ -0,0 +1,412 @@
+#!/usr/bin/env python
+
+# Copyright 2023 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+  Columnar index of the labels of all frames of a dataset.
+
+  One row per box with the frame, type and the box columns below, frame i
+  owns rows offsets[i]:offsets[i + 1]. The index is cached on disk and
+  only the frames whose label files changed are read again.
+
+  Queries are python expressions over the frames, e.g.
+
+    Pedestrian > 3
+    Car >= 5 and count(Car and distance < 20) == 0
+    max(score) < 0.5 or not boxes
+
+  - a type name is the number of boxes of that type, nuScenes categories
+    also match their sub-categories, e.g. human.pedestrian
+  - boxes is the number of boxes
+  - count(cond), sum(expr), mean(expr), min(expr), max(expr) aggregate
+    the boxes of each frame, an optional second argument selects the
+    boxes, e.g. max(distance, Car). Inside them the names are the box
+    COLUMNS, type (compare it with a string) and type names, true for the
+    boxes of that type.
+"""
+
+import ast
+import hashlib
+import logging
+import multiprocessing
+import os
+
+import numpy as np
+
+from pcdviz.util import expand_ranges, get_cache_dir
+
+COLUMNS = ("x", "y", "z", "length", "width", "height", "yaw", "distance",
+           "score")
+
+# Frames read by one task of the process pool
+CHUNK_SIZE = 256
+
+# Dataset of a pool worker, set by _init_reader
+_reader = {}
+
+_COMPARE = {ast.Gt: np.greater, ast.GtE: np.greater_equal,
+            ast.Lt: np.less, ast.LtE: np.less_equal,
+            ast.Eq: np.equal, ast.NotEq: np.not_equal}
+
+_BINARY = {ast.Add: np.add, ast.Sub: np.subtract,
+           ast.Mult: np.multiply, ast.Div: np.true_divide}
+
+
+def _box_columns(labels):
+    """Index columns of a labels dict, see BaseDataset"""
+    center = np.asarray(labels["center"], dtype=np.float32).reshape(-1, 3)
+    extent = np.asarray(labels["extent"], dtype=np.float32).reshape(-1, 3)
+    n = len(center)
+    R = np.asarray(labels["R"], dtype=np.float32).reshape(-1, 3, 3)
+    score = labels.get("score")
+    return {"x": center[:, 0], "y": center[:, 1], "z": center[:, 2],
+            "length": extent[:, 0], "width": extent[:, 1],
+            "height": extent[:, 2],
+            "yaw": np.arctan2(R[:, 1, 0], R[:, 0, 0]),
+            "distance": np.hypot(center[:, 0], center[:, 1]),
+            "score": np.full(n, np.nan, dtype=np.float32) if score is None
+            else np.asarray(score, dtype=np.float32).reshape(n)}
+
+
+def _init_reader(dataset):
+    _reader["dataset"] = dataset
+
+
+def _read_chunk(indexes):
+    return [_reader["dataset"].read_labels(int(i)) for i in indexes]
+
+
+def read_labels(dataset, indexes, workers=None):
+    """Labels of the frames at indexes, read by a process pool when there
+    are many of them"""
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(indexes) < 2 * CHUNK_SIZE:
+        return [dataset.read_labels(int(i)) for i in indexes]
+    chunks = [indexes[i:i + CHUNK_SIZE]
+              for i in range(0, len(indexes), CHUNK_SIZE)]
+    with multiprocessing.Pool(workers, _init_reader, (dataset,)) as pool:
+        results = pool.map(_read_chunk, chunks)
+    return [labels for chunk in results for labels in chunk]
+
+
+class LabelIndex:
+    """Label columns of all frames of a dataset
+
+    The dataset gives the labels of a frame with read_labels(index) and the
+    files they come from with label_files(index), a frame is read again
+    when the size or mtime of one of its files changes. Many changed frames
+    are read by a pool of workers processes, the number of CPUs if None.
+    """
+
+    VERSION = 2
+
+    def __init__(self, dataset, workers=None):
+        self.dataset = dataset
+        self.workers = workers
+        self.keys = np.array([], dtype=str)
+        self.stamps = np.array([], dtype=np.int64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.type_names = np.array([], dtype=str)
+        self.types = np.array([], dtype=np.int16)
+        self.columns = {name: np.array([], dtype=np.float32)
+                        for name in COLUMNS}
+
+    @classmethod
+    def open(cls, dataset, workers=None):
+        index = cls(dataset, workers)
+        index.refresh()
+        return index
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def num_boxes(self):
+        return np.diff(self.offsets)
+
+    @property
+    def box_frames(self):
+        """Frame of each box"""
+        return np.repeat(np.arange(len(self)), self.num_boxes)
+
+    @property
+    def cache_file(self):
+        key = "{}|{}|{}|{}".format(
+            type(self.dataset).__name__,
+            os.path.abspath(getattr(self.dataset, "dataset_path", "") or ""),
+            getattr(self.dataset, "version", ""), self.VERSION)
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(get_cache_dir("labels"), digest + ".npz")
+
+    def _stamps(self, num_frames):
+        stats = {}
+
+        def stat(path):
+            if path not in stats:
+                try:
+                    st = os.stat(path)
+                    stats[path] = (st.st_size, st.st_mtime_ns)
+                except (OSError, TypeError):
+                    stats[path] = (-1, -1)
+            return stats[path]
+
+        return np.array(
+            [hash(tuple(stat(path) for path in self.dataset.label_files(i)))
+             for i in range(num_frames)], dtype=np.int64)
+
+    def refresh(self):
+        """Load the cached index and read the frames that changed"""
+        self._load_cache()
+        keys = np.asarray(self.dataset.keys()).astype(str)
+        stamps = self._stamps(len(keys))
+
+        # frames of the cached index with the same key and stamp
+        old_keys, old_offsets = self.keys, self.offsets
+        reuse = np.zeros(len(keys), dtype=bool)
+        pos = np.zeros(len(keys), dtype=np.int64)
+        if len(old_keys):
+            order = np.argsort(old_keys, kind='stable')
+            found = np.minimum(np.searchsorted(old_keys, keys, sorter=order),
+                               len(old_keys) - 1)
+            pos = order[found]
+            reuse = (old_keys[pos] == keys) & (self.stamps[pos] == stamps)
+        if reuse.all() and len(keys) == len(old_keys):
+            return
+
+        fresh = np.flatnonzero(~reuse)
+        logging.info("Index labels of {} frames".format(len(fresh)))
+        fresh_labels = read_labels(self.dataset, fresh, self.workers)
+
+        counts = np.zeros(len(keys), dtype=np.int64)
+        counts[reuse] = np.diff(old_offsets)[pos[reuse]]
+        counts[fresh] = [0 if labels is None else len(labels["type"])
+                         for labels in fresh_labels]
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        # rows of the reused frames are copied at once
+        src = expand_ranges(old_offsets[:-1][pos[reuse]], counts[reuse])
+        dst = expand_ranges(offsets[:-1][reuse], counts[reuse])
+        type_names = list(self.type_names)
+        types = np.zeros(offsets[-1], dtype=np.int16)
+        types[dst] = self.types[src]
+        columns = {}
+        for name in COLUMNS:
+            columns[name] = np.zeros(offsets[-1], dtype=np.float32)
+            columns[name][dst] = self.columns[name][src]
+
+        for i, labels in zip(fresh, fresh_labels):
+            if not counts[i]:
+                continue
+            rows = slice(offsets[i], offsets[i + 1])
+            names, inverse = np.unique(np.asarray(labels["type"], dtype=str),
+                                       return_inverse=True)
+            for name in names:
+                if name not in type_names:
+                    type_names.append(name)
+            codes = np.array([type_names.index(name) for name in names],
+                             dtype=np.int16)
+            types[rows] = codes[inverse.reshape(-1)]
+            for name, values in _box_columns(labels).items():
+                columns[name][rows] = values
+
+        self.keys, self.stamps, self.offsets = keys, stamps, offsets
+        self.type_names = np.array(type_names, dtype=str)
+        self.types, self.columns = types, columns
+        self._save_cache()
+
+    def _load_cache(self):
+        cache_file = self.cache_file
+        if not os.path.exists(cache_file):
+            return
+        try:
+            with np.load(cache_file) as data:
+                self.keys = data["keys"]
+                self.stamps = data["stamps"]
+                self.offsets = data["offsets"]
+                self.type_names = data["type_names"]
+                self.types = data["types"]
+                self.columns = {name: data[name] for name in COLUMNS}
+        except Exception as e:
+            logging.warning("Ignore broken label index {}! {}".format(
+                cache_file, e))
+            self.__init__(self.dataset, self.workers)
+
+    def _save_cache(self):
+        cache_file = self.cache_file
+        tmp_file = cache_file + ".tmp.npz"
+        try:
+            np.savez(tmp_file, keys=self.keys, stamps=self.stamps,
+                     offsets=self.offsets, type_names=self.type_names,
+                     types=self.types, **self.columns)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            logging.warning("Save label index failed! {}".format(e))
+
+    def type_counts(self):
+        """{type name: (num_frames,) number of boxes of the type}"""
+        counts = np.zeros((len(self.type_names), len(self)), dtype=np.int64)
+        np.add.at(counts, (self.types, self.box_frames), 1)
+        return dict(zip(self.type_names, counts))
+
+    def select(self, expression):
+        """Indexes of the frames matching a query, see the module doc"""
+        return np.flatnonzero(_Query(self, expression).evaluate())
+
+    def query(self, expression):
+        """Keys of the frames matching a query"""
+        return self.keys[self.select(expression)]
+
+
+class _Query:
+    def __init__(self, index, expression):
+        self.index = index
+        self.expression = expression
+        try:
+            self.tree = ast.parse(expression.strip(), mode='eval').body
+        except SyntaxError as e:
+            raise ValueError("Bad query {!r}! {}".format(expression, e))
+        self._box_frames = None
+
+    def error(self, message):
+        return ValueError("Bad query {!r}! {}".format(
+            self.expression, message))
+
+    def evaluate(self):
+        result = np.broadcast_to(self.eval(self.tree, False), len(self.index))
+        return result.astype(bool)
+
+    @property
+    def box_frames(self):
+        if self._box_frames is None:
+            self._box_frames = self.index.box_frames
+        return self._box_frames
+
+    def type_codes(self, name):
+        names = self.index.type_names
+        codes = [i for i, type_name in enumerate(names)
+                 if type_name == name or type_name.startswith(name + ".")]
+        if not codes:
+            raise self.error("Unknown name {}, types are {}".format(
+                name, ", ".join(names)))
+        return codes
+
+    def name(self, node):
+        if isinstance(node, ast.Name):
+            return node.id
+        if isinstance(node, ast.Attribute):
+            return "{}.{}".format(self.name(node.value), node.attr)
+        raise self.error("Unsupported {}".format(ast.dump(node)))
+
+    def eval(self, node, boxes):
+        """Value of node per frame, or per box inside an aggregate"""
+        if isinstance(node, ast.Constant):
+            return node.value
+        if isinstance(node, ast.BoolOp):
+            values = [self.eval(value, boxes) for value in node.values]
+            if isinstance(node.op, ast.And):
+                return np.logical_and.reduce(values)
+            return np.logical_or.reduce(values)
+        if isinstance(node, ast.UnaryOp):
+            value = self.eval(node.operand, boxes)
+            if isinstance(node.op, ast.Not):
+                return np.logical_not(value)
+            if isinstance(node.op, ast.USub):
+                return np.negative(value)
+            return value
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+            return _BINARY[type(node.op)](self.eval(node.left, boxes),
+                                          self.eval(node.right, boxes))
+        if isinstance(node, ast.Compare):
+            return self.compare(node, boxes)
+        if isinstance(node, ast.Call):
+            if boxes:
+                raise self.error("Nested {}".format(self.name(node.func)))
+            return self.aggregate(node)
+        if isinstance(node, (ast.Name, ast.Attribute)):
+            name = self.name(node)
+            if boxes:
+                if name in self.index.columns:
+                    return self.index.columns[name]
+                if name == "type":
+                    return self.index.types
+                return np.isin(self.index.types, self.type_codes(name))
+            if name == "boxes":
+                return self.index.num_boxes
+            mask = np.isin(self.index.types, self.type_codes(name))
+            return np.bincount(self.box_frames[mask],
+                               minlength=len(self.index))
+        raise self.error("Unsupported {}".format(ast.dump(node)))
+
+    def compare(self, node, boxes):
+        operands = [node.left] + node.comparators
+        values = [self.operand(operand, operands, boxes)
+                  for operand in operands]
+        result = True
+        for op, left, right in zip(node.ops, values, values[1:]):
+            if type(op) not in _COMPARE:
+                raise self.error("Unsupported {}".format(type(op).__name__))
+            result = np.logical_and(result, _COMPARE[type(op)](left, right))
+        return result
+
+    def operand(self, node, operands, boxes):
+        # type == "Car" compares the type codes
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            if not any(isinstance(other, ast.Name) and other.id == "type"
+                       for other in operands):
+                raise self.error("Strings only compare with type")
+            names = list(self.index.type_names)
+            return names.index(node.value) if node.value in names else -1
+        return self.eval(node, boxes)
+
+    def aggregate(self, node):
+        func = self.name(node.func)
+        num_frames = len(self.index)
+        if (func not in ("count", "sum", "mean", "min", "max") or
+                len(node.args) > (1 if func == "count" else 2)):
+            raise self.error("Unknown function {}".format(func))
+
+        num_boxes = len(self.index.types)
+        values = np.ones(num_boxes)
+        mask = np.ones(num_boxes, dtype=bool)
+        if func == "count" and node.args:
+            mask = np.broadcast_to(self.eval(node.args[0], True), num_boxes)
+        elif node.args:
+            values = np.broadcast_to(
+                self.eval(node.args[0], True), num_boxes).astype(np.float64)
+            if len(node.args) > 1:
+                mask = np.broadcast_to(self.eval(node.args[1], True),
+                                       num_boxes)
+        mask = mask.astype(bool)
+
+        frames = self.box_frames[mask]
+        if func == "count":
+            return np.bincount(frames, minlength=num_frames)
+        values = values[mask]
+        if func in ("sum", "mean"):
+            total = np.bincount(frames, values, minlength=num_frames)
+            if func == "sum":
+                return total
+            count = np.bincount(frames, minlength=num_frames)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return total / count
+
+        # boxes are sorted by frame, reduce each run of a frame
+        result = np.full(num_frames, np.nan)
+        if len(frames):
+            starts = np.flatnonzero(np.r_[True, frames[1:] != frames[:-1]])
+            ufunc = np.fmin if func == "min" else np.fmax
+            result[frames[starts]] = ufunc.reduceat(values, starts)
+        return result
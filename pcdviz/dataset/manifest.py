@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+# Copyright 2023 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import logging
+import os
+
+import numpy as np
+
+from pcdviz.util import get_cache_dir
+
+
+def _scan_dir(path, suffix):
+    """Return the sorted stems and sizes of the files ending with suffix"""
+    names, sizes = [], []
+    if not os.path.isdir(path):
+        return np.array(names, dtype=str), np.array(sizes, dtype=np.int64)
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.name.endswith(suffix) and entry.is_file():
+                names.append(entry.name[:len(entry.name) - len(suffix)])
+                sizes.append(entry.stat().st_size)
+    names = np.array(names, dtype=str)
+    sizes = np.array(sizes, dtype=np.int64)
+    order = np.argsort(names, kind='stable')
+    return names[order], sizes[order]
+
+
+def _dir_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return -1
+
+
+class Manifest:
+    """Frame id -> file of each component of a dataset, with sizes
+
+    Each component is a directory of files named after the frame id, e.g.
+    KITTI "velodyne/000003.bin" and "label_2/000003.txt". Frames are the
+    ids of the primary component. The listing is cached on disk and a
+    directory is only scanned again when its mtime changes.
+
+    Adding, removing or renaming a file changes the mtime of its
+    directory, rewriting a file in place does not. The sizes of rewritten
+    files are stale until the directory changes, so they are only a hint,
+    e.g. LabelIndex stamps the label files itself.
+
+    Args:
+        root (str): dataset directory
+        components (dict): {name: (subdir, suffix)}
+        primary (str): component that defines the frames
+    """
+
+    VERSION = 1
+
+    def __init__(self, root, components, primary):
+        self.root = root
+        self.components = components
+        self.primary = primary
+        # {name: (ids, sizes, mtime)}
+        self._listings = {}
+        self.ids = np.array([], dtype=str)
+        # {name: sizes aligned with ids, -1 if missing}
+        self.sizes = {}
+
+    @classmethod
+    def open(cls, root, components, primary):
+        manifest = cls(root, components, primary)
+        manifest.refresh()
+        return manifest
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def cache_file(self):
+        key = "{}|{}|{}".format(os.path.abspath(self.root),
+                                sorted(self.components.items()), self.VERSION)
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(get_cache_dir("manifest"), digest + ".npz")
+
+    def refresh(self):
+        """Load the cached listing and rescan the directories that changed"""
+        cached = self._load_cache()
+        changed = False
+        for name, (subdir, suffix) in self.components.items():
+            path = os.path.join(self.root, subdir)
+            mtime = _dir_mtime(path)
+            listing = cached.get(name)
+            if listing is None or listing[2] != mtime:
+                ids, sizes = _scan_dir(path, suffix)
+                listing = (ids, sizes, mtime)
+                changed = True
+            self._listings[name] = listing
+
+        self._join()
+        if changed:
+            self._save_cache()
+
+    def _join(self):
+        self.ids = self._listings[self.primary][0]
+        for name, (ids, sizes, _) in self._listings.items():
+            if name == self.primary:
+                self.sizes[name] = sizes
+                continue
+            aligned = np.full(len(self.ids), -1, dtype=np.int64)
+            if len(ids):
+                pos = np.searchsorted(ids, self.ids)
+                pos = np.minimum(pos, len(ids) - 1)
+                found = ids[pos] == self.ids
+                aligned[found] = sizes[pos[found]]
+            self.sizes[name] = aligned
+
+    def _load_cache(self):
+        cache_file = self.cache_file
+        if not os.path.exists(cache_file):
+            return {}
+        try:
+            with np.load(cache_file) as data:
+                return {name: (data[name + "_ids"], data[name + "_sizes"],
+                               int(data[name + "_mtime"]))
+                        for name in self.components
+                        if name + "_ids" in data}
+        except Exception as e:
+            logging.warning("Ignore broken manifest {}! {}".format(
+                cache_file, e))
+            return {}
+
+    def _save_cache(self):
+        arrays = {}
+        for name, (ids, sizes, mtime) in self._listings.items():
+            arrays[name + "_ids"] = ids
+            arrays[name + "_sizes"] = sizes
+            arrays[name + "_mtime"] = np.int64(mtime)
+        cache_file = self.cache_file
+        tmp_file = cache_file + ".tmp.npz"
+        try:
+            np.savez(tmp_file, **arrays)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            logging.warning("Save manifest failed! {}".format(e))
+
+    def index(self, frame_id):
+        """Position of frame_id, raise KeyError if it is not a frame"""
+        pos = int(np.searchsorted(self.ids, frame_id))
+        if pos >= len(self.ids) or self.ids[pos] != frame_id:
+            raise KeyError(frame_id)
+        return pos
+
+    def size(self, component, index):
+        """Size of the file at the last scan, -1 if missing"""
+        return int(self.sizes[component][index])
+
+    def path(self, component, index):
+        """File of component for the frame at index, None if missing"""
+        if self.sizes[component][index] < 0:
+            return None
+        subdir, suffix = self.components[component]
+        return os.path.join(self.root, subdir,
+                            "{}{}".format(self.ids[index], suffix))
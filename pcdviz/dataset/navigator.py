@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+# Copyright 2023 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pcdviz.dataset.cache import FrameCache
+from pcdviz.dataset.prefetch import PrefetchLoader
+
+
+class FrameNavigator:
+    """Move back and forth over the frames of a dataset
+
+    Frames already viewed are served from a size-bounded LRU cache, the
+    others from the prefetch loader in the direction of travel.
+    """
+
+    def __init__(self, dataset, cache_mb=1024, prefetch=None):
+        self._cache = FrameCache(float(cache_mb) * 1024 * 1024)
+        self._loader = PrefetchLoader(
+            dataset, skip=self._cache.__contains__, **(prefetch or {}))
+        self.index = -1
+        self.cache_hits = 0
+
+    def __len__(self):
+        return len(self._loader)
+
+    def next(self):
+        return self.jump(self.index + 1)
+
+    def prev(self):
+        return self.jump(self.index - 1)
+
+    def jump(self, index):
+        """Move to the frame at index
+
+        Returns:
+            dict: the frame, None if index is out of range or the frame can
+                not be loaded. The current position is kept in that case.
+        """
+        if index < 0 or index >= len(self):
+            return None
+        step = 1 if index >= self.index else -1
+        frame = self._cache.get(index)
+        if frame is not None:
+            self.cache_hits += 1
+            self._loader.prefetch(index, step)
+        else:
+            frame = self._loader.get(index, step)
+            if frame is None:
+                return None
+            self._cache.put(index, frame)
+        self.index = index
+        return frame
+
+    def update(self):
+        """Account for geometries added to the current frame"""
+        self._cache.update(self.index)
+
+    @property
+    def stats(self):
+        stats = dict(self._loader.stats)
+        stats["cache_hits"] = self.cache_hits
+        stats["cache_frames"] = len(self._cache)
+        stats["cache_mb"] = self._cache.nbytes / (1024 * 1024)
+        return stats
+
+    def close(self):
+        self._loader.close()
+        self._cache.clear()
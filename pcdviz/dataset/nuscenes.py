@@ -15,47 +15,52 @@
 # limitations under the License.
 
 import json
-import logging
 import os
 from collections import defaultdict
-from pathlib import Path
 
 import numpy as np
-import open3d as o3d
+from pcdviz import profiler
 from pcdviz.dataset.base_dataset import BaseDataset
+from pcdviz.dataset.nuscenes_index import TABLES, NuscenesIndex, find_version
+from pcdviz.geometry.box import create_boxes
+from pcdviz.geometry.pointcloud import create_pointcloud
+from pcdviz.io import lidar
+from pcdviz.util import quaternion_to_rotation_matrices, transform_matrix
 
 
 class Nuscenes(BaseDataset):
-    def __init__(self, dataset_path, **kwargs):
+    """
+      Frames are the lidar key frames of all scenes. They are read from a
+      compiled index (see nuscenes_index.py), the JSON tables are only
+      loaded when one of the table attributes is used.
+    """
+
+    def __init__(self, dataset_path, version=None, **kwargs):
         self.name = "nuScenes"
         self.dataset_path = dataset_path
-        self.version = 'v1.0-mini'
-
-        self.category = self._load_table('category')
-        self.attribute = self._load_table('attribute')
-        self.visibility = self._load_table('visibility')
-        self.instance = self._load_table('instance')
-        self.sensor = self._load_table('sensor')
-        self.calibrated_sensor = self._load_table('calibrated_sensor')
-        self.ego_pose = self._load_table('ego_pose')
-        self.log = self._load_table('log')
-        self.scene = self._load_table('scene')
-        self.sample = self._load_table('sample')
-        self.sample_data = self._load_table('sample_data')
-        self.sample_annotation = self._load_table('sample_annotation')
-        self.map = self._load_table('map')
-
-        # sample_data -> {sample_token: [sample_data]}
-        self.sample_data_dict = defaultdict(list)
-        # sample_annotation -> {sample_token: [sample_annotation]}
-        self.sample_annotation_dict = defaultdict(list)
-        self._load_data()
-
-    def __getitem__(self):
-        pass
-
-    def __len__(self):
-        pass
+        self.version = version or find_version(dataset_path)
+        self.table_index = NuscenesIndex.open(dataset_path, self.version)
+        self._tables = {}
+        self._keys = None
+
+    def __getattr__(self, name):
+        # Load tables and the sample dicts on first use
+        if name in TABLES:
+            self._tables[name] = self._load_table(name)
+            setattr(self, name, self._tables[name])
+            return self._tables[name]
+        if name in ('sample_data_dict', 'sample_annotation_dict'):
+            self._load_data()
+            return self.__dict__[name]
+        raise AttributeError(name)
+
+    def __getstate__(self):
+        # the tables are loaded again on first use
+        state = {name: value for name, value in self.__dict__.items()
+                 if name not in TABLES and name not in (
+                     'sample_data_dict', 'sample_annotation_dict')}
+        state["_tables"] = {}
+        return state
 
     def _load_table(self, table_name):
         file_path = os.path.join(
@@ -65,6 +70,10 @@ class Nuscenes(BaseDataset):
             return {d['token']: d for d in data}
 
     def _load_data(self):
+        # sample_data -> {sample_token: [sample_data]}
+        self.sample_data_dict = defaultdict(list)
+        # sample_annotation -> {sample_token: [sample_annotation]}
+        self.sample_annotation_dict = defaultdict(list)
         # Init sample_data_dict
         for token, sample_data in self.sample_data.items():
             sample_token = sample_data['sample_token']
@@ -74,6 +83,12 @@ class Nuscenes(BaseDataset):
             sample_token = sample_annotation['sample_token']
             self.sample_annotation_dict[sample_token].append(sample_annotation)
 
+    def get(self, table_name, token):
+        """Read one record without loading the whole table"""
+        if table_name in self._tables:
+            return self._tables[table_name].get(token)
+        return self.table_index.record(table_name, token)
+
     def _get_samples(self, scene_token):
         scene = self.scene[scene_token]
         sample_token = scene['first_sample_token']
@@ -83,74 +98,130 @@ class Nuscenes(BaseDataset):
             yield sample
 
     def get_sample_data(self, sample_data_token):
-        sample_data = self.sample_data[sample_data_token]
-        if not sample_data['is_key_frame']:
+        index = self.table_index.find(sample_data_token)
+        if index < 0:
             return None, None
+        frame = self._load_index(index)
+        if frame is None:
+            return None, None
+        return frame["pointcloud"], frame["bboxes"]
+
+    def _read_frame(self, index):
+        return self.read_points(index), self.read_labels(index)
 
-        calibrated_sensor = self.calibrated_sensor.get(
-            sample_data['calibrated_sensor_token'])
-        sensor = self.sensor.get(calibrated_sensor['sensor_token'])
-        ego_pose = self.ego_pose.get(sample_data['ego_pose_token'])
-        file_path = os.path.join(self.dataset_path, sample_data['filename'])
-        pointcloud = None
-        if sensor['modality'] == 'lidar':
-            pointcloud = Nuscenes.create_pointcloud(file_path)
-
-        calib = {"ego_pose": ego_pose, "calibrated_sensor": calibrated_sensor}
-        bboxes = []
-        sample_annotations = self.sample_annotation_dict.get(
-            sample_data['sample_token'])
-        for sample_annotation in sample_annotations:
-            bbox = Nuscenes.create_oriented_bounding_box(
-                sample_annotation, calib)
-            bboxes.append(bbox)
-        return pointcloud, bboxes
-
-    def items(self):
-        for token, scene in self.scene.items():
-            for sample in self._get_samples(scene['token']):
-                sample_token = sample['token']
-                for sample_data in self.sample_data_dict[sample_token]:
-                    pointcloud, bboxes = self.get_sample_data(
-                        sample_data['token'])
-                    if pointcloud:
-                        yield {"pointcloud": pointcloud, "bboxes": bboxes}
+    def read_points(self, index):
+        file_path = os.path.join(
+            self.dataset_path, str(self.table_index["frame_filename"][index]))
+        return Nuscenes.read_pcd(file_path)
+
+    def read_labels(self, index):
+        with profiler.span("read_labels") as span:
+            labels = self._read_labels(index)
+            span.set(boxes=len(labels["type"]))
+            return labels
+
+    def _read_labels(self, index):
+        db = self.table_index
+        calib = {"ego_pose": {
+                     "translation": db["frame_ego_translation"][index],
+                     "rotation": db["frame_ego_rotation"][index]},
+                 "calibrated_sensor": {
+                     "translation": db["frame_sensor_translation"][index],
+                     "rotation": db["frame_sensor_rotation"][index]}}
+        anns = db.annotations(index)
+        sample_annotations = {
+            "type": db["category_name"][db["ann_category"][anns]],
+            "translation": db["ann_translation"][anns],
+            "size": db["ann_size"][anns],
+            "rotation": db["ann_rotation"][anns]}
+        return Nuscenes.transform_annotations(sample_annotations, calib)
+
+    def label_files(self, index):
+        return [self.table_index.table_path(table_name) for table_name in
+                ("sample_annotation", "ego_pose", "calibrated_sensor")]
+
+    def keys(self):
+        if self._keys is None:
+            self._keys = [str(token)
+                          for token in self.table_index["frame_token"]]
+        return self._keys
+
+    def index(self, sample_data_token):
+        index = self.table_index.find(sample_data_token)
+        if index < 0:
+            raise KeyError(sample_data_token)
+        return index
+
+    def __getitem__(self, index):
+        return self._load_index(index)
+
+    def __len__(self):
+        return len(self.table_index)
+
+    def load(self, sample_data_token):
+        return self._load_index(self.index(sample_data_token))
+
+    def _load_index(self, index):
+        points, labels = self._read_frame(index)
+        if points is None:
+            return None
+        return self.make_frame(points, labels)
 
     @staticmethod
     def create_pointcloud(pcd_file):
         points = Nuscenes.read_pcd(pcd_file)
-        pcd = o3d.geometry.PointCloud()
-        pcd.points = o3d.utility.Vector3dVector(points[:, :3])
-        return pcd
+        return create_pointcloud(points)
 
     @staticmethod
-    def create_oriented_bounding_box(sample_annotation, calib):
-        translation = sample_annotation['translation']
-        width, length, height = sample_annotation['size']
-        rotation_mat = o3d.geometry.OrientedBoundingBox.get_rotation_matrix_from_quaternion(
-            sample_annotation['rotation'])
-        bbox = o3d.geometry.OrientedBoundingBox(
-            translation, rotation_mat, [length, width, height])
-
-        # world to vehicle coordinates
-        rotation_mat = o3d.geometry.OrientedBoundingBox.get_rotation_matrix_from_quaternion(
-            calib['ego_pose']['rotation'])
-        bbox.translate(-np.array(calib['ego_pose']['translation']))
-        bbox.rotate(np.linalg.inv(rotation_mat))
-        # vehicle to sensor coordinates
-        rotation_mat = o3d.geometry.OrientedBoundingBox.get_rotation_matrix_from_quaternion(
+    def create_oriented_bounding_box(sample_annotations, calib):
+        """One geometry with all annotations of a sample, see
+        transform_annotations for the arguments"""
+        return create_boxes(
+            Nuscenes.transform_annotations(sample_annotations, calib))
+
+    @staticmethod
+    def transform_annotations(sample_annotations, calib):
+        """Boxes of all annotations of a sample in sensor coordinates
+
+        Args:
+            sample_annotations (dict): "translation" (N, 3), "size" (N, 3)
+                as (width, length, height), "rotation" (N, 4) quaternions
+                in world coordinates and optionally "type" (N,)
+            calib (dict): "ego_pose" and "calibrated_sensor" records
+
+        Returns:
+            dict: box columns, see BaseDataset
+        """
+        translation = np.asarray(
+            sample_annotations['translation'], dtype=np.float64).reshape(-1, 3)
+        size = np.asarray(sample_annotations['size']).reshape(-1, 3)
+        types = sample_annotations.get('type')
+        if types is None:
+            types = np.full(len(translation), '', dtype=str)
+
+        # world to vehicle to sensor coordinates, once for the sample
+        ego_pose = transform_matrix(calib['ego_pose']['translation'],
+                                    calib['ego_pose']['rotation'])
+        sensor_pose = transform_matrix(
+            calib['calibrated_sensor']['translation'],
             calib['calibrated_sensor']['rotation'])
-        bbox.translate(-np.array(calib['calibrated_sensor']['translation']))
-        bbox.rotate(np.linalg.inv(rotation_mat))
-        return bbox
+        world_to_sensor = np.linalg.inv(ego_pose @ sensor_pose)
+
+        rotation = world_to_sensor[:3, :3]
+        centers = translation @ rotation.T + world_to_sensor[:3, 3]
+        rotation_mats = rotation @ quaternion_to_rotation_matrices(
+            sample_annotations['rotation'])
+        # size is (width, length, height)
+        return {"type": np.asarray(types),
+                "center": centers,
+                "extent": size[:, [1, 0, 2]],
+                "R": rotation_mats,
+                "score": np.full(len(translation), np.nan, dtype=np.float32)}
 
     @staticmethod
     def read_image(file_path):
         pass
 
     @staticmethod
-    def read_pcd(file_path):
-        if not Path(file_path).exists():
-            logging.error("File not exist! {}".format(file_path))
-            return None
-        return np.fromfile(file_path, dtype=np.float32).reshape((-1, 5))
+    def read_pcd(file_path, fields="nuscenes"):
+        return lidar.read_bin(file_path, fields)
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+
+# Copyright 2023 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+  Compiled index of the nuScenes tables.
+
+  The JSON tables are parsed once and the parts needed to display lidar
+  key frames are stored as .npy arrays in the pcdviz cache:
+
+  - frame_*: one row per lidar key frame, in scene and driving order
+  - ann_*: annotations of all frames, frame i owns
+    ann_offsets[i]:ann_offsets[i + 1]
+  - scene_*: scene names, scene i owns frames
+    scene_offsets[i]:scene_offsets[i + 1]
+  - <table>_token / <table>_offset: sorted tokens and the byte range of
+    their record in <table>.json, so one row can be read without parsing
+    the whole table
+
+  Arrays are memory-mapped on first use. The index is rebuilt when the
+  size or mtime of a JSON file changes.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+from collections import defaultdict
+
+import numpy as np
+
+from pcdviz.util import get_cache_dir
+
+TABLES = ('category', 'attribute', 'visibility', 'instance', 'sensor',
+          'calibrated_sensor', 'ego_pose', 'log', 'scene', 'sample',
+          'sample_data', 'sample_annotation', 'map')
+
+_SEPARATOR = re.compile(r'[\s,]*')
+
+
+def find_version(dataset_path):
+    """Guess the version from the v1.0-* directories holding the tables"""
+    versions = sorted(
+        name for name in os.listdir(dataset_path)
+        if os.path.isfile(os.path.join(dataset_path, name, 'sample.json')))
+    if not versions:
+        return 'v1.0-mini'
+    if len(versions) > 1:
+        logging.warning("Found versions {}, use {}".format(
+            versions, versions[0]))
+    return versions[0]
+
+
+def read_records(file_path):
+    """Parse a JSON table keeping the byte range of every record
+
+    Returns:
+        (list, np.ndarray): records and their (start, end) byte offsets
+    """
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    # latin-1 keeps one character per byte, so string positions are file
+    # offsets. Every field pcdviz reads is ascii.
+    text = data.decode('latin-1')
+    decoder = json.JSONDecoder()
+    records, offsets = [], []
+    pos = _SEPARATOR.match(text, text.index('[') + 1).end()
+    while text[pos] != ']':
+        record, end = decoder.raw_decode(text, pos)
+        records.append(record)
+        offsets.append((pos, end))
+        pos = _SEPARATOR.match(text, end).end()
+    return records, np.array(offsets, dtype=np.int64).reshape(-1, 2)
+
+
+class NuscenesIndex:
+    FORMAT = 1
+
+    def __init__(self, dataset_path, version, index_dir):
+        self.dataset_path = dataset_path
+        self.version = version
+        self.index_dir = index_dir
+        self._arrays = {}
+
+    def __getstate__(self):
+        # memory-mapped arrays are opened again instead of copied
+        state = dict(self.__dict__)
+        state["_arrays"] = {}
+        return state
+
+    @classmethod
+    def open(cls, dataset_path, version):
+        key = "{}|{}".format(os.path.abspath(dataset_path), version)
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        index = cls(dataset_path, version,
+                    get_cache_dir("nuscenes", digest))
+        if not index._is_valid():
+            logging.info("Build nuScenes index in {}".format(index.index_dir))
+            index.build()
+        return index
+
+    def table_path(self, table_name):
+        return os.path.join(self.dataset_path, self.version,
+                            "{}.json".format(table_name))
+
+    def _sources(self):
+        sources = {}
+        for table_name in TABLES:
+            stat = os.stat(self.table_path(table_name))
+            sources[table_name] = [stat.st_size, stat.st_mtime_ns]
+        return sources
+
+    def _is_valid(self):
+        meta_file = os.path.join(self.index_dir, "meta.json")
+        if not os.path.exists(meta_file):
+            return False
+        with open(meta_file, 'r') as f:
+            meta = json.load(f)
+        return meta.get("format") == self.FORMAT and \
+            meta.get("sources") == self._sources()
+
+    def __getitem__(self, name):
+        array = self._arrays.get(name)
+        if array is None:
+            array = np.load(os.path.join(self.index_dir, name + ".npy"),
+                            mmap_mode='r')
+            self._arrays[name] = array
+        return array
+
+    def __len__(self):
+        return len(self["frame_token"])
+
+    def record(self, table_name, token):
+        """Read one row of a table, None if the token does not exist"""
+        tokens = self[table_name + "_token"]
+        key = token.encode('ascii') if isinstance(token, str) else token
+        pos = int(np.searchsorted(tokens, key))
+        if pos >= len(tokens) or tokens[pos] != key:
+            return None
+        start, end = self[table_name + "_offset"][pos]
+        with open(self.table_path(table_name), 'rb') as f:
+            f.seek(start)
+            return json.loads(f.read(end - start).decode('utf-8'))
+
+    def find(self, frame_token):
+        """Frame index of a lidar sample_data token, -1 if not found"""
+        tokens, order = self["frame_token"], self["frame_order"]
+        pos = int(np.searchsorted(tokens, frame_token, sorter=order))
+        if pos >= len(order) or tokens[order[pos]] != frame_token:
+            return -1
+        return int(order[pos])
+
+    def frames(self, scene_name):
+        """Frame indexes of a scene"""
+        names = list(self["scene_name"])
+        i = names.index(scene_name)
+        offsets = self["scene_offsets"]
+        return range(int(offsets[i]), int(offsets[i + 1]))
+
+    def annotations(self, index):
+        """Slice of the ann_* arrays owned by frame index"""
+        offsets = self["ann_offsets"]
+        return slice(int(offsets[index]), int(offsets[index + 1]))
+
+    def build(self):
+        sources = self._sources()
+        tables, arrays = {}, {}
+        for table_name in TABLES:
+            records, offsets = read_records(self.table_path(table_name))
+            tokens = np.array([r['token'] for r in records], dtype='S')
+            order = np.argsort(tokens, kind='stable')
+            arrays[table_name + "_token"] = tokens[order]
+            arrays[table_name + "_offset"] = offsets[order]
+            tables[table_name] = records
+        arrays.update(self._compile(tables))
+        arrays["frame_order"] = np.argsort(arrays["frame_token"])
+
+        tmp_dir = self.index_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, name + ".npy"), array)
+        with open(os.path.join(tmp_dir, "meta.json"), 'w') as f:
+            json.dump({"format": self.FORMAT, "version": self.version,
+                       "sources": sources}, f)
+        shutil.rmtree(self.index_dir, ignore_errors=True)
+        os.replace(tmp_dir, self.index_dir)
+        self._arrays = {}
+
+    @staticmethod
+    def _compile(tables):
+        sensor = {r['token']: r for r in tables['sensor']}
+        calibrated_sensor = {r['token']: r
+                             for r in tables['calibrated_sensor']}
+        ego_pose = {r['token']: r for r in tables['ego_pose']}
+        sample = {r['token']: r for r in tables['sample']}
+        category_names = [r['name'] for r in tables['category']]
+        category_code = {r['token']: i
+                         for i, r in enumerate(tables['category'])}
+        instance_category = {r['token']: category_code[r['category_token']]
+                             for r in tables['instance']}
+
+        # lidar key frames and annotations of each sample
+        lidar_data = defaultdict(list)
+        for r in tables['sample_data']:
+            if not r['is_key_frame']:
+                continue
+            cs = calibrated_sensor[r['calibrated_sensor_token']]
+            if sensor[cs['sensor_token']]['modality'] == 'lidar':
+                lidar_data[r['sample_token']].append(r)
+        annotations = defaultdict(list)
+        for r in tables['sample_annotation']:
+            annotations[r['sample_token']].append(r)
+
+        frames, anns = [], []
+        ann_offsets, scene_offsets, scene_names = [0], [0], []
+        for scene in tables['scene']:
+            sample_token = scene['first_sample_token']
+            while sample_token:
+                for r in lidar_data[sample_token]:
+                    cs = calibrated_sensor[r['calibrated_sensor_token']]
+                    ep = ego_pose[r['ego_pose_token']]
+                    frames.append((r['token'], r['filename'], sample_token,
+                                   ep['translation'], ep['rotation'],
+                                   cs['translation'], cs['rotation']))
+                    anns.extend(annotations[sample_token])
+                    ann_offsets.append(len(anns))
+                sample_token = sample[sample_token]['next']
+            scene_names.append(scene['name'])
+            scene_offsets.append(len(frames))
+
+        def column(rows, i, dtype, width=None):
+            shape = (len(rows), width) if width else (len(rows),)
+            return np.array([row[i] for row in rows], dtype=dtype).reshape(
+                shape)
+
+        return {
+            "frame_token": column(frames, 0, str),
+            "frame_filename": column(frames, 1, str),
+            "frame_sample": column(frames, 2, str),
+            "frame_ego_translation": column(frames, 3, np.float64, 3),
+            "frame_ego_rotation": column(frames, 4, np.float64, 4),
+            "frame_sensor_translation": column(frames, 5, np.float64, 3),
+            "frame_sensor_rotation": column(frames, 6, np.float64, 4),
+            "ann_category": np.array(
+                [instance_category[a['instance_token']] for a in anns],
+                dtype=np.int16),
+            "ann_translation": np.array(
+                [a['translation'] for a in anns],
+                dtype=np.float64).reshape(-1, 3),
+            "ann_size": np.array(
+                [a['size'] for a in anns], dtype=np.float32).reshape(-1, 3),
+            "ann_rotation": np.array(
+                [a['rotation'] for a in anns],
+                dtype=np.float64).reshape(-1, 4),
+            "ann_num_lidar_pts": np.array(
+                [a.get('num_lidar_pts', -1) for a in anns], dtype=np.int32),
+            "ann_offsets": np.array(ann_offsets, dtype=np.int64),
+            "category_name": np.array(category_names, dtype=str),
+            "scene_name": np.array(scene_names, dtype=str),
+            "scene_offsets": np.array(scene_offsets, dtype=np.int64),
+        }
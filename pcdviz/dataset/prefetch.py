@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+# Copyright 2023 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from pcdviz import profiler
+
+
+class PrefetchLoader:
+    """Decode the frames following the current one on a thread pool
+
+    At most `depth` frames are queued or kept decoded at a time. Reading
+    the sweep and parsing labels is mostly NumPy and file IO, which release
+    the GIL, so a few threads are enough to stay ahead of the keyboard.
+    """
+
+    def __init__(self, dataset, depth=4, workers=2, skip=None):
+        self._keys = dataset.keys()
+        # Indexes that need no prefetch, e.g. already cached
+        self._skip = skip
+        self._dataset = dataset
+        self.depth = max(int(depth), 0)
+        self._executor = None
+        if self.depth:
+            self._executor = ThreadPoolExecutor(
+                max_workers=max(int(workers), 1),
+                thread_name_prefix="pcdviz-prefetch")
+        # {index: future}, never longer than depth
+        self._futures = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _load(self, key):
+        with profiler.span("load_frame", frame=key):
+            return self._dataset.load(key)
+
+    def __iter__(self):
+        for index in range(len(self._keys)):
+            frame = self.get(index)
+            if frame:
+                yield frame
+
+    def get(self, index, step=1):
+        """Return the decoded frame at index and prefetch the next ones
+
+        Args:
+            index (int): frame index
+            step (int): direction of travel, -1 prefetches backwards
+        """
+        future = self._futures.pop(index, None)
+        if future is not None and future.done():
+            self.hits += 1
+        else:
+            self.misses += 1
+        # Queue the following frames before waiting on this one
+        self.prefetch(index, step)
+
+        try:
+            if future is not None:
+                return future.result()
+            return self._load(self._keys[index])
+        except Exception as e:
+            logging.error("Load frame {} failed! {}".format(
+                self._keys[index], e))
+            return None
+
+    def prefetch(self, index, step=1):
+        """Queue the `depth` frames after index in the direction of step"""
+        if self._executor is None:
+            return
+        step = 1 if step >= 0 else -1
+        end = index + step * (self.depth + 1)
+        window = range(index + step, min(max(end, -1), len(self._keys)), step)
+        for i in list(self._futures):
+            if i not in window:
+                self._futures.pop(i).cancel()
+        for i in window:
+            if self._skip is not None and self._skip(i):
+                continue
+            if i not in self._futures:
+                self._futures[i] = self._executor.submit(
+                    self._load, self._keys[i])
+
+    @property
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
+
+    def close(self):
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
@@ -14,15 +14,32 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from base_dataset import BaseDataset
+import logging
+
+from pcdviz.dataset.base_dataset import BaseDataset
+from pcdviz.dataset.manifest import Manifest
 
 
 class Waymo(BaseDataset):
-    def __init__(self):
-        pass
+    """
+      Waymo Open Dataset, indexed by *.tfrecord segment. Decoding frames
+      needs the waymo-open-dataset package, which is not a dependency of
+      pcdviz, so segments can not be displayed yet.
+    """
+
+    def __init__(self, dataset_path, **kwargs):
+        self.name = 'Waymo'
+        self.dataset_path = dataset_path
+        self.manifest = Manifest.open(dataset_path, {
+            "segment": ("", ".tfrecord")}, primary="segment")
+
+    def keys(self):
+        return self.manifest.ids
 
-    def __getitem__(self):
-        pass
+    def index(self, segment_name):
+        return self.manifest.index(segment_name)
 
-    def __len__(self):
-        pass
+    def load(self, segment_name):
+        logging.error("Waymo segments can not be decoded yet! {}".format(
+            segment_name))
+        return None
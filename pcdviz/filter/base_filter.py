@@ -14,13 +14,64 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from abc import ABC, abstractmethod
+from abc import ABC
+
+import numpy as np
+
+
+def and_between(mask, values, low=None, high=None, scratch=None):
+    """mask &= (low <= values <= high) without allocating new masks
+
+    Args:
+        mask (np.ndarray): bool mask updated in place
+        values (np.ndarray): values of the same length
+        low, high: bounds, None means unbounded
+        scratch (np.ndarray, optional): bool buffer of the same length
+    """
+    if scratch is None:
+        scratch = np.empty(len(mask), dtype=bool)
+    if low is not None:
+        np.greater_equal(values, low, out=scratch)
+        np.logical_and(mask, scratch, out=mask)
+    if high is not None:
+        np.less_equal(values, high, out=scratch)
+        np.logical_and(mask, scratch, out=mask)
+    return mask
+
+
+def bounds(value):
+    """(low, high) from a number (low only), a pair or None"""
+    if value is None:
+        return None, None
+    if isinstance(value, (list, tuple)):
+        low, high = (list(value) + [None, None])[:2]
+        return low, high
+    return value, None
 
 
 class BaseFilter(ABC):
-    def __init__(self) -> None:
+    """A filter ANDs its conditions into the mask of a FilterPipeline
+
+    Points are structured arrays (see pcdviz.io.lidar) or (N, 3+) arrays,
+    labels are the box columns described in BaseDataset.
+    """
+
+    def __init__(self, config=None) -> None:
+        self.config = config or {}
+
+    @property
+    def active(self):
+        """False if the filter has nothing configured"""
+        return True
+
+    def point_mask(self, points, mask, scratch):
         pass
 
-    @abstractmethod
-    def filter(self, data):
+    def label_mask(self, labels, mask, scratch):
         pass
+
+    def filter(self, data):
+        """Filter (points, labels) with this filter alone"""
+        from pcdviz.filter.pipeline import FilterPipeline
+        points, labels = data
+        return FilterPipeline([self]).apply(points, labels)
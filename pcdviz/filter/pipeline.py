@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+# Copyright 2023 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+
+import numpy as np
+
+from pcdviz import profiler
+from pcdviz.registry import FILTERS
+
+
+def _mask_column(values, mask):
+    """Rows of a per-box column kept by mask, other values as is"""
+    if isinstance(values, np.ndarray) and values.ndim >= 1 and \
+            len(values) == len(mask):
+        return values[mask]
+    if isinstance(values, (list, tuple)) and len(values) == len(mask):
+        # ragged rows
+        return [row for row, keep in zip(values, mask) if keep]
+    return values
+
+
+def _as_column(values, size):
+    """Array of a per-box list, other values as is"""
+    if not isinstance(values, (list, tuple)) or len(values) != size:
+        return values
+    try:
+        return np.asarray(values)
+    except ValueError:
+        # ragged rows
+        return values
+
+
+class FilterPipeline:
+    """All configured filters fused into one mask per frame
+
+    Every filter ANDs its conditions into the same boolean mask, so points
+    and labels are indexed once at the end instead of once per filter.
+    """
+
+    def __init__(self, filters):
+        self.filters = filters
+
+    @classmethod
+    def from_config(cls, config):
+        """Build from the `filters:` block, None if no filter is active"""
+        filters = []
+        for filter_conf in config or []:
+            name = filter_conf.get("name")
+            filter_cls = FILTERS.get(name)
+            if filter_cls is None:
+                logging.error("Skip unknown filter! {}".format(name))
+                continue
+            filter = filter_cls(filter_conf)
+            if filter.active:
+                filters.append(filter)
+        return cls(filters) if filters else None
+
+    def point_mask(self, points):
+        mask = np.ones(len(points), dtype=bool)
+        scratch = np.empty(len(points), dtype=bool)
+        for filter in self.filters:
+            filter.point_mask(points, mask, scratch)
+        return mask
+
+    def label_mask(self, labels):
+        size = len(labels["type"])
+        mask = np.ones(size, dtype=bool)
+        scratch = np.empty(size, dtype=bool)
+        for filter in self.filters:
+            filter.label_mask(labels, mask, scratch)
+        return mask
+
+    def apply_points(self, points):
+        if points is None:
+            return None
+        with profiler.span("filter_points", points=len(points)):
+            mask = self.point_mask(points)
+            return points if mask.all() else points[mask]
+
+    def apply_labels(self, labels):
+        """Keep the boxes passing the filters
+
+        Only the per-box columns, with one row per box, are masked. Lists,
+        e.g. from a label callback, are converted to arrays first when
+        they are not ragged. The other entries are passed through.
+        """
+        if labels is None:
+            return None
+        size = len(labels["type"])
+        with profiler.span("filter_labels", boxes=size):
+            labels = {name: _as_column(values, size)
+                      for name, values in labels.items()}
+            mask = self.label_mask(labels)
+            if mask.all():
+                return labels
+            return {name: _mask_column(values, mask)
+                    for name, values in labels.items()}
+
+    def apply(self, points, labels=None):
+        return self.apply_points(points), self.apply_labels(labels)
@@ -14,12 +14,55 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from base_filter import BaseFilter
+import numpy as np
+
+from pcdviz.filter.base_filter import BaseFilter, and_between, bounds
+from pcdviz.io import lidar
 
 
 class RangeFilter(BaseFilter):
-    def __init__(self) -> None:
-        pass
+    """Keep points and boxes inside a region
+
+      - name: range_filter
+        range: [-50, -50, -5, 50, 50, 5]  # xmin, ymin, zmin, xmax, ymax, zmax
+        radius: [0, 80]                   # distance in the xy plane
+        height: [-3, 3]                   # z
+    """
+
+    def __init__(self, config=None) -> None:
+        super().__init__(config)
+        box = self.config.get("range")
+        self.range = None
+        if box:
+            if len(box) != 6:
+                raise ValueError("range is [xmin, ymin, zmin, xmax, ymax, "
+                                 "zmax], got {}".format(box))
+            self.range = [(box[i], box[i + 3]) for i in range(3)]
+        self.radius = bounds(self.config.get("radius"))
+        self.height = bounds(self.config.get("height"))
+
+    @property
+    def active(self):
+        return self.range is not None or \
+            any(v is not None for v in self.radius + self.height)
+
+    def _mask(self, x, y, z, mask, scratch):
+        if self.range is not None:
+            for values, (low, high) in zip((x, y, z), self.range):
+                and_between(mask, values, low, high, scratch)
+        and_between(mask, z, *self.height, scratch=scratch)
+        low, high = self.radius
+        if low is not None or high is not None:
+            distance = np.square(x, dtype=np.float32)
+            distance += np.square(y, dtype=np.float32)
+            and_between(mask, distance,
+                        None if low is None else low * low,
+                        None if high is None else high * high, scratch)
+
+    def point_mask(self, points, mask, scratch):
+        self._mask(*(lidar.field(points, name) for name in "xyz"),
+                   mask=mask, scratch=scratch)
 
-    def filter(self, data):
-        pass
+    def label_mask(self, labels, mask, scratch):
+        center = labels["center"]
+        self._mask(center[:, 0], center[:, 1], center[:, 2], mask, scratch)
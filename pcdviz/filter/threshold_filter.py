@@ -14,12 +14,48 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from base_filter import BaseFilter
+import numpy as np
+
+from pcdviz.filter.base_filter import BaseFilter, and_between, bounds
+from pcdviz.io import lidar
 
 
 class ThresholdFilter(BaseFilter):
-    def __init__(self) -> None:
-        pass
+    """Keep points and boxes whose fields are within thresholds
+
+    A number is the minimum, a pair is [min, max]. Point fields are the
+    fields of the sweep, e.g. intensity or ring, label fields are box
+    columns, e.g. score. Boxes without a score (NaN) are kept.
+
+      - name: threshold_filter
+        threshold:
+          intensity: [0.05, 1.0]
+          score: 0.5
+    """
+
+    def __init__(self, config=None) -> None:
+        super().__init__(config)
+        self.threshold = {name: bounds(value) for name, value in
+                          (self.config.get("threshold") or {}).items()}
+
+    @property
+    def active(self):
+        return bool(self.threshold)
+
+    def point_mask(self, points, mask, scratch):
+        for name, (low, high) in self.threshold.items():
+            values = lidar.field(points, name)
+            if values is not None:
+                and_between(mask, values, low, high, scratch)
 
-    def filter(self, data):
-        pass
+    def label_mask(self, labels, mask, scratch):
+        for name, (low, high) in self.threshold.items():
+            values = labels.get(name)
+            if values is None or values.ndim != 1:
+                continue
+            keep = and_between(np.ones(len(values), dtype=bool), values,
+                               low, high, scratch)
+            if values.dtype.kind == 'f':
+                # NaN compares False, keep boxes without the field
+                keep |= np.isnan(values)
+            mask &= keep
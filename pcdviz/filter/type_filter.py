@@ -14,12 +14,31 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from base_filter import BaseFilter
+import numpy as np
+
+from pcdviz.filter.base_filter import BaseFilter
 
 
 class TypeFilter(BaseFilter):
-    def __init__(self) -> None:
-        pass
+    """Keep boxes by type, white_type first then black_type
+
+      - name: type_filter
+        white_type: [Car, Pedestrian]
+        black_type: [DontCare]
+    """
+
+    def __init__(self, config=None) -> None:
+        super().__init__(config)
+        self.white_type = self.config.get("white_type") or []
+        self.black_type = self.config.get("black_type") or []
+
+    @property
+    def active(self):
+        return bool(self.white_type or self.black_type)
 
-    def filter(self, data):
-        pass
+    def label_mask(self, labels, mask, scratch):
+        types = labels["type"]
+        if self.white_type:
+            mask &= np.isin(types, self.white_type)
+        if self.black_type:
+            mask &= np.isin(types, self.black_type, invert=True)
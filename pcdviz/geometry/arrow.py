@@ -14,6 +14,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from pcdviz.geometry.base_obj import VizObj
+
 
 class Arrow(VizObj):
     def __init__(self):
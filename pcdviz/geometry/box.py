@@ -14,6 +14,58 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import numpy as np
+
+from pcdviz import profiler
+from pcdviz.geometry.base_obj import VizObj
+
+# Corners of a unit box, +x is the heading. 0-3 bottom face, 4-7 top face
+UNIT_CORNERS = np.array([[0.5, 0.5, -0.5],
+                         [0.5, -0.5, -0.5],
+                         [-0.5, -0.5, -0.5],
+                         [-0.5, 0.5, -0.5],
+                         [0.5, 0.5, 0.5],
+                         [0.5, -0.5, 0.5],
+                         [-0.5, -0.5, 0.5],
+                         [-0.5, 0.5, 0.5]])
+
+BOX_LINES = np.array([[0, 1], [1, 2], [2, 3], [3, 0],
+                      [4, 5], [5, 6], [6, 7], [7, 4],
+                      [0, 4], [1, 5], [2, 6], [3, 7]])
+
+# Cross on the front face
+HEADING_LINES = np.array([[0, 5], [1, 4]])
+
+
+def box_corners(centers, extents, rotations):
+    """Corners of N oriented boxes
+
+    Args:
+        centers (np.ndarray): (N, 3)
+        extents (np.ndarray): (N, 3) as (length, width, height)
+        rotations (np.ndarray): (N, 3, 3)
+
+    Returns:
+        np.ndarray: (N, 8, 3) corners in UNIT_CORNERS order
+    """
+    local = UNIT_CORNERS[np.newaxis] * extents[:, np.newaxis, :]
+    return np.einsum('nij,nkj->nki', rotations, local) + \
+        centers[:, np.newaxis, :]
+
+
+def create_boxes(labels, color=None):
+    """Geometries of the boxes in labels, see BaseDataset for the columns
+
+    Returns:
+        list: one LineSet with all boxes, empty if there are none
+    """
+    if labels is None or not len(labels["type"]):
+        return []
+    with profiler.span("boxes", boxes=len(labels["type"])):
+        boxes = Box3DWithHeading(labels["center"], labels["extent"],
+                                 labels["R"], color)
+        return [boxes.to_geometry()]
+
 
 class Box2D(VizObj):
     def __init__(self):
@@ -21,10 +73,47 @@ class Box2D(VizObj):
 
 
 class Box3D(VizObj):
-    def __init__(self):
-        self._bbox
-        self._arrow
-        self._text
+    """N oriented boxes drawn as a single LineSet
+
+    Args:
+        centers (np.ndarray): (N, 3)
+        extents (np.ndarray): (N, 3) as (length, width, height)
+        rotations (np.ndarray): (N, 3, 3)
+        colors (optional): one RGB color for all boxes or (N, 3) colors
+    """
+
+    LINES = BOX_LINES
+
+    def __init__(self, centers, extents, rotations, colors=None):
+        self.centers = np.asarray(centers, dtype=np.float64).reshape(-1, 3)
+        self.extents = np.asarray(extents, dtype=np.float64).reshape(-1, 3)
+        self.rotations = np.asarray(
+            rotations, dtype=np.float64).reshape(-1, 3, 3)
+        self.colors = colors
+
+    def __len__(self):
+        return len(self.centers)
+
+    @property
+    def corners(self):
+        return box_corners(self.centers, self.extents, self.rotations)
+
+    def to_geometry(self):
+        import open3d as o3d
+
+        n, lines = len(self), self.LINES
+        offsets = np.arange(n)[:, np.newaxis, np.newaxis] * 8
+        lineset = o3d.geometry.LineSet()
+        lineset.points = o3d.utility.Vector3dVector(
+            self.corners.reshape(-1, 3))
+        lineset.lines = o3d.utility.Vector2iVector(
+            (lines[np.newaxis] + offsets).reshape(-1, 2).astype(np.int32))
+        if self.colors is not None:
+            colors = np.broadcast_to(
+                np.asarray(self.colors, dtype=np.float64), (n, 3))
+            lineset.colors = o3d.utility.Vector3dVector(
+                np.repeat(colors, len(lines), axis=0))
+        return lineset
 
 
 class Box3DProj(Box3D):
@@ -33,5 +122,6 @@ class Box3DProj(Box3D):
 
 
 class Box3DWithHeading(Box3D):
-    def __init__(self):
-        pass
+    """Box3D with a cross on the front face"""
+
+    LINES = np.concatenate([BOX_LINES, HEADING_LINES])
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+# Copyright 2023 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+  Per-point colors from a point field, e.g. intensity, z, range or ring.
+
+  Values are scaled to [low, high] and mapped through a 256 entry lookup
+  table in one pass. low and high are either fixed or percentiles of the
+  frame, estimated on at most SAMPLE_SIZE strided points. With a fixed
+  range, 8 and 16 bit fields are colored with a table of every possible
+  value, built on the first frame and reused for the next ones.
+"""
+
+import functools
+import logging
+
+import numpy as np
+
+from pcdviz.geometry.points_in_boxes import BOX_PALETTE
+from pcdviz.io import lidar
+from pcdviz.util import COLOR_MAP
+
+LUT_SIZE = 256
+SAMPLE_SIZE = 16384
+
+# Control points of the lookup tables, from low to high values
+RAMPS = {
+    "jet": [[0.0, 0.0, 0.5], [0.0, 0.0, 1.0], [0.0, 1.0, 1.0],
+            [1.0, 1.0, 0.0], [1.0, 0.0, 0.0], [0.5, 0.0, 0.0]],
+    "viridis": [[0.267, 0.005, 0.329], [0.283, 0.141, 0.458],
+                [0.254, 0.265, 0.530], [0.207, 0.372, 0.553],
+                [0.164, 0.471, 0.558], [0.128, 0.567, 0.551],
+                [0.135, 0.659, 0.518], [0.267, 0.749, 0.441],
+                [0.478, 0.821, 0.318], [0.741, 0.873, 0.150],
+                [0.993, 0.906, 0.144]],
+    "gray": [[0.1, 0.1, 0.1], [1.0, 1.0, 1.0]],
+}
+
+# Colors of integer values, e.g. label ids, value % len(palette)
+PALETTES = {
+    "label": BOX_PALETTE,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get_lut(name):
+    """(LUT_SIZE, 3) float32 colors of a ramp or (K, 3) of a palette"""
+    if name in PALETTES:
+        return np.asarray(PALETTES[name], dtype=np.float32)
+    ramp = np.asarray(RAMPS[name], dtype=np.float64)
+    x = np.linspace(0, len(ramp) - 1, LUT_SIZE)
+    lut = np.stack([np.interp(x, np.arange(len(ramp)), ramp[:, i])
+                    for i in range(3)], axis=1)
+    return lut.astype(np.float32)
+
+
+def field_values(points, name):
+    """Values of a point field, None if the points do not have it
+
+    "range" is the distance to the sensor and "height" is z. The points
+    can also be a plain (N, 3) array of coordinates.
+    """
+    if name == "range":
+        # per column, the records are strided and einsum is slow on them
+        xyz = lidar.xyz(points)
+        distance = np.square(xyz[:, 0])
+        distance += np.square(xyz[:, 1])
+        distance += np.square(xyz[:, 2])
+        return np.sqrt(distance, out=distance)
+    return lidar.field(points, "z" if name == "height" else name)
+
+
+def percentile_range(values, percentiles=(1, 99)):
+    """low and high percentiles of values, on a strided sample"""
+    if not len(values):
+        return 0.0, 1.0
+    sample = values[::max(1, len(values) // SAMPLE_SIZE)]
+    sample = sample[np.isfinite(sample)]
+    if not len(sample):
+        return 0.0, 1.0
+    low, high = np.percentile(sample, percentiles)
+    return float(low), float(high)
+
+
+def lut_indices(values, low, high):
+    """uint8 indexes into a LUT_SIZE table, values clipped to [low, high]"""
+    scale = (LUT_SIZE - 1) / max(high - low, 1e-6)
+    index = np.subtract(values, low, dtype=np.float32)
+    index *= scale
+    np.clip(index, 0, LUT_SIZE - 1, out=index)
+    return index.astype(np.uint8)
+
+
+class ColorMap:
+    """Colors of the points by one of their fields
+
+    Args:
+        field (str): point field, "range" or "height"
+        lut (str): ramp of RAMPS, or palette of PALETTES for integer
+            fields, e.g. a label id
+        range (list, optional): fixed [low, high] of the ramp, found from
+            the percentiles of each frame otherwise
+        percentiles (list): [low, high] percentiles used without range
+    """
+
+    def __init__(self, field, lut="jet", range=None, percentiles=(1, 99)):
+        if lut not in RAMPS and lut not in PALETTES:
+            raise ValueError("Unknown lut! {}, choose from {}".format(
+                lut, ", ".join(list(RAMPS) + list(PALETTES))))
+        self.field = field
+        self.lut = lut
+        self.range = None if range is None else \
+            (float(range[0]), float(range[1]))
+        self.percentiles = tuple(percentiles)
+        # {dtype: colors of every value of a 8 / 16 bit field}
+        self._value_tables = {}
+
+    @classmethod
+    def from_config(cls, config):
+        """ColorMap of a "color" setting, None for a uniform or box color
+
+        The setting is a field name, e.g. "intensity", or a dict with the
+        field and the arguments above.
+        """
+        if not config:
+            return None
+        if isinstance(config, str):
+            if config == "box" or config in COLOR_MAP:
+                return None
+            return cls(config)
+        return cls(config["field"], config.get("lut", "jet"),
+                   config.get("range"), config.get("percentiles", (1, 99)))
+
+    @property
+    def categorical(self):
+        return self.lut in PALETTES
+
+    def limits(self, values):
+        if self.range is not None:
+            return self.range
+        return percentile_range(values, self.percentiles)
+
+    def colors(self, values):
+        """(N, 3) float32 colors of the values"""
+        lut = get_lut(self.lut)
+        values = np.asarray(values)
+        if self.categorical:
+            return np.take(lut, values.astype(np.int64) % len(lut), axis=0)
+        table = self._value_table(values.dtype)
+        if table is not None:
+            if values.dtype.kind == "i":
+                # the table starts at the smallest value of the type
+                values = values.astype(np.int64) - np.iinfo(values.dtype).min
+            return np.take(table, values, axis=0)
+        # np.take is several times faster than fancy indexing of rows
+        return np.take(lut, lut_indices(values, *self.limits(values)), axis=0)
+
+    def _value_table(self, dtype):
+        if self.range is None or dtype.kind not in "iu" or dtype.itemsize > 2:
+            return None
+        table = self._value_tables.get(dtype)
+        if table is None:
+            info = np.iinfo(dtype)
+            values = np.arange(info.min, info.max + 1)
+            table = np.take(get_lut(self.lut), lut_indices(
+                values, *self.range), axis=0)
+            self._value_tables[dtype] = table
+        return table
+
+    def __call__(self, points):
+        """(N, 3) float32 colors of the points, None without the field"""
+        values = field_values(points, self.field)
+        if values is None:
+            logging.warning("Points have no field {}, fields are {}".format(
+                self.field, points.dtype.names))
+            return None
+        return self.colors(values)
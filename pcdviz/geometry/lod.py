@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+# Copyright 2023 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+  Level of detail of point clouds.
+
+  A cloud above the point budget is first shown strided, which costs
+  nothing, then replaced by a voxel downsampled one that keeps one point
+  per occupied voxel. The voxel size is searched to fit the budget, and
+  with near set it doubles every time the distance doubles past near, so
+  the near field stays dense.
+"""
+
+import math
+
+import numpy as np
+
+from pcdviz.geometry.pointcloud import num_points, positions, select
+
+# Odd primes of the voxel hash, used when the grid does not fit in int64
+_HASH_PRIMES = (73856093, 19349663, 83492791)
+
+
+def stride_indices(num_points, budget):
+    """Every k-th point, at most budget points"""
+    step = max(1, math.ceil(num_points / max(budget, 1)))
+    return np.arange(0, num_points, step)
+
+
+def _voxel_keys(columns, voxel_size, near=None):
+    """int64 key of the voxel of each point, columns is (3, N)"""
+    scale = 1.0 / voxel_size
+    level = np.zeros(columns.shape[1], dtype=np.int64)
+    if near:
+        distance = np.hypot(columns[0], columns[1])
+        level = np.floor(np.log2(np.maximum(distance / near, 1.0)))
+        level = level.astype(np.int64)
+        scale = np.exp2(-level) * scale
+
+    cells = [np.floor(column * scale).astype(np.int64) for column in columns]
+    lows = [c.min() for c in cells]
+    spans = [c.max() - low + 1 for c, low in zip(cells, lows)]
+    keys = level
+    if np.prod(np.array(spans + [level.max() + 1], dtype=np.float64)) < 2**62:
+        for c, low, span in zip(cells, lows, spans):
+            keys = keys * span + (c - low)
+    else:
+        for c, prime in zip(cells, _HASH_PRIMES):
+            keys = keys * 1000003 ^ c * prime
+    return keys
+
+
+def _columns(xyz):
+    return np.ascontiguousarray(np.asarray(xyz, dtype=np.float64)[:, :3].T)
+
+
+def voxel_indices(xyz, voxel_size, near=None):
+    """One point of each occupied voxel, sorted
+
+    Args:
+        xyz (np.ndarray): (N, 3) points
+        voxel_size (float): voxel edge in meters
+        near (float, optional): distance after which the voxel size
+            doubles each time the distance doubles
+    """
+    if not len(xyz):
+        return np.empty(0, dtype=np.int64)
+    keys = _voxel_keys(_columns(xyz), voxel_size, near)
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+    first = order[np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]]
+    first.sort()
+    return first
+
+
+def budget_indices(xyz, budget, voxel_size=None, near=None, max_iter=8):
+    """Voxel downsampled points, at most budget of them
+
+    The voxel size starts from voxel_size, or from the ground area per
+    point, and is rescaled until the number of voxels fits the budget.
+    Only the number of voxels is computed while searching.
+    """
+    num_points = len(xyz)
+    if num_points <= budget:
+        return np.arange(num_points)
+    columns = _columns(xyz)
+    if not voxel_size:
+        extent = np.ptp(columns[:2], axis=1)
+        voxel_size = math.sqrt(max(float(np.prod(extent)), 1e-6) / budget)
+
+    best = None
+    for _ in range(max_iter):
+        keys = np.sort(_voxel_keys(columns, voxel_size, near))
+        count = 1 + int(np.count_nonzero(keys[1:] != keys[:-1]))
+        ratio = count / budget
+        if ratio <= 1 and (best is None or ratio > best[1]):
+            best = (voxel_size, ratio)
+        if 0.85 < ratio <= 1:
+            break
+        voxel_size *= math.sqrt(ratio) * (1.02 if ratio > 1 else 1.0)
+
+    if best is None:
+        indices = voxel_indices(xyz, voxel_size, near)
+        return indices[stride_indices(len(indices), budget)]
+    return voxel_indices(xyz, best[0], near)
+
+
+class LevelOfDetail:
+    """Point budget of the displayed clouds
+
+    Args:
+        budget (int): maximum number of points displayed
+        voxel_size (float, optional): first voxel size tried, in meters
+        near (float, optional): see voxel_indices
+    """
+
+    def __init__(self, budget=500000, voxel_size=None, near=None):
+        self.budget = int(budget)
+        self.voxel_size = voxel_size
+        self.near = near
+
+    @classmethod
+    def from_config(cls, config):
+        """LevelOfDetail of a "lod" config block, None if not set"""
+        if not config or not config.get("budget"):
+            return None
+        return cls(config["budget"], config.get("voxel_size"),
+                   config.get("near"))
+
+    def needs_lod(self, pointcloud, budget=None):
+        return num_points(pointcloud) > (budget or self.budget)
+
+    def coarse(self, pointcloud, budget=None):
+        """Strided cloud, fast enough for every displayed frame"""
+        if not self.needs_lod(pointcloud, budget):
+            return pointcloud
+        return select(pointcloud, stride_indices(
+            num_points(pointcloud), budget or self.budget))
+
+    def refine(self, pointcloud, budget=None):
+        """Voxel downsampled cloud"""
+        if not self.needs_lod(pointcloud, budget):
+            return pointcloud
+        xyz = positions(pointcloud)
+        return select(pointcloud, budget_indices(
+            xyz, budget or self.budget, self.voxel_size, self.near))
@@ -17,9 +17,110 @@
 """
   http://www.open3d.org/docs/release/python_api/open3d.geometry.PointCloud.html#open3d.geometry.PointCloud
 """
-import open3d as o3d
+import numpy as np
 
+from pcdviz import profiler
+from pcdviz.io import lidar
 
-class Pointcloud(o3d.geometry.PointCloud):
-    def __init__(self):
-        pass
+# fields stored as positions, the others become tensor attributes
+_POSITION_FIELDS = ("x", "y", "z")
+
+
+def create_pointcloud(points, tensor=False):
+    """Build a PointCloud from a (structured) point array
+
+    Args:
+        points: structured point array, see pcdviz.io.lidar
+        tensor (bool): build an o3d.t.geometry.PointCloud instead. Its
+            positions stay float32 and every other field, e.g. intensity,
+            is kept as a (N, 1) attribute. Contiguous float32 fields, e.g.
+            x, y, z only records, share their memory with numpy, the
+            fields of interleaved records are gathered once. The legacy
+            PointCloud always converts to float64.
+    """
+    import open3d as o3d
+
+    with profiler.span("pointcloud", points=len(points)):
+        if tensor:
+            return _create_tensor_pointcloud(o3d, points)
+        pcd = o3d.geometry.PointCloud()
+        pcd.points = o3d.utility.Vector3dVector(lidar.xyz(points))
+        return pcd
+
+
+def _to_tensor(o3d, array, dtype=None):
+    """Tensor sharing the memory of array
+
+    Strided arrays, e.g. one field of interleaved records, and arrays of
+    another dtype are copied first, Tensor.from_numpy and DLPack need
+    contiguous memory.
+    """
+    if not array.flags.c_contiguous or \
+            (dtype is not None and array.dtype != dtype):
+        array = np.ascontiguousarray(array, dtype=dtype)
+    return o3d.core.Tensor.from_numpy(array)
+
+
+def _create_tensor_pointcloud(o3d, points):
+    pcd = o3d.t.geometry.PointCloud(
+        _to_tensor(o3d, lidar.xyz(points), np.float32))
+    for name in points.dtype.names or ():
+        if name in _POSITION_FIELDS:
+            continue
+        pcd.point[name] = _to_tensor(o3d, points[name][:, np.newaxis])
+    return pcd
+
+
+def is_tensor(pointcloud):
+    """True for o3d.t.geometry point clouds"""
+    return hasattr(pointcloud, "point")
+
+
+def num_points(pointcloud):
+    if is_tensor(pointcloud):
+        return len(pointcloud.point.positions)
+    return len(pointcloud.points)
+
+
+def positions(pointcloud):
+    """(N, 3) coordinates, a view of the tensor positions"""
+    if is_tensor(pointcloud):
+        return pointcloud.point.positions.numpy()
+    return np.asarray(pointcloud.points)
+
+
+def set_colors(pointcloud, colors):
+    """Set (N, 3) RGB colors in [0, 1]"""
+    import open3d as o3d
+
+    if is_tensor(pointcloud):
+        pointcloud.point.colors = o3d.core.Tensor.from_numpy(
+            np.ascontiguousarray(colors, dtype=np.float32))
+    else:
+        pointcloud.colors = o3d.utility.Vector3dVector(colors)
+
+
+def select(pointcloud, indices):
+    """Point cloud of the points at indices, with all their attributes"""
+    import open3d as o3d
+
+    if is_tensor(pointcloud):
+        return pointcloud.select_by_index(o3d.core.Tensor.from_numpy(
+            np.ascontiguousarray(indices, dtype=np.int64)))
+    selected = o3d.geometry.PointCloud()
+    selected.points = o3d.utility.Vector3dVector(
+        np.asarray(pointcloud.points)[indices])
+    if pointcloud.has_colors():
+        selected.colors = o3d.utility.Vector3dVector(
+            np.asarray(pointcloud.colors)[indices])
+    if pointcloud.has_normals():
+        selected.normals = o3d.utility.Vector3dVector(
+            np.asarray(pointcloud.normals)[indices])
+    return selected
+
+
+def to_legacy(geometry):
+    """Legacy geometry for the open3d Visualizer, others are returned as is"""
+    if is_tensor(geometry):
+        return geometry.to_legacy()
+    return geometry
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+# Copyright 2023 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+  Which points fall inside which oriented boxes, for all boxes at once.
+
+  Points outside the union of the boxes' bounds are dropped first, then
+  a coarse bird's-eye-view grid pairs each box only with the points of
+  the cells its footprint covers. The exact test runs on those candidate
+  pairs in one batched transform into the box frames.
+"""
+
+import numpy as np
+
+from pcdviz.util import expand_ranges
+
+# Colors of the boxes when points are colored by box
+BOX_PALETTE = np.array([[0.90, 0.10, 0.10],
+                        [0.10, 0.60, 0.90],
+                        [0.20, 0.80, 0.20],
+                        [0.95, 0.60, 0.10],
+                        [0.60, 0.30, 0.90],
+                        [0.95, 0.85, 0.10],
+                        [0.10, 0.85, 0.75],
+                        [0.90, 0.30, 0.60]])
+
+# Color of the points outside every box
+BACKGROUND_COLOR = np.array([0.6, 0.6, 0.6])
+
+
+def points_in_boxes(xyz, centers, extents, rotations, cell_size=2.0):
+    """Find all (point, box) pairs with the point inside the box
+
+    Args:
+        xyz (np.ndarray): (N, 3) points
+        centers (np.ndarray): (M, 3) box centers
+        extents (np.ndarray): (M, 3) as (length, width, height)
+        rotations (np.ndarray): (M, 3, 3)
+        cell_size (float): size of the grid cells in meters
+
+    Returns:
+        (np.ndarray, np.ndarray): point indexes and box indexes of the
+            pairs, points in overlapping boxes appear once per box
+    """
+    empty = np.empty(0, dtype=np.int64)
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 3)
+    if not len(centers) or not len(xyz):
+        return empty, empty
+    half = np.asarray(extents, dtype=np.float64).reshape(-1, 3) / 2
+    rotations = np.asarray(rotations, dtype=np.float64).reshape(-1, 3, 3)
+
+    # axis-aligned bounds of every box
+    reach = np.einsum('mij,mj->mi', np.abs(rotations), half)
+    low, high = centers - reach, centers + reach
+
+    # drop the points outside all boxes' bounds
+    candidates = np.ones(len(xyz), dtype=bool)
+    for axis in range(3):
+        values = xyz[:, axis]
+        candidates &= values >= low[:, axis].min()
+        candidates &= values <= high[:, axis].max()
+    point_ids = np.flatnonzero(candidates)
+    if not len(point_ids):
+        return empty, empty
+    xy = xyz[point_ids, :2].astype(np.float64)
+
+    # bird's-eye-view grid, cell keys of the points sorted once
+    origin = low[:, :2].min(axis=0)
+    shape = np.floor((high[:, :2].max(axis=0) - origin) / cell_size)
+    shape = shape.astype(np.int64) + 1
+    cells = np.floor((xy - origin) / cell_size).astype(np.int64)
+    cells = np.clip(cells, 0, shape - 1)
+    keys = cells[:, 0] * shape[1] + cells[:, 1]
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    # cells covered by each box footprint
+    first = np.clip(np.floor((low[:, :2] - origin) / cell_size), 0, None)
+    last = np.floor((high[:, :2] - origin) / cell_size)
+    first = first.astype(np.int64)
+    last = np.minimum(last.astype(np.int64), shape - 1)
+    span = last - first + 1
+    per_box = span[:, 0] * span[:, 1]
+    box_of_cell = np.repeat(np.arange(len(centers)), per_box)
+    local = expand_ranges(np.zeros(len(centers), dtype=np.int64), per_box)
+    cell_x = first[box_of_cell, 0] + local // span[box_of_cell, 1]
+    cell_y = first[box_of_cell, 1] + local % span[box_of_cell, 1]
+    cell_keys = cell_x * shape[1] + cell_y
+
+    # candidate pairs, the points of each covered cell
+    starts = np.searchsorted(sorted_keys, cell_keys, side='left')
+    ends = np.searchsorted(sorted_keys, cell_keys, side='right')
+    lengths = ends - starts
+    pair_box = np.repeat(box_of_cell, lengths)
+    pair_point = point_ids[order[expand_ranges(starts, lengths)]]
+
+    # exact test in the box frames
+    offset = xyz[pair_point].astype(np.float64) - centers[pair_box]
+    local_xyz = np.einsum('nji,nj->ni', rotations[pair_box], offset)
+    inside = np.all(np.abs(local_xyz) <= half[pair_box], axis=1)
+    return pair_point[inside], pair_box[inside]
+
+
+def box_point_counts(xyz, centers, extents, rotations, **kwargs):
+    """Number of points inside each of the M boxes"""
+    _, box_ids = points_in_boxes(xyz, centers, extents, rotations, **kwargs)
+    return np.bincount(box_ids, minlength=len(centers))
+
+
+def point_box_ids(xyz, centers, extents, rotations, **kwargs):
+    """Box of each point, -1 outside every box
+
+    A point inside overlapping boxes gets the highest box index.
+    """
+    point_ids, box_ids = points_in_boxes(
+        xyz, centers, extents, rotations, **kwargs)
+    ids = np.full(len(xyz), -1, dtype=np.int64)
+    ids[point_ids] = box_ids
+    return ids
+
+
+def box_colors(num_boxes):
+    """Palette color of each box"""
+    return BOX_PALETTE[np.arange(num_boxes) % len(BOX_PALETTE)]
+
+
+def point_colors(box_ids):
+    """Color of each point from its box id, see point_box_ids"""
+    colors = np.empty((len(box_ids), 3))
+    colors[:] = BACKGROUND_COLOR
+    inside = box_ids >= 0
+    colors[inside] = BOX_PALETTE[box_ids[inside] % len(BOX_PALETTE)]
+    return colors
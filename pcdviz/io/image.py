@@ -14,16 +14,170 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from PIL import Image
+"""
+  Screen captures and recordings.
+
+  Frames are converted and encoded on a background thread so capturing
+  does not stall the window. The queue is bounded, frames are dropped
+  (and counted) when the encoder falls behind, and writers stream each
+  frame to disk instead of keeping the recording in memory.
+
+  PNG sequences only need Pillow, GIF and videos (mp4, avi ...) use the
+  optional imageio (and imageio-ffmpeg for videos).
+"""
+
+import datetime
+import logging
+import os
+import queue
+import threading
+
 import numpy as np
+from PIL import Image
+
+try:
+    import imageio
+except ImportError:
+    imageio = None
+
+VIDEO_FORMATS = ("gif", "mp4", "avi", "mov", "mkv", "webm")
+
 
+def to_uint8(buffer):
+    """(H, W, 3) uint8 image of a screen buffer
 
-def save_gif(image_datas, gif_file):
-    images = []
-    for image_data in image_datas:
-        data = np.array(image_data)
-        image = Image.frombuffer('RGB', (1920, 1080), data, "raw")
-        images.append(image)
+    The size is taken from the buffer, float buffers from
+    capture_screen_float_buffer are in [0, 1].
+    """
+    data = np.asarray(buffer)
+    if data.dtype != np.uint8:
+        data = (np.clip(data, 0, 1) * 255 + 0.5).astype(np.uint8)
+    if data.ndim == 2:
+        data = np.repeat(data[..., np.newaxis], 3, axis=-1)
+    return data[..., :3]
 
+
+def save_gif(image_datas, gif_file, duration=100):
+    """Save screen buffers as an animated GIF, see GifWriter to stream"""
+    images = [Image.fromarray(to_uint8(data)) for data in image_datas]
     images[0].save(gif_file, save_all=True,
-                   append_images=images[1:], duration=100, loop=0)
+                   append_images=images[1:], duration=duration, loop=0)
+
+
+class PngSequenceWriter:
+    """Frames as <directory>/<prefix>000000.png ..."""
+
+    def __init__(self, directory, prefix=""):
+        self.directory = directory
+        self.prefix = prefix
+        self.count = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, image):
+        file_name = "{}{:06d}.png".format(self.prefix, self.count)
+        Image.fromarray(image).save(os.path.join(self.directory, file_name))
+        self.count += 1
+
+    def close(self):
+        pass
+
+
+class SnapshotWriter:
+    """Each frame as <directory>/<capture time>.png"""
+
+    def __init__(self, directory="."):
+        self.directory = directory
+
+    def write(self, image):
+        file_name = "{}.png".format(datetime.datetime.now())
+        Image.fromarray(image).save(os.path.join(self.directory, file_name))
+
+    def close(self):
+        pass
+
+
+class ImageioWriter:
+    """GIF or video file, frames are appended as they come"""
+
+    def __init__(self, file_path, fps=10):
+        if imageio is None:
+            raise ImportError(
+                "Recording {} needs imageio, pip install imageio "
+                "imageio-ffmpeg".format(file_path))
+        if file_path.lower().endswith(".gif"):
+            kwargs = {"duration": 1000 / fps, "loop": 0}
+        else:
+            kwargs = {"fps": fps}
+        self._writer = imageio.get_writer(file_path, mode='I', **kwargs)
+
+    def write(self, image):
+        self._writer.append_data(image)
+
+    def close(self):
+        self._writer.close()
+
+
+def open_writer(path, fps=10):
+    """Writer of a recording, chosen from the path
+
+    A path ending with one of VIDEO_FORMATS is a GIF or video file, any
+    other path is a directory of PNG frames. Without imageio a GIF or video
+    is recorded as PNG frames next to it.
+    """
+    ext = os.path.splitext(path)[1][1:].lower()
+    if ext not in VIDEO_FORMATS:
+        return PngSequenceWriter(path)
+    try:
+        return ImageioWriter(path, fps)
+    except ImportError as e:
+        directory = os.path.splitext(path)[0]
+        logging.error("{}, record PNG frames to {}".format(e, directory))
+        return PngSequenceWriter(directory)
+
+
+class BackgroundEncoder:
+    """Hand screen buffers to a writer running on its own thread
+
+    Args:
+        writer: object with write(image) and close()
+        max_queue (int): frames waiting to be encoded, new frames are
+            dropped when it is full
+    """
+
+    def __init__(self, writer, max_queue=8):
+        self.writer = writer
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, buffer):
+        """Queue a frame, returns False if it was dropped
+
+        The buffer is kept as is and converted on the encoder thread,
+        capture_screen_float_buffer returns a new image for every call.
+        """
+        try:
+            self._queue.put_nowait(buffer)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def _run(self):
+        while True:
+            buffer = self._queue.get()
+            if buffer is None:
+                break
+            try:
+                self.writer.write(to_uint8(buffer))
+                self.written += 1
+            except Exception as e:
+                logging.error("Write frame failed! {}".format(e))
+
+    def close(self):
+        """Encode the queued frames and close the writer"""
+        self._queue.put(None)
+        self._thread.join()
+        self.writer.close()
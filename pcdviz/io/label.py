@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+# Copyright 2023 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+from pathlib import Path
+
+import numpy as np
+
+from pcdviz import profiler
+
+
+def read_table(file_path, min_columns=1):
+    """Read a space separated label file, one object per line
+
+    The first column is the object type and the others are numbers. Lines
+    shorter than the longest one are padded with NaN, e.g. ground truth
+    mixed with scored predictions.
+
+    Args:
+        file_path (str): label file
+        min_columns (int): number of columns returned at least, missing
+            ones are NaN
+
+    Returns:
+        (np.ndarray, np.ndarray): types (N,) and values (N, M - 1) float32,
+            None, None if the file does not exist
+    """
+    if not Path(file_path).exists():
+        logging.error("File not exist! {}".format(file_path))
+        return None, None
+
+    with profiler.span("read_label") as span:
+        with open(file_path, 'r') as f:
+            text = f.read()
+        rows = [line.split() for line in text.splitlines()]
+        rows = [row for row in rows if row]
+        width = max([len(row) for row in rows] + [min_columns])
+
+        if all(len(row) == width for row in rows):
+            tokens = np.array(rows, dtype=str).reshape(len(rows), width)
+        else:
+            tokens = np.full((len(rows), width), 'nan', dtype=object)
+            for i, row in enumerate(rows):
+                tokens[i, :len(row)] = row
+            tokens = tokens.astype(str)
+        span.set(bytes=len(text), boxes=len(rows))
+
+        return tokens[:, 0], tokens[:, 1:].astype(np.float32)
+
+
+def encode_types(types, type_ids):
+    """Map type names to integer codes, 0 for unknown types"""
+    names, inverse = np.unique(types, return_inverse=True)
+    codes = np.array([type_ids.get(name, 0) for name in names],
+                     dtype=np.int32)
+    return codes[inverse.reshape(-1)]
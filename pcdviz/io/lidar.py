@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+# Copyright 2023 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+  Memory-mapped readers for raw LiDAR sweeps.
+
+  Sweeps are mapped with a structured dtype, so every field is a zero-copy
+  view of the file and only the pages that are touched get read.
+"""
+
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+
+from pcdviz import profiler
+
+# Known point fields and their on-disk type
+FIELD_TYPES = {
+    "x": np.float32,
+    "y": np.float32,
+    "z": np.float32,
+    "intensity": np.float32,
+    "ring": np.float32,
+    "time": np.float32,
+}
+
+# Default field layout of each dataset
+DATASET_FIELDS = {
+    "kitti": ("x", "y", "z", "intensity"),
+    "nuscenes": ("x", "y", "z", "intensity", "ring"),
+    "custom": ("x", "y", "z", "intensity"),
+}
+
+# Column layout used when only the number of fields is known
+_ORDERED_FIELDS = ("x", "y", "z", "intensity", "ring", "time")
+
+
+def make_dtype(fields=None):
+    """Build the structured dtype of a point record
+
+    Args:
+        fields: None, a column count (int or digit string), a dataset name
+            in `DATASET_FIELDS`, a comma separated string like
+            "x,y,z,intensity" or "x:f4,y:f4,z:f4,time:f8", or a list of
+            names / (name, type) pairs.
+
+    Returns:
+        np.dtype: structured dtype with one entry per field
+    """
+    if fields is None:
+        fields = DATASET_FIELDS["custom"]
+    elif isinstance(fields, np.dtype):
+        return fields
+
+    if isinstance(fields, str):
+        if fields.isdigit():
+            fields = int(fields)
+        elif fields.lower() in DATASET_FIELDS:
+            fields = DATASET_FIELDS[fields.lower()]
+        else:
+            fields = [f.strip() for f in fields.split(',') if f.strip()]
+
+    # Only the column count is known, take the extra ones as float32
+    if isinstance(fields, int):
+        names = list(_ORDERED_FIELDS[:fields])
+        names += ["f{}".format(i) for i in range(len(names), fields)]
+        fields = names
+
+    descr = []
+    for field in fields:
+        if isinstance(field, (tuple, list)):
+            name, field_type = field
+        elif ':' in field:
+            name, field_type = field.split(':', 1)
+        else:
+            name, field_type = field, FIELD_TYPES.get(field, np.float32)
+        descr.append((name, np.dtype(field_type)))
+    return np.dtype(descr)
+
+
+def read_bin(file_path, fields=None, mmap=True):
+    """Read a raw binary sweep as a structured array
+
+    Args:
+        file_path (str): path of the .bin file
+        fields: field layout, see `make_dtype`
+        mmap (bool): memory-map the file instead of reading it
+
+    Returns:
+        np.ndarray: structured array with one record per point, or None if
+            the file does not exist
+    """
+    if not Path(file_path).exists():
+        logging.error("File not exist! {}".format(file_path))
+        return None
+
+    dtype = make_dtype(fields)
+    with profiler.span("read_points") as span:
+        size = os.path.getsize(file_path)
+        if size % dtype.itemsize:
+            logging.warning(
+                "{} is not a multiple of {} bytes, tail dropped".format(
+                    file_path, dtype.itemsize))
+        count = size // dtype.itemsize
+        span.set(bytes=count * dtype.itemsize, points=count)
+        # np.memmap can not map an empty file
+        if count == 0:
+            return np.empty(0, dtype=dtype)
+        if mmap:
+            return np.memmap(file_path, dtype=dtype, mode='r',
+                             shape=(count,))
+        return np.fromfile(file_path, dtype=dtype, count=count)
+
+
+def field_view(points, names):
+    """Return a (N, len(names)) zero-copy view over adjacent fields
+
+    The fields must share a type and be stored next to each other, which
+    holds for x, y, z in every supported layout. Falls back to a copy
+    otherwise.
+    """
+    if points.dtype.names is None:
+        return points[:, :len(names)]
+
+    first = points.dtype.fields[names[0]]
+    field_type, offset = first[0], first[1]
+    contiguous = points.flags.c_contiguous and all(
+        points.dtype.fields[name][0] == field_type and
+        points.dtype.fields[name][1] == offset + i * field_type.itemsize
+        for i, name in enumerate(names))
+    if not contiguous:
+        return np.stack([points[name] for name in names], axis=-1)
+
+    return np.ndarray(shape=(len(points), len(names)), dtype=field_type,
+                      buffer=points, offset=offset,
+                      strides=(points.strides[0], field_type.itemsize))
+
+
+def xyz(points):
+    """Zero-copy (N, 3) view of the point coordinates"""
+    return field_view(points, ("x", "y", "z"))
+
+
+def field(points, name):
+    """Return one field of the points, None if it is not present"""
+    if points.dtype.names is None:
+        index = _ORDERED_FIELDS.index(name) if name in _ORDERED_FIELDS else -1
+        if 0 <= index < points.shape[1]:
+            return points[:, index]
+        return None
+    if name not in points.dtype.names:
+        return None
+    return points[name]
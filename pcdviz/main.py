@@ -19,100 +19,191 @@ import logging
 import os
 import site
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from pcdviz import profiler
 from pcdviz.config.config import Config
-from pcdviz.dataset.custom_dataset import CustomDataset
-from pcdviz.dataset.kitti import KITTI
-from pcdviz.dataset.nuscenes import Nuscenes
-from pcdviz.visualizer import Visualizer
+
+# open3d, the datasets and the subcommands are imported by the code that
+# uses them, so "pcdviz --help" and batch runs start quickly.
 
 
 def _get_file_type(file_path: str) -> str:
     return os.path.splitext(file_path)[1]
 
 
-def display_pointcloud(file_path, fields):
+def display_pointcloud(file_path, fields, color=None):
     if not Path(file_path).exists():
         logging.error("File not exist! {}".format(file_path))
         return None
+    from pcdviz.dataset.custom_dataset import CustomDataset
+    from pcdviz.visualizer import Visualizer
 
     vis = Visualizer()
     file_type = _get_file_type(file_path)[1:]
-    pointcloud = CustomDataset.create_pointcloud(file_path, file_type, fields)
+    pointcloud = CustomDataset.create_pointcloud(file_path, file_type, fields,
+                                                 color)
     vis.visualize(pointcloud)
 
 def display_image(file_path):
     if not Path(file_path).exists():
         logging.error("File not exist! {}".format(file_path))
         return
+    from pcdviz.dataset.custom_dataset import CustomDataset
+    from pcdviz.visualizer import Visualizer
 
     vis = Visualizer()
     img = CustomDataset.create_image(file_path)
     vis.visualize(img)
 
-def display_frame(config):
-    vis = Visualizer()
+def load_calib(config):
+    """Output of the calib callback, passed to the other callbacks"""
+    calib = config.calib
+    callback = config.callback(calib)
+    if callback is None:
+        return None
+    return callback(calib.get("path"))
+
+
+def load_input(input, config, filters, calib=None):
+    """Geometries of one entry of the inputs block"""
+    from pcdviz.dataset.custom_dataset import CustomDataset
+
+    # outputs of earlier callbacks
+    inputs = {} if calib is None else {"calib": calib}
+
+    input_type = input.get("name")
+    if input_type == "pointcloud":
+        lidar_file = input.get("path")
+        file_type = input.get("type")
+        fields = input.get("fields")
+        color = input.get("color")
+        transform = input.get("transform")
+        tensor = bool(input.get("tensor"))
+
+        geometry = CustomDataset.create_pointcloud(
+            lidar_file=lidar_file, file_type=file_type, fields=fields,
+            color=color, transform=transform, filters=filters, tensor=tensor)
+        return [geometry]
+    elif input_type in ("bounding_box", "calib"):
+        # used by the image and box callbacks
+        return []
+    elif input_type == "image":
+        # image
+        image_file = input.get("path")
+        # bounding_box
+        bounding_box = config.bounding_box
+        label_file = bounding_box.get("path")
+        callback = config.callback(bounding_box)
+        labels = callback(label_file, **inputs) if callback else None
+
+        # Use image and bounding_box labels for 2D display
+        geometry = CustomDataset.create_image(image_file, labels)
+        return [geometry]
+    elif input_type == "oriented_bounding_box":
+        label_file = input.get("path")
+        format = input.get("format")
+        color = input.get("color")
+        transform = input.get("transform")
+        scale = input.get("scale")
+
+        return CustomDataset.create_oriented_bounding_box(
+            label_file=label_file, format=format, color=color,
+            transform=transform, scale=scale, filters=filters,
+            callback=config.callback(input), **inputs)
+    logging.error("Skip unknown input type! {}".format(input_type))
+    return []
+
 
+def _load_input(i, config, filters, calib):
+    with profiler.span("load_input", input=i):
+        return load_input(config.inputs[i], config, filters, calib)
+
+
+def gather_inputs(inputs, futures):
+    """Geometries of the loaded inputs, in the order of the inputs block
+
+    An input that failed is logged and left out.
+    """
     geometries = []
-    for input in config.inputs:
-        input_type = input.get("name")
-        if input_type == "pointcloud":
-            lidar_file = input.get("path")
-            file_type = input.get("type")
-            fields = input.get("fields")
-            color = input.get("color")
-            transform = input.get("transform")
-
-            geometry = CustomDataset.create_pointcloud(
-                lidar_file=lidar_file, file_type=file_type, fields=fields,
-                color=color, transform=transform)
-            geometries.append(geometry)
-        elif input_type == "bounding_box":
-            # Do nothing
-            pass
-        elif input_type == "image":
-            # image
-            image_file = input.get("path")
-            # bounding_box
-            bounding_box = config.bounding_box
-            label_file = bounding_box.get("path")
-            callback = bounding_box.get("callback")
-
-            local_params = {}
-            exec(callback, {'file_name': label_file}, local_params)
-            labels = local_params["labels"]
-
-            # Use image and bounding_box labels for 2D display
-            geometry = CustomDataset.create_image(image_file, labels)
-            geometries.append(geometry)
-        elif input_type == "oriented_bounding_box":
-            label_file = input.get("path")
-            format = input.get("format")
-            color = input.get("color")
-            transform = input.get("transform")
-            scale = input.get("scale")
-
-            geometry = CustomDataset.create_oriented_bounding_box(
-                label_file=label_file, format=format, color=color,
-                transform=transform, scale=scale)
-            geometries.extend(geometry)
-        else:
-            logging.error("Skip unknown input type! {}".format(input_type))
+    for input, future in zip(inputs, futures):
+        try:
+            geometries.extend(future.result())
+        except Exception as e:
+            logging.error("Load input {} {} failed! {}".format(
+                input.get("name"), input.get("path"), e))
+    return geometries
+
+
+def display_frame(config, record=None):
+    from pcdviz.filter.pipeline import FilterPipeline
+    from pcdviz.geometry.lod import LevelOfDetail
+    from pcdviz.visualizer import Visualizer
+
+    filters = FilterPipeline.from_config(config.filters)
+    inputs = config.inputs
+    try:
+        calib = load_calib(config)
+    except Exception as e:
+        logging.error("Load calib failed! {}".format(e))
+        calib = None
+    # file reads and parsing release the GIL, the inputs load together
+    # while the window opens
+    with ThreadPoolExecutor(max_workers=max(min(len(inputs), 8), 1),
+                            thread_name_prefix="pcdviz-input") as executor:
+        futures = [executor.submit(_load_input, i, config, filters, calib)
+                   for i in range(len(inputs))]
+        vis = Visualizer(LevelOfDetail.from_config(config.lod))
+        if record:
+            vis.record(record)
+        geometries = gather_inputs(inputs, futures)
     vis.visualize(geometries)
 
 
-def display_dataset(config):
+def _get_frame_index(dataset, frame):
+    """frame is an index (negative counts from the end) or a frame key"""
+    if frame is None:
+        return 0
+    try:
+        index = int(frame)
+    except ValueError:
+        return dataset.index(frame)
+    return index + len(dataset) if index < 0 else index
+
+
+def display_dataset(config, frame=None, query=None, record=None):
+    from pcdviz.dataset.factory import create_dataset
+    from pcdviz.geometry.lod import LevelOfDetail
+    from pcdviz.visualizer import Visualizer
+
     dataset_conf = config.dataset
-    dataset_name = dataset_conf.get("name")
-    dataset_path = dataset_conf.get("path")
-    if dataset_name == "KITTI":
-        dataset = KITTI(dataset_path)
-    elif dataset_name == "nuScenes":
-        dataset = Nuscenes(dataset_path)
+    dataset = create_dataset(config)
+    if dataset is None:
+        return
 
-    vis = Visualizer()
-    vis.visualize_dataset(dataset)
+    query = query or dataset_conf.get("query")
+    if query:
+        try:
+            dataset = dataset.query(query)
+        except ValueError as e:
+            logging.error(e)
+            return
+        print("{} frames match {}".format(len(dataset), query))
+        if not len(dataset):
+            return
+
+    try:
+        start = _get_frame_index(dataset, frame)
+    except KeyError:
+        logging.error("Frame not exist! {}".format(frame))
+        return
+
+    vis = Visualizer(LevelOfDetail.from_config(config.lod))
+    if record:
+        vis.record(record)
+    vis.visualize_dataset(dataset, dataset_conf.get("prefetch"),
+                          dataset_conf.get("cache_mb", 1024), start)
 
 
 def reset_working_dir():
@@ -129,6 +220,15 @@ def reset_working_dir():
 
 
 def main(args=sys.argv):
+    if args[1:2] == ["render"]:
+        from pcdviz import render
+        render.main(args[1:])
+        return
+    if args[1:2] == ["stats"]:
+        from pcdviz.statistics import statistics
+        statistics.main(args[1:])
+        return
+
     parser = argparse.ArgumentParser(
         description="point cloud viz.", prog="main.py")
 
@@ -140,12 +240,34 @@ def main(args=sys.argv):
         help="")
     parser.add_argument(
         "-f", "--fields", action="store", type=str, required=False,
-        help="")
+        help="Point fields, e.g. 5, nuscenes or x,y,z,intensity,ring")
+    parser.add_argument(
+        "--color", action="store", type=str, required=False,
+        help="Color the --pcd points by a field, e.g. intensity, height, "
+             "range or ring")
 
     parser.add_argument(
         "-c", "--cfg", action="store", type=str, required=False,
         help="")
 
+    parser.add_argument(
+        "--frame", action="store", type=str, required=False,
+        help="Dataset frame to start from, index or frame id")
+    parser.add_argument(
+        "-q", "--query", action="store", type=str, required=False,
+        help="Only display the dataset frames matching a label query, "
+             "e.g. \"Pedestrian > 3\"")
+
+    parser.add_argument(
+        "-r", "--record", action="store", type=str, required=False,
+        help="Record the displayed frames, e.g. out.gif, out.mp4 or a "
+             "directory of PNG frames")
+
+    parser.add_argument(
+        "--profile", action="store", type=str, required=False,
+        help="Write the time of each frame and stage to a Chrome trace, "
+             "e.g. profile.json, and print p50/p95 per stage")
+
     parser.add_argument(
         "--example", action="store", type=bool, required=False,
         nargs='?', const=True, help="Example mode")
@@ -156,9 +278,19 @@ def main(args=sys.argv):
     if args.example:
         reset_working_dir()
 
+    if args.profile:
+        profiler.enable()
+    try:
+        display(args)
+    finally:
+        if args.profile:
+            save_profile(profiler.disable(), args.profile)
+
+
+def display(args):
     # 1. display pointcloud then return
     if args.pcd:
-        display_pointcloud(args.pcd, args.fields)
+        display_pointcloud(args.pcd, args.fields, args.color)
         return
     if args.img:
         display_image(args.img)
@@ -167,6 +299,17 @@ def main(args=sys.argv):
     # 2. display pointcloud and labels
     config = Config(args.cfg)
     if config.dataset:
-        display_dataset(config)
+        display_dataset(config, args.frame, args.query, args.record)
     elif config.inputs:
-        display_frame(config)
+        display_frame(config, args.record)
+
+
+def save_profile(profile, file_path):
+    print(profile.format_summary())
+    try:
+        profile.save(file_path)
+    except OSError as e:
+        logging.error("Save profile failed! {}".format(e))
+        return
+    print("Profile saved to {}, open it in chrome://tracing or "
+          "https://ui.perfetto.dev".format(file_path))
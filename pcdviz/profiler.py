@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+
+# Copyright 2023 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+  Per-frame and per-stage timings, "pcdviz --profile".
+
+  Code marks its stages with
+
+      with profiler.span("read_points") as span:
+          ...
+          span.set(bytes=size, points=count)
+
+  While no profiler is enabled span() returns a shared object whose
+  methods do nothing, so marked code costs one function call. Spans nest
+  per thread, a span opened with frame=key tags the spans inside it, e.g.
+  the reads of a frame decoded on a prefetch thread.
+"""
+
+import json
+import threading
+import time
+
+_profiler = None
+_local = threading.local()
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **counts):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "frame", "counts", "start", "parent")
+
+    def __init__(self, profiler, name, frame, counts):
+        self.profiler = profiler
+        self.name = name
+        self.frame = frame
+        self.counts = counts
+
+    def __enter__(self):
+        self.parent = getattr(_local, "frame", None)
+        if self.frame is None:
+            self.frame = self.parent
+        else:
+            _local.frame = self.frame
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        _local.frame = self.parent
+        thread = threading.get_ident()
+        profiler = self.profiler
+        if thread not in profiler.thread_names:
+            profiler.thread_names[thread] = threading.current_thread().name
+        # list.append is atomic, spans of all threads share the list
+        profiler.events.append((self.name, self.start, end - self.start,
+                                thread, self.frame, self.counts))
+        return False
+
+    def set(self, **counts):
+        self.counts.update(counts)
+
+
+def span(name, frame=None, **counts):
+    """Time a stage, see the module doc
+
+    Args:
+        name (str): stage name
+        frame (optional): key of the frame, inherited by nested spans
+        counts: e.g. bytes, points or boxes of the stage
+    """
+    if _profiler is None:
+        return _NULL_SPAN
+    return _Span(_profiler, name, frame, counts)
+
+
+def enable():
+    """Start recording spans, returns the Profiler"""
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+    return _profiler
+
+
+def disable():
+    """Stop recording spans, returns the Profiler or None"""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+
+def enabled():
+    return _profiler is not None
+
+
+class Profiler:
+    """Spans recorded while enabled"""
+
+    def __init__(self):
+        self.origin = time.perf_counter_ns()
+        # (name, start ns, duration ns, thread id, frame, counts)
+        self.events = []
+        self.thread_names = {}
+
+    def summary(self):
+        """{stage: count, total_ms, p50_ms, p95_ms, max_ms and count sums}"""
+        import numpy as np
+
+        stages = {}
+        for name, _, duration, _, _, counts in self.events:
+            stage = stages.setdefault(name, {"durations": [], "counts": {}})
+            stage["durations"].append(duration)
+            for key, value in counts.items():
+                stage["counts"][key] = stage["counts"].get(key, 0) + value
+
+        summary = {}
+        for name, stage in stages.items():
+            durations = np.array(stage["durations"], dtype=np.float64) / 1e6
+            p50, p95 = np.percentile(durations, [50, 95])
+            summary[name] = dict(
+                count=len(durations), total_ms=float(durations.sum()),
+                p50_ms=float(p50), p95_ms=float(p95),
+                max_ms=float(durations.max()), **stage["counts"])
+        return summary
+
+    def frames(self):
+        """{frame: {stage: total ms}} of the spans tagged with a frame"""
+        frames = {}
+        for name, _, duration, _, frame, _ in self.events:
+            if frame is None:
+                continue
+            stages = frames.setdefault(str(frame), {})
+            stages[name] = stages.get(name, 0.0) + duration / 1e6
+        return frames
+
+    def trace_events(self):
+        """Chrome trace "complete" events, see chrome://tracing"""
+        threads = {}
+        events = []
+        for name, start, duration, thread, frame, counts in self.events:
+            tid = threads.setdefault(thread, len(threads))
+            args = dict(counts)
+            if frame is not None:
+                args["frame"] = str(frame)
+            events.append({"name": name, "cat": "pcdviz", "ph": "X",
+                           "ts": (start - self.origin) / 1000,
+                           "dur": duration / 1000,
+                           "pid": 0, "tid": tid, "args": args})
+        for thread, tid in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": 0,
+                           "tid": tid, "args": {
+                               "name": self.thread_names[thread]}})
+        return events
+
+    def save(self, file_path):
+        """Write the Chrome trace with the summary and the frame stages"""
+        with open(file_path, 'w') as f:
+            json.dump({"traceEvents": self.trace_events(),
+                       "displayTimeUnit": "ms",
+                       "summary": self.summary(),
+                       "frames": self.frames()}, f)
+
+    def format_summary(self):
+        summary = self.summary()
+        columns = sorted({key for stage in summary.values()
+                          for key in stage} - {
+            "count", "total_ms", "p50_ms", "p95_ms", "max_ms"})
+        header = "{:<20}{:>8}{:>12}{:>10}{:>10}{:>10}".format(
+            "stage", "count", "total ms", "p50 ms", "p95 ms", "max ms")
+        lines = [header + "".join("{:>14}".format(c) for c in columns)]
+        for name, stage in sorted(summary.items(),
+                                  key=lambda item: -item[1]["total_ms"]):
+            line = "{:<20}{:>8}{:>12.1f}{:>10.2f}{:>10.2f}{:>10.2f}".format(
+                name, stage["count"], stage["total_ms"], stage["p50_ms"],
+                stage["p95_ms"], stage["max_ms"])
+            lines.append(line + "".join(
+                "{:>14}".format(stage.get(c, "")) for c in columns))
+        return "\n".join(lines)
@@ -13,3 +13,191 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+
+"""
+  Bird's-eye-view rasters of a point cloud.
+
+  Image rows go along -x and columns along -y, so the vehicle heads up
+  and its left is on the left. Points are binned with one flat cell index
+  and reduced with bincount / fmax.at, boxes are drawn as sampled edges.
+"""
+
+import math
+
+import numpy as np
+
+from pcdviz.geometry.box import box_corners
+from pcdviz.io import lidar
+from pcdviz.util import COLOR_MAP, expand_ranges
+
+# Bottom face edges of UNIT_CORNERS, 0-1 is the front
+_BOTTOM_EDGES = np.array([[0, 1], [1, 2], [2, 3], [3, 0]])
+
+# Cell counts mapped to 1 by the density raster
+MAX_DENSITY = 64
+
+
+def clip_segments(starts, ends, shape):
+    """Clip N (row, col) segments to an image (Liang-Barsky)
+
+    Returns:
+        (np.ndarray, np.ndarray, np.ndarray): clipped starts and ends, and
+            the mask of the segments crossing the image
+    """
+    delta = ends - starts
+    t0, t1 = np.zeros(len(starts)), np.ones(len(starts))
+    keep = np.all(np.isfinite(starts) & np.isfinite(ends), axis=1)
+    for axis, limit in enumerate(shape[:2]):
+        for p, q in ((-delta[:, axis], starts[:, axis]),
+                     (delta[:, axis], limit - 1 - starts[:, axis])):
+            # p * t <= q
+            keep &= (p != 0) | (q >= 0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                r = q / p
+            t0 = np.where(p < 0, np.maximum(t0, r), t0)
+            t1 = np.where(p > 0, np.minimum(t1, r), t1)
+    keep &= t0 <= t1
+    return (starts + t0[:, np.newaxis] * delta,
+            starts + t1[:, np.newaxis] * delta, keep)
+
+
+def draw_segments(image, starts, ends, color):
+    """Draw N segments of (row, col) pixel coordinates in place"""
+    starts = np.asarray(starts, dtype=np.float64).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=np.float64).reshape(-1, 2)
+    starts, ends, keep = clip_segments(starts, ends, image.shape)
+    starts, ends = starts[keep], ends[keep]
+    if not len(starts):
+        return image
+
+    # one sample per pixel of each segment
+    counts = np.ceil(np.abs(ends - starts).max(axis=1)).astype(np.int64) + 1
+    segment = np.repeat(np.arange(len(starts)), counts)
+    step = expand_ranges(np.zeros(len(starts), dtype=np.int64), counts)
+    t = step / np.maximum(counts - 1, 1)[segment]
+    pixels = starts[segment] + t[:, np.newaxis] * \
+        (ends - starts)[segment]
+    pixels = np.rint(pixels).astype(np.int64)
+    image[pixels[:, 0], pixels[:, 1]] = color
+    return image
+
+
+class BEV:
+    """Rasterize point clouds and boxes seen from above
+
+    Args:
+        extent (list): [xmin, ymin, xmax, ymax] in meters
+        resolution (float): cell size in meters
+        height (list, optional): [zmin, zmax] of the points kept and of
+            the height normalization
+    """
+
+    def __init__(self, extent=(-50, -50, 50, 50), resolution=0.1,
+                 height=(-3, 1)):
+        self.extent = np.asarray(extent, dtype=np.float64)
+        self.resolution = float(resolution)
+        self.height = np.asarray(height, dtype=np.float64)
+        xmin, ymin, xmax, ymax = self.extent
+        self.shape = (int(math.ceil((xmax - xmin) / self.resolution)),
+                      int(math.ceil((ymax - ymin) / self.resolution)))
+
+    def to_pixels(self, xy):
+        """(row, col) float pixel coordinates of (N, 2) lidar xy"""
+        xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+        rows = (self.extent[2] - xy[:, 0]) / self.resolution
+        cols = (self.extent[3] - xy[:, 1]) / self.resolution
+        return np.stack([rows, cols], axis=1)
+
+    def cells(self, xyz):
+        """Flat cell index of the points in the raster, and their mask"""
+        x, y, z = xyz[:, 0], xyz[:, 1], xyz[:, 2]
+        xmin, ymin, xmax, ymax = self.extent
+        mask = (x >= xmin) & (x < xmax) & (y >= ymin) & (y < ymax) & \
+            (z >= self.height[0]) & (z <= self.height[1])
+        rows = ((xmax - x[mask]) / self.resolution).astype(np.int64)
+        cols = ((ymax - y[mask]) / self.resolution).astype(np.int64)
+        np.minimum(rows, self.shape[0] - 1, out=rows)
+        np.minimum(cols, self.shape[1] - 1, out=cols)
+        return rows * self.shape[1] + cols, mask
+
+    def rasterize(self, points):
+        """Height, intensity and density rasters of the points
+
+        Args:
+            points: structured point array, see pcdviz.io.lidar
+
+        Returns:
+            dict: (H, W) float32 "height" (max z, NaN if empty),
+                "intensity" (mean, NaN if empty or no intensity field) and
+                "density" (number of points)
+        """
+        xyz = lidar.xyz(points)
+        flat, mask = self.cells(xyz)
+        size = self.shape[0] * self.shape[1]
+
+        density = np.bincount(flat, minlength=size).astype(np.float32)
+        # fmax ignores the NaN of the empty cells
+        height = np.full(size, np.nan, dtype=np.float32)
+        np.fmax.at(height, flat, xyz[mask, 2])
+
+        intensity = np.full(size, np.nan, dtype=np.float32)
+        names = getattr(points.dtype, "names", None) or ()
+        if "intensity" in names:
+            total = np.bincount(flat, lidar.field(points, "intensity")[mask],
+                                minlength=size)
+            with np.errstate(invalid='ignore'):
+                np.divide(total, density, out=intensity, casting='same_kind')
+
+        return {"height": height.reshape(self.shape),
+                "intensity": intensity.reshape(self.shape),
+                "density": density.reshape(self.shape)}
+
+    def to_image(self, rasters):
+        """RGB uint8 image, R density, G height and B intensity"""
+        low, high = self.height
+        intensity = rasters["intensity"]
+        scale = np.nanmax(intensity) if np.isfinite(intensity).any() else 1
+        channels = (np.log1p(rasters["density"]) / np.log(MAX_DENSITY),
+                    (rasters["height"] - low) / (high - low),
+                    intensity / max(scale, 1e-6))
+
+        image = np.empty(self.shape + (3,), dtype=np.uint8)
+        for i, channel in enumerate(channels):
+            # fmax / fmin also map the NaN of empty cells to 0
+            channel = np.fmin(np.fmax(channel, 0, dtype=np.float32), 1)
+            image[..., i] = channel * 255
+        return image
+
+    def draw_boxes(self, image, labels, color=COLOR_MAP["red"]):
+        """Draw the footprint and heading of the label boxes in place
+
+        Args:
+            image (np.ndarray): (H, W, 3) uint8
+            labels (dict): box columns, see BaseDataset
+            color: RGB color in [0, 1]
+        """
+        if labels is None or not len(labels["type"]):
+            return image
+        corners = box_corners(
+            np.asarray(labels["center"], dtype=np.float64).reshape(-1, 3),
+            np.asarray(labels["extent"], dtype=np.float64).reshape(-1, 3),
+            np.asarray(labels["R"], dtype=np.float64).reshape(-1, 3, 3))
+        pixels = self.to_pixels(corners[:, :4, :2].reshape(-1, 2))
+        pixels = pixels.reshape(-1, 4, 2)
+
+        # footprint, then a line from the center to the front edge
+        starts = pixels[:, _BOTTOM_EDGES[:, 0]].reshape(-1, 2)
+        ends = pixels[:, _BOTTOM_EDGES[:, 1]].reshape(-1, 2)
+        centers = pixels.mean(axis=1)
+        fronts = pixels[:, :2].mean(axis=1)
+        starts = np.concatenate([starts, centers])
+        ends = np.concatenate([ends, fronts])
+        rgb = (np.asarray(color, dtype=np.float64) * 255).astype(np.uint8)
+        return draw_segments(image, starts, ends, rgb)
+
+    def render(self, points, labels=None, predictions=None):
+        """BEV image of a frame, labels in red and predictions in blue"""
+        image = self.to_image(self.rasterize(points))
+        self.draw_boxes(image, labels, COLOR_MAP["red"])
+        self.draw_boxes(image, predictions, COLOR_MAP["blue"])
+        return image
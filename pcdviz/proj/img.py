@@ -13,3 +13,162 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+
+"""
+  Lidar points and boxes drawn on camera images.
+
+  All points go through one composed lidar -> image matrix. The depth row
+  is computed first and points behind the near plane are culled before
+  the image coordinates, then the ones outside the image. Each pixel
+  keeps its nearest point (z-buffer).
+"""
+
+import functools
+
+import numpy as np
+
+from pcdviz.geometry.box import BOX_LINES, box_corners
+from pcdviz.geometry.colormap import get_lut, lut_indices
+from pcdviz.io import lidar
+from pcdviz.proj.bev import draw_segments
+from pcdviz.util import COLOR_MAP
+
+
+@functools.lru_cache(maxsize=None)
+def _uint8_lut(name):
+    return (get_lut(name) * 255).astype(np.uint8)
+
+
+def ramp_colors(values, low=None, high=None, lut="jet"):
+    """uint8 RGB colors of values from near / low to far / high"""
+    values = np.asarray(values)
+    if not len(values):
+        return np.empty((0, 3), dtype=np.uint8)
+    low = values.min() if low is None else low
+    high = values.max() if high is None else high
+    return np.take(_uint8_lut(lut), lut_indices(values, low, high), axis=0)
+
+
+class CameraProjection:
+    """Project lidar points to the pixels of a camera
+
+    Args:
+        matrix (np.ndarray): 3x4 or 4x4 lidar -> image matrix, the third
+            row gives the depth
+        image_size (tuple): (height, width) of the image
+        near (float): nearest depth kept in meters
+    """
+
+    def __init__(self, matrix, image_size, near=0.1):
+        self.matrix = np.asarray(matrix, dtype=np.float64)[:3]
+        self.image_size = tuple(int(v) for v in image_size[:2])
+        self.near = near
+
+    @classmethod
+    def from_kitti(cls, calib, image_size, camera=2, near=0.1):
+        """Projection to KITTI camera P<camera>, see KITTI.read_calib"""
+        matrix = calib["P{}".format(camera)] @ calib["velo_to_cam"]
+        return cls(matrix, image_size, near)
+
+    def project(self, xyz):
+        """Pixels of the points inside the image
+
+        Returns:
+            (np.ndarray, np.ndarray, np.ndarray): (M, 2) (col, row) float
+                pixel coordinates, (M,) depths and (M,) indexes of the
+                projected points
+        """
+        xyz = np.asarray(xyz, dtype=np.float64).reshape(-1, 3)
+        m = self.matrix
+        depth = xyz @ m[2, :3] + m[2, 3]
+        index = np.flatnonzero(depth > self.near)
+        xyz, depth = xyz[index], depth[index]
+
+        uv = xyz @ m[:2, :3].T + m[:2, 3]
+        uv /= depth[:, np.newaxis]
+        height, width = self.image_size
+        inside = (uv[:, 0] >= 0) & (uv[:, 0] < width) & \
+            (uv[:, 1] >= 0) & (uv[:, 1] < height)
+        return uv[inside], depth[inside], index[inside]
+
+    def zbuffer(self, xyz):
+        """Nearest point of each pixel
+
+        Returns:
+            (np.ndarray, np.ndarray): (H, W) depth, inf if empty, and
+                (H, W) index of the nearest point, -1 if empty
+        """
+        uv, depth, index = self.project(xyz)
+        height, width = self.image_size
+        flat = uv[:, 1].astype(np.int64) * width + uv[:, 0].astype(np.int64)
+        nearest = np.full(height * width, np.inf)
+        np.minimum.at(nearest, flat, depth)
+        keep = depth == nearest[flat]
+        pixel_index = np.full(height * width, -1, dtype=np.int64)
+        pixel_index[flat[keep]] = index[keep]
+        return (nearest.reshape(self.image_size),
+                pixel_index.reshape(self.image_size))
+
+    def draw_points(self, image, points, color_by="depth", max_depth=80):
+        """Draw the nearest point of each pixel on a copy of the image
+
+        Args:
+            image (np.ndarray): (H, W, 3) uint8 camera image
+            points: structured point array, see pcdviz.io.lidar
+            color_by (str): "depth" or a point field, e.g. "intensity"
+            max_depth (float): depth of the last color
+
+        Raises:
+            ValueError: if the points have no color_by field
+        """
+        values = None
+        if color_by != "depth":
+            values = lidar.field(points, color_by)
+            if values is None:
+                raise ValueError("Unknown color_by {}, use depth or one of "
+                                 "{}".format(color_by, points.dtype.names))
+        depth, index = self.zbuffer(lidar.xyz(points))
+        rows, cols = np.nonzero(index >= 0)
+        if values is None:
+            colors = ramp_colors(depth[rows, cols], 0, max_depth)
+        else:
+            colors = ramp_colors(values[index[rows, cols]])
+        image = np.array(image, dtype=np.uint8, copy=True)
+        image[rows, cols] = colors
+        return image
+
+    def draw_boxes(self, image, labels, color=COLOR_MAP["red"]):
+        """Draw the edges of the label boxes in place
+
+        Edges with a corner behind the near plane are skipped.
+        """
+        if labels is None or not len(labels["type"]):
+            return image
+        corners = box_corners(
+            np.asarray(labels["center"], dtype=np.float64).reshape(-1, 3),
+            np.asarray(labels["extent"], dtype=np.float64).reshape(-1, 3),
+            np.asarray(labels["R"], dtype=np.float64).reshape(-1, 3, 3))
+        corners = corners.reshape(-1, 3)
+        m = self.matrix
+        depth = corners @ m[2, :3] + m[2, 3]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            uv = (corners @ m[:2, :3].T + m[:2, 3]) / depth[:, np.newaxis]
+
+        offsets = np.arange(len(corners) // 8)[:, np.newaxis, np.newaxis] * 8
+        edges = (BOX_LINES[np.newaxis] + offsets).reshape(-1, 2)
+        front = (depth[edges[:, 0]] > self.near) & \
+            (depth[edges[:, 1]] > self.near)
+        edges = edges[front]
+        rgb = (np.asarray(color, dtype=np.float64) * 255).astype(np.uint8)
+        # draw_segments takes (row, col)
+        return draw_segments(image, uv[edges[:, 0], ::-1],
+                             uv[edges[:, 1], ::-1], rgb)
+
+    def render(self, image, points, labels=None, predictions=None,
+               color_by="depth"):
+        """Camera image with the points, labels (red) and predictions
+        (blue)"""
+        image = self.draw_points(image, points, color_by)
+        self.draw_boxes(image, labels, COLOR_MAP["red"])
+        self.draw_boxes(image, predictions, COLOR_MAP["blue"])
+        return image
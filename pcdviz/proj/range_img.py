@@ -13,3 +13,191 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+
+"""
+  Spherical range images of a lidar sweep.
+
+  Columns are the azimuth, 0 points backwards and the forward direction
+  is in the middle. Rows are the beams from the top, either from the
+  elevation angle with a uniform field of view or a list of beam angles,
+  or from the ring field of the points (nuScenes). When several points
+  fall in one pixel the nearest one is kept.
+"""
+
+import numpy as np
+
+from pcdviz.io import lidar
+
+# (rows, fov_up, fov_down) of the datasets, in degrees
+SENSORS = {
+    "kitti": (64, 2.0, -24.8),
+    "nuscenes": (32, 10.0, -30.0),
+}
+
+
+class RangeImage:
+    """Project sweeps to H x W range images and back
+
+    Args:
+        height (int): number of rows, ignored with beam_angles
+        width (int): number of columns
+        fov_up, fov_down (float): vertical field of view in degrees
+        beam_angles (list, optional): elevation of each beam in degrees,
+            rows are the nearest beam
+        use_ring (bool): rows from the "ring" field when points have one
+    """
+
+    def __init__(self, height=64, width=2048, fov_up=2.0, fov_down=-24.8,
+                 beam_angles=None, use_ring=True):
+        self.width = int(width)
+        self.fov_up = np.radians(fov_up)
+        self.fov_down = np.radians(fov_down)
+        self.beam_angles = None
+        if beam_angles is not None:
+            # top beam first
+            self.beam_angles = np.sort(np.radians(beam_angles))[::-1]
+            height = len(self.beam_angles)
+        self.height = int(height)
+        self.use_ring = use_ring
+
+    @classmethod
+    def from_sensor(cls, name, width=2048, **kwargs):
+        """RangeImage of a dataset sensor, see SENSORS"""
+        height, fov_up, fov_down = SENSORS[name.lower()]
+        return cls(height, width, fov_up, fov_down, **kwargs)
+
+    @property
+    def shape(self):
+        return (self.height, self.width)
+
+    def _rows(self, points, elevation):
+        """Row of each point and (H,) elevation of the rows, the elevation
+        is only known with rows from the ring field and None otherwise
+        """
+        names = getattr(points.dtype, "names", None) or ()
+        if self.use_ring and "ring" in names:
+            ring = lidar.field(points, "ring").astype(np.int64)
+            # order the rings by their mean elevation, top ring first
+            num_rings = int(ring.max()) + 1 if len(ring) else 0
+            count = np.bincount(ring, minlength=num_rings)
+            total = np.bincount(ring, elevation, minlength=num_rings)
+            with np.errstate(invalid='ignore'):
+                mean = total / count
+            rank = np.empty(num_rings, dtype=np.int64)
+            rank[np.argsort(-np.nan_to_num(mean, nan=-np.inf),
+                            kind='stable')] = np.arange(num_rings)
+            row_elevation = np.full(self.height, np.nan)
+            shown = rank < self.height
+            row_elevation[rank[shown]] = mean[shown]
+            return rank[ring], row_elevation
+        if self.beam_angles is not None:
+            # nearest beam, the angles are decreasing
+            angles = self.beam_angles[::-1]
+            pos = np.clip(np.searchsorted(angles, elevation), 1,
+                          len(angles) - 1)
+            nearer = np.abs(elevation - angles[pos - 1]) <= \
+                np.abs(elevation - angles[pos])
+            return len(angles) - 1 - (pos - nearer), None
+        rows = (self.fov_up - elevation) / (self.fov_up - self.fov_down)
+        return np.floor(rows * self.height).astype(np.int64), None
+
+    def project(self, points):
+        """Range image of a sweep
+
+        Args:
+            points: structured point array, see pcdviz.io.lidar
+
+        Returns:
+            dict: (H, W) "range", "intensity" and "height" (z) float32,
+                NaN for empty pixels, and "index" int64, the point of each
+                pixel or -1. With rows from the ring field, "elevation"
+                (H,) is the mean elevation of each row in radians
+        """
+        xyz = lidar.xyz(points)
+        x, y, z = xyz[:, 0], xyz[:, 1], xyz[:, 2]
+        depth = np.sqrt(x * x + y * y + z * z)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            elevation = np.arcsin(np.clip(z / depth, -1, 1))
+        azimuth = np.arctan2(y, x)
+
+        rows, row_elevation = self._rows(points, elevation)
+        cols = np.floor(0.5 * (1 - azimuth / np.pi) * self.width)
+        cols = np.minimum(cols.astype(np.int64), self.width - 1)
+        valid = (rows >= 0) & (rows < self.height) & (depth > 0)
+
+        # nearest wins, the points at their pixel minimum are kept
+        size = self.height * self.width
+        flat = rows[valid] * self.width + cols[valid]
+        depth = depth[valid]
+        nearest = np.full(size, np.inf, dtype=depth.dtype)
+        np.minimum.at(nearest, flat, depth)
+        keep = depth == nearest[flat]
+        index = np.full(size, -1, dtype=np.int64)
+        index[flat[keep]] = np.flatnonzero(valid)[keep]
+
+        image = {"index": index.reshape(self.shape)}
+        if row_elevation is not None:
+            image["elevation"] = row_elevation
+        filled = index >= 0
+        names = getattr(points.dtype, "names", None) or ()
+        channels = {"range": nearest, "height": z}
+        if "intensity" in names:
+            channels["intensity"] = lidar.field(points, "intensity")
+        for name, values in channels.items():
+            channel = np.full(size, np.nan, dtype=np.float32)
+            channel[filled] = values[index[filled]] if name != "range" \
+                else values[filled]
+            image[name] = channel.reshape(self.shape)
+        if "intensity" not in image:
+            image["intensity"] = np.full(self.shape, np.nan, np.float32)
+        return image
+
+    def angles(self):
+        """Elevation of each row and azimuth of each column, in radians"""
+        if self.beam_angles is not None:
+            elevation = self.beam_angles
+        else:
+            rows = (np.arange(self.height) + 0.5) / self.height
+            elevation = self.fov_up - rows * (self.fov_up - self.fov_down)
+        cols = (np.arange(self.width) + 0.5) / self.width
+        azimuth = np.pi * (1 - 2 * cols)
+        return elevation, azimuth
+
+    def unproject(self, image):
+        """Points of the filled pixels of a range image
+
+        Returns:
+            (np.ndarray, np.ndarray): (M, 3) xyz rebuilt from the range and
+                the pixel angles, and the index of the source point of each
+                (see project), -1 if unknown. Rows from the ring field use
+                the "elevation" of the image instead of the field of view.
+        """
+        depth = image["range"]
+        rows, cols = np.nonzero(np.isfinite(depth))
+        elevation, azimuth = self.angles()
+        if image.get("elevation") is not None:
+            elevation = image["elevation"]
+        r = depth[rows, cols].astype(np.float64)
+        e, a = elevation[rows], azimuth[cols]
+        xyz = np.stack([r * np.cos(e) * np.cos(a),
+                        r * np.cos(e) * np.sin(a),
+                        r * np.sin(e)], axis=1)
+        index = image.get("index")
+        return xyz, (index[rows, cols] if index is not None
+                     else np.full(len(r), -1, dtype=np.int64))
+
+    @staticmethod
+    def coverage(image):
+        """Filled ratio of each row, low rows are dropped or missing beams"""
+        return (image["index"] >= 0).mean(axis=1)
+
+    @staticmethod
+    def to_image(image, channel="range"):
+        """(H, W) uint8 image of a channel, empty pixels are black"""
+        values = image[channel]
+        finite = np.isfinite(values)
+        if not finite.any():
+            return np.zeros(values.shape, dtype=np.uint8)
+        low, high = values[finite].min(), values[finite].max()
+        scaled = (values - low) / max(high - low, 1e-6)
+        return (np.fmin(np.fmax(scaled, 0), 1) * 255).astype(np.uint8)
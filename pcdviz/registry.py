@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+# Copyright 2023 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+  Datasets, lidar readers and filters by name.
+
+  Built-in entries are "module:attribute" strings and a module is only
+  imported when its entry is used, so choosing KITTI does not import the
+  nuScenes or image code. Other packages add entries through the entry
+  point groups below, e.g. in their setup.py
+
+      entry_points={"pcdviz.datasets": ["MyDataset = mypkg.data:MyDataset"]}
+
+  Entry points are only scanned for names that are not built in.
+"""
+
+import importlib
+import logging
+
+
+def _entry_points(group):
+    try:
+        from importlib import metadata
+    except ImportError:
+        # python < 3.8
+        try:
+            import importlib_metadata as metadata
+        except ImportError:
+            return {}
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, "select"):
+        entry_points = entry_points.select(group=group)
+    else:
+        entry_points = entry_points.get(group, [])
+    return {entry_point.name: entry_point for entry_point in entry_points}
+
+
+class Registry:
+    """Name -> lazily imported object
+
+    Args:
+        group (str): entry point group of the plugins
+        builtins (dict): {name: "module:attribute"}
+    """
+
+    def __init__(self, group, builtins):
+        self.group = group
+        self._builtins = dict(builtins)
+        self._loaded = {}
+        self._plugins = None
+
+    def _plugin_entries(self):
+        if self._plugins is None:
+            self._plugins = _entry_points(self.group)
+        return self._plugins
+
+    def register(self, name, target):
+        """Add an entry, target is an object or a "module:attribute" string"""
+        self._loaded.pop(name, None)
+        if isinstance(target, str):
+            self._builtins[name] = target
+        else:
+            self._builtins.pop(name, None)
+            self._loaded[name] = target
+
+    def names(self):
+        names = set(self._builtins) | set(self._loaded)
+        return sorted(names | set(self._plugin_entries()))
+
+    def __contains__(self, name):
+        return name in self._loaded or name in self._builtins or \
+            name in self._plugin_entries()
+
+    def get(self, name):
+        """Object registered as name, None if unknown or it fails to import"""
+        obj = self._loaded.get(name)
+        if obj is not None:
+            return obj
+        try:
+            if name in self._builtins:
+                module_name, _, attr = self._builtins[name].partition(":")
+                obj = getattr(importlib.import_module(module_name), attr)
+            elif name in self._plugin_entries():
+                obj = self._plugin_entries()[name].load()
+            else:
+                return None
+        except (ImportError, AttributeError) as e:
+            logging.error("Load {} '{}' failed! {}".format(
+                self.group, name, e))
+            return None
+        self._loaded[name] = obj
+        return obj
+
+
+DATASETS = Registry("pcdviz.datasets", {
+    "KITTI": "pcdviz.dataset.kitti:KITTI",
+    "nuScenes": "pcdviz.dataset.nuscenes:Nuscenes",
+    "Waymo": "pcdviz.dataset.waymo:Waymo",
+    "custom": "pcdviz.dataset.custom_dataset:CustomDataset",
+})
+
+# reader(file_path, fields) -> structured point array, by file type
+READERS = Registry("pcdviz.readers", {
+    "bin": "pcdviz.io.lidar:read_bin",
+})
+
+FILTERS = Registry("pcdviz.filters", {
+    "range_filter": "pcdviz.filter.range_filter:RangeFilter",
+    "threshold_filter": "pcdviz.filter.threshold_filter:ThresholdFilter",
+    "type_filter": "pcdviz.filter.type_filter:TypeFilter",
+})
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+# Copyright 2023 daohu527 <daohu527@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+  Headless rendering of whole datasets, "pcdviz render".
+
+  Frames are rendered to BEV or camera overlay images by a process pool,
+  each worker opens the dataset once. Images already on disk are skipped,
+  so an interrupted run continues where it stopped, and frames.csv lists
+  the frames in dataset order.
+"""
+
+import argparse
+import csv
+import logging
+import multiprocessing
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+from pcdviz.config.config import Config
+from pcdviz.dataset.factory import create_dataset
+from pcdviz.proj.bev import BEV
+
+MODES = ("bev", "camera")
+
+# Seconds between two progress reports
+REPORT_INTERVAL = 2.0
+
+# State of a pool worker, set by _init_worker
+_worker = {}
+
+
+def render_frame(dataset, index, mode="bev", bev=None, color_by="depth"):
+    """Image of the frame at index, None if it can not be rendered
+
+    Args:
+        dataset (BaseDataset): dataset of the frame
+        index (int): frame index
+        mode (str): "bev" or "camera", camera needs render_camera
+        bev (BEV, optional): BEV of the bev mode
+        color_by (str): point coloring of the camera mode
+    """
+    if mode == "camera":
+        if not hasattr(dataset, "render_camera"):
+            raise ValueError("{} has no camera images".format(
+                type(dataset).__name__))
+        return dataset.render_camera(index, color_by=color_by)
+
+    points = dataset.read_points(index)
+    if points is None:
+        return None
+    labels = dataset.read_labels(index)
+    points, labels = dataset.apply_filters(points, labels)
+    predictions = dataset.read_predictions(index)
+    if predictions is not None and dataset.filters is not None:
+        predictions = dataset.filters.apply_labels(predictions)
+    return (bev or BEV()).render(points, labels, predictions)
+
+
+def image_format_name(extension):
+    """Pillow format of an extension, e.g. JPEG for jpg, None if unknown"""
+    return Image.registered_extensions().get("." + extension.lower())
+
+
+def _init_worker(config_path, options):
+    _worker["dataset"] = create_dataset(Config(config_path))
+    _worker["bev"] = BEV(**options.get("bev", {}))
+    _worker["options"] = options
+
+
+def _render_task(task):
+    """Render and save one frame, returns (key, file name, status)"""
+    index, key = task
+    options = _worker["options"]
+    file_name = "{}.{}".format(key, options["format"])
+    file_path = os.path.join(options["out"], file_name)
+    if os.path.exists(file_path):
+        return key, file_name, "skipped"
+    try:
+        image = render_frame(_worker["dataset"], index, options["mode"],
+                             _worker["bev"], options["color_by"])
+        if image is None:
+            return key, "", "missing"
+        tmp_file = "{}.tmp".format(file_path)
+        Image.fromarray(image).save(tmp_file, format=options["pil_format"])
+        os.replace(tmp_file, file_path)
+    except Exception as e:
+        logging.error("Render frame {} failed! {}".format(key, e))
+        return key, "", "failed"
+    return key, file_name, "done"
+
+
+def _report(done, total, counts, start):
+    elapsed = time.time() - start
+    rate = counts["done"] / elapsed if elapsed > 0 else 0
+    eta = "eta {:.0f}s".format((total - done) / rate) if rate > 0 else ""
+    print("{}/{} frames, {:.1f} frames/s {}, {}".format(
+        done, total, rate, eta,
+        ", ".join("{} {}".format(v, k) for k, v in sorted(counts.items()))))
+
+
+def render_dataset(config_path, out, mode="bev", workers=None, query=None,
+                   image_format="png", color_by="depth", bev=None):
+    """Render the frames of the dataset of a config to out/<key>.<format>
+
+    Returns:
+        dict: number of frames per status, "done", "skipped", "missing"
+            and "failed", None if the dataset or the format is unknown
+    """
+    pil_format = image_format_name(image_format)
+    if pil_format is None:
+        logging.error("Unknown image format! {}".format(image_format))
+        return None
+    config = Config(config_path)
+    dataset = create_dataset(config)
+    if dataset is None:
+        return None
+    indexes = np.arange(len(dataset))
+    query = query or config.dataset.get("query")
+    if query:
+        indexes = dataset.query(query).indexes
+        print("{} frames match {}".format(len(indexes), query))
+    keys = np.asarray(dataset.keys())[indexes]
+
+    os.makedirs(out, exist_ok=True)
+    options = {"out": out, "mode": mode, "format": image_format,
+               "pil_format": pil_format, "color_by": color_by,
+               "bev": bev or {}}
+    workers = workers or os.cpu_count() or 1
+    tasks = [(int(i), str(key)) for i, key in zip(indexes, keys)]
+    counts = {"done": 0, "skipped": 0, "missing": 0, "failed": 0}
+    start = last_report = time.time()
+
+    # frames.csv is written as results arrive, they come in dataset order
+    csv_file = os.path.join(out, "frames.csv")
+    with multiprocessing.Pool(workers, _init_worker,
+                              (config_path, options)) as pool:
+        with open(csv_file, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["index", "key", "file", "status"])
+            chunksize = max(1, min(16, len(tasks) // (workers * 4)))
+            results = pool.imap(_render_task, tasks, chunksize=chunksize)
+            for done, ((index, _), (key, file_name, status)) in enumerate(
+                    zip(tasks, results), 1):
+                writer.writerow([index, key, file_name, status])
+                counts[status] += 1
+                if time.time() - last_report > REPORT_INTERVAL:
+                    last_report = time.time()
+                    _report(done, len(tasks), counts, start)
+    _report(len(tasks), len(tasks), counts, start)
+    return counts
+
+
+def main(args):
+    parser = argparse.ArgumentParser(
+        description="Render dataset frames to images without a window.",
+        prog="pcdviz render")
+    parser.add_argument(
+        "-c", "--cfg", action="store", type=str, required=True,
+        help="Config with a dataset block")
+    parser.add_argument(
+        "-o", "--out", action="store", type=str, required=False,
+        help="Output directory")
+    parser.add_argument(
+        "-m", "--mode", action="store", type=str, choices=MODES,
+        required=False, help="bev or camera, camera is KITTI only")
+    parser.add_argument(
+        "-j", "--workers", action="store", type=int, required=False,
+        help="Render processes, the number of CPUs by default")
+    parser.add_argument(
+        "-q", "--query", action="store", type=str, required=False,
+        help="Only render the frames matching a label query")
+    parser.add_argument(
+        "--format", action="store", type=str, required=False,
+        help="Image file extension, e.g. png (default) or jpg")
+    args = parser.parse_args(args[1:])
+
+    render_conf = Config(args.cfg).render
+    render_dataset(args.cfg, args.out or render_conf.get("out", "render"),
+                   mode=args.mode or render_conf.get("mode", "bev"),
+                   workers=args.workers or render_conf.get("workers"),
+                   query=args.query,
+                   image_format=args.format or render_conf.get(
+                       "format", "png"),
+                   color_by=render_conf.get("color_by", "depth"),
+                   bev=render_conf.get("bev"))
@@ -14,9 +14,249 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+"""
+  Label statistics of a dataset, like the YOLOv8 labels charts.
 
-import seaborn
+  The labels come from the LabelIndex of the dataset, so a re-run only
+  reads the label files that changed. The statistics are histograms over
+  fixed BINS per type, they can be merged, e.g. across splits, by adding
+  them. Charts need matplotlib and seaborn, they are imported on use.
+"""
 
+import argparse
+import json
+import logging
+import os
 
-def label_num_table(self):
-    pass
+import numpy as np
+
+from pcdviz.config.config import Config
+from pcdviz.dataset.factory import create_dataset
+
+# Histogram bin edges, values outside go to the first or last bin
+BINS = {
+    "length": np.arange(0, 20.25, 0.25),
+    "width": np.arange(0, 10.25, 0.25),
+    "height": np.arange(0, 10.25, 0.25),
+    "aspect": np.arange(0, 10.1, 0.1),
+    "yaw": np.linspace(-np.pi, np.pi, 37),
+    "distance": np.arange(0, 102, 2),
+}
+
+
+def _histograms(values, types, num_types, bins):
+    """(num_types, len(bins) - 1) counts of values per type"""
+    bin_ids = np.searchsorted(bins, values, side='right') - 1
+    np.clip(bin_ids, 0, len(bins) - 2, out=bin_ids)
+    flat = types.astype(np.int64) * (len(bins) - 1) + bin_ids
+    counts = np.bincount(flat[np.isfinite(values)],
+                         minlength=num_types * (len(bins) - 1))
+    return counts.reshape(num_types, len(bins) - 1)
+
+
+class LabelStatistics:
+    """Box statistics per type
+
+    Attributes:
+        num_frames (int): frames counted
+        boxes (dict): {type: number of boxes}
+        frames (dict): {type: number of frames with the type}
+        histograms (dict): {column: {type: counts over BINS[column]}}
+        objects_per_frame (np.ndarray): number of frames with i boxes
+    """
+
+    def __init__(self):
+        self.num_frames = 0
+        self.boxes = {}
+        self.frames = {}
+        self.histograms = {name: {} for name in BINS}
+        self.objects_per_frame = np.zeros(1, dtype=np.int64)
+
+    @classmethod
+    def from_index(cls, index, frames=None):
+        """Statistics of the frames of a LabelIndex, all if frames is None"""
+        stats = cls()
+        num_boxes = index.num_boxes
+        types = index.types
+        columns = dict(index.columns)
+        box_frames = index.box_frames
+        if frames is not None:
+            frames = np.asarray(frames, dtype=np.int64)
+            selected = np.zeros(len(index), dtype=bool)
+            selected[frames] = True
+            rows = selected[box_frames]
+            num_boxes = num_boxes[frames]
+            types, box_frames = types[rows], box_frames[rows]
+            columns = {name: values[rows] for name, values in columns.items()}
+
+        names = [str(name) for name in index.type_names]
+        num_types = len(names)
+        stats.num_frames = len(num_boxes)
+        stats.objects_per_frame = np.bincount(num_boxes, minlength=1)
+        box_counts = np.bincount(types, minlength=num_types)
+        pairs = np.unique(box_frames * max(num_types, 1) + types)
+        frame_counts = np.bincount(pairs % max(num_types, 1),
+                                   minlength=num_types)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            columns["aspect"] = columns["length"] / columns["width"]
+        for column, bins in BINS.items():
+            counts = _histograms(columns[column], types, num_types, bins)
+            stats.histograms[column] = {
+                name: counts[i] for i, name in enumerate(names)
+                if box_counts[i]}
+        stats.boxes = {name: int(box_counts[i])
+                       for i, name in enumerate(names) if box_counts[i]}
+        stats.frames = {name: int(frame_counts[i])
+                        for i, name in enumerate(names) if box_counts[i]}
+        return stats
+
+    def merge(self, other):
+        """Add the statistics of other to these, returns self"""
+        self.num_frames += other.num_frames
+        for mine, theirs in ((self.boxes, other.boxes),
+                             (self.frames, other.frames)):
+            for name, count in theirs.items():
+                mine[name] = mine.get(name, 0) + count
+        for column, histograms in other.histograms.items():
+            mine = self.histograms.setdefault(column, {})
+            for name, counts in histograms.items():
+                mine[name] = mine[name] + counts if name in mine else counts
+        size = max(len(self.objects_per_frame), len(other.objects_per_frame))
+        mine = np.pad(self.objects_per_frame,
+                      (0, size - len(self.objects_per_frame)))
+        theirs = np.pad(other.objects_per_frame,
+                        (0, size - len(other.objects_per_frame)))
+        self.objects_per_frame = mine + theirs
+        return self
+
+    def histogram(self, column, types=None):
+        """Counts over BINS[column] of some types, all types if None"""
+        histograms = self.histograms[column]
+        counts = np.zeros(len(BINS[column]) - 1, dtype=np.int64)
+        for name in (histograms if types is None else types):
+            if name in histograms:
+                counts += histograms[name]
+        return counts
+
+    def to_dict(self):
+        return {"num_frames": self.num_frames,
+                "boxes": self.boxes,
+                "frames": self.frames,
+                "objects_per_frame": self.objects_per_frame.tolist(),
+                "bins": {column: bins.tolist()
+                         for column, bins in BINS.items()},
+                "histograms": {
+                    column: {name: counts.tolist()
+                             for name, counts in histograms.items()}
+                    for column, histograms in self.histograms.items()}}
+
+    def save(self, file_path):
+        with open(file_path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+
+def label_num_table(stats):
+    """Rows of (type, boxes, frames, boxes per frame), most boxes first"""
+    rows = [(name, count, stats.frames[name],
+             count / max(stats.frames[name], 1))
+            for name, count in stats.boxes.items()]
+    return sorted(rows, key=lambda row: -row[1])
+
+
+def format_table(stats):
+    lines = ["{:<32}{:>10}{:>10}{:>12}".format(
+        "type", "boxes", "frames", "per frame")]
+    for name, boxes, frames, per_frame in label_num_table(stats):
+        lines.append("{:<32}{:>10}{:>10}{:>12.2f}".format(
+            name, boxes, frames, per_frame))
+    lines.append("{} frames, {} boxes".format(
+        stats.num_frames, sum(stats.boxes.values())))
+    return "\n".join(lines)
+
+
+def plot(stats, file_path, types=None):
+    """Save the label charts to an image
+
+    Args:
+        stats (LabelStatistics): statistics to draw
+        file_path (str): image file, e.g. labels.png
+        types (list, optional): types of the distributions, all if None
+    """
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        import seaborn
+    except ImportError as e:
+        logging.error("Charts need matplotlib and seaborn! {}".format(e))
+        return False
+
+    seaborn.set_theme(style="whitegrid")
+    fig, axes = plt.subplots(2, 3, figsize=(18, 10))
+    rows = label_num_table(stats)
+    seaborn.barplot(x=[row[1] for row in rows], y=[row[0] for row in rows],
+                    ax=axes[0, 0], color="C0")
+    axes[0, 0].set_title("boxes")
+
+    for column in ("length", "width", "height"):
+        axes[0, 1].stairs(stats.histogram(column, types), BINS[column],
+                          label=column)
+    axes[0, 1].set_title("size (m)")
+    axes[0, 1].legend()
+
+    for ax, column, title in ((axes[0, 2], "aspect", "length / width"),
+                              (axes[1, 0], "yaw", "yaw (rad)"),
+                              (axes[1, 1], "distance", "distance (m)")):
+        ax.stairs(stats.histogram(column, types), BINS[column], fill=True)
+        ax.set_title(title)
+
+    counts = stats.objects_per_frame
+    axes[1, 2].bar(np.arange(len(counts)), counts)
+    axes[1, 2].set_title("boxes per frame")
+
+    fig.tight_layout()
+    fig.savefig(file_path)
+    plt.close(fig)
+    return True
+
+
+def dataset_statistics(dataset, query=None, workers=None):
+    """LabelStatistics of a dataset, only the frames matching query if set
+
+    Labels are read by the LabelIndex of the dataset, with workers
+    processes for the frames whose label files changed.
+    """
+    index = dataset.label_index(workers)
+    frames = None if query is None else index.select(query)
+    return LabelStatistics.from_index(index, frames)
+
+
+def main(args):
+    parser = argparse.ArgumentParser(
+        description="Label statistics of a dataset.",
+        prog="pcdviz stats")
+    parser.add_argument(
+        "-c", "--cfg", action="store", type=str, required=True,
+        help="Config with a dataset block")
+    parser.add_argument(
+        "-o", "--out", action="store", type=str, required=False,
+        help="Output directory of statistics.json and labels.png")
+    parser.add_argument(
+        "-j", "--workers", action="store", type=int, required=False,
+        help="Label reading processes, the number of CPUs by default")
+    parser.add_argument(
+        "-q", "--query", action="store", type=str, required=False,
+        help="Only count the frames matching a label query")
+    args = parser.parse_args(args[1:])
+
+    dataset = create_dataset(Config(args.cfg))
+    if dataset is None:
+        logging.error("Unknown dataset in {}".format(args.cfg))
+        return
+    stats = dataset_statistics(dataset, args.query, args.workers)
+    print(format_table(stats))
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+        stats.save(os.path.join(args.out, "statistics.json"))
+        plot(stats, os.path.join(args.out, "labels.png"))
@@ -15,17 +15,38 @@
 # limitations under the License.
 
 import math
+import os
 
 import numpy as np
 
 COLOR_MAP = {
     "red": [1, 0, 0],
-    "yellow": [0, 1, 0],
+    "yellow": [1, 1, 0],
+    "green": [0, 1, 0],
     "blue": [0, 0, 1],
     "black": [0, 0, 0]
 }
 
 
+def get_cache_dir(*names):
+    """Directory for pcdviz caches, PCDVIZ_CACHE_DIR or ~/.cache/pcdviz"""
+    root = os.environ.get("PCDVIZ_CACHE_DIR", os.path.join(
+        os.path.expanduser("~"), ".cache", "pcdviz"))
+    path = os.path.join(root, *names)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def expand_ranges(starts, lengths):
+    """Concatenate arange(start, start + length) for every pair"""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + (np.arange(total) - offsets)
+
+
 def to_quaternion(roll, pitch, yaw):
     cr = math.cos(roll * 0.5)
     sr = math.sin(roll * 0.5)
@@ -113,6 +134,52 @@ def euler_to_rotation_matrix(theta1, theta2, theta3, order='xyz'):
     return matrix
 
 
+def euler_to_rotation_matrices(theta1, theta2, theta3, order='xyz'):
+    """Batched euler_to_rotation_matrix, returns (N, 3, 3)"""
+    theta1, theta2, theta3 = np.broadcast_arrays(
+        np.atleast_1d(theta1), np.atleast_1d(theta2), np.atleast_1d(theta3))
+    matrix = euler_to_rotation_matrix(theta1, theta2, theta3, order)
+    return np.moveaxis(matrix, -1, 0)
+
+
+def yaw_to_rotation_matrices(yaw):
+    """Rotations around z, returns (N, 3, 3)"""
+    yaw = np.atleast_1d(yaw)
+    c, s = np.cos(yaw), np.sin(yaw)
+    matrix = np.zeros((len(yaw), 3, 3), dtype=yaw.dtype)
+    matrix[:, 0, 0] = c
+    matrix[:, 0, 1] = -s
+    matrix[:, 1, 0] = s
+    matrix[:, 1, 1] = c
+    matrix[:, 2, 2] = 1
+    return matrix
+
+
+def quaternion_to_rotation_matrices(q):
+    """Rotations of (N, 4) unit quaternions in (w, x, y, z) order"""
+    q = np.asarray(q, dtype=np.float64).reshape(-1, 4)
+    w, x, y, z = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    matrix = np.empty((len(q), 3, 3))
+    matrix[:, 0, 0] = 1 - 2 * (y * y + z * z)
+    matrix[:, 0, 1] = 2 * (x * y - z * w)
+    matrix[:, 0, 2] = 2 * (x * z + y * w)
+    matrix[:, 1, 0] = 2 * (x * y + z * w)
+    matrix[:, 1, 1] = 1 - 2 * (x * x + z * z)
+    matrix[:, 1, 2] = 2 * (y * z - x * w)
+    matrix[:, 2, 0] = 2 * (x * z - y * w)
+    matrix[:, 2, 1] = 2 * (y * z + x * w)
+    matrix[:, 2, 2] = 1 - 2 * (x * x + y * y)
+    return matrix
+
+
+def transform_matrix(translation, rotation):
+    """4x4 pose from a translation and a (w, x, y, z) quaternion"""
+    matrix = np.eye(4)
+    matrix[:3, :3] = quaternion_to_rotation_matrices(rotation)[0]
+    matrix[:3, 3] = translation
+    return matrix
+
+
 def is_rotation_matrix(R):
     Rt = np.transpose(R)
     should_be_identity = np.dot(Rt, R)
@@ -14,21 +14,27 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import datetime
 import logging
-import time
+from concurrent.futures import ThreadPoolExecutor
 
 import open3d as o3d
 from open3d.visualization import gui, rendering
 
-from pcdviz.io.image import save_gif
+from pcdviz import profiler
+from pcdviz.dataset.navigator import FrameNavigator
+from pcdviz.geometry.pointcloud import is_tensor, num_points, to_legacy
+from pcdviz.io.image import BackgroundEncoder, SnapshotWriter, open_writer
 
+# GLFW key codes
 KEY_A = 65
 KEY_N = 78
-KEY_LEFT_ARROW = 75
-KEY_RIGHT_ARROW = 77
-KEY_UP_ARROW = 72
-KEY_DOWN_ARROW = 80
+KEY_RIGHT_ARROW = 262
+KEY_LEFT_ARROW = 263
+KEY_DOWN_ARROW = 264
+KEY_UP_ARROW = 265
+
+# Frames skipped by the up/down arrows
+JUMP_STEP = 10
 
 
 class Visualizer:
@@ -36,9 +42,17 @@ class Visualizer:
     SOLID_NAME = "Solid Color"
     LABELS_NAME = "Label Colormap"
 
-    def __init__(self):
+    def __init__(self, lod=None):
         self._init_vis()
-        self.save_gif = False
+        # BackgroundEncoder of the recording, see record
+        self._recorder = None
+        self._snapshots = None
+        # LevelOfDetail of the point clouds, None shows all points
+        self.lod = lod
+        self._playing = False
+        self._refiner = None
+        # (frame, displayed pointcloud, future of the refined one)
+        self._pending = None
 
     def _init_vis(self):
         self._vis = o3d.visualization.VisualizerWithKeyCallback()
@@ -51,44 +65,162 @@ class Visualizer:
         # callback
         self._vis.register_key_callback(KEY_A, self._key_capture_callback)
         self._vis.register_key_callback(KEY_N, self._key_next_callback)
+        self._vis.register_key_callback(
+            KEY_RIGHT_ARROW, self._key_next_callback)
+        self._vis.register_key_callback(
+            KEY_LEFT_ARROW, self._key_prev_callback)
+        self._vis.register_key_callback(
+            KEY_UP_ARROW, self._key_jump_forward_callback)
+        self._vis.register_key_callback(
+            KEY_DOWN_ARROW, self._key_jump_backward_callback)
 
-    def _init_data(self, dataset):
+    def _init_data(self, dataset, prefetch=None, cache_mb=1024):
         self._dataset = dataset
-        self._items = self._dataset.items()
+        self._navigator = FrameNavigator(dataset, cache_mb, prefetch)
+
+    def _close_data(self):
+        self._navigator.close()
+        if self._pending is not None:
+            self._pending[2].cancel()
+            self._pending = None
+        if self._refiner is not None:
+            self._refiner.shutdown(wait=False)
+            self._refiner = None
+        self._close_recorder()
+        stats = self._navigator.stats
+        print("Prefetch hits: {}, misses: {}, hit rate: {:.1%}, "
+              "cache hits: {}".format(stats["hits"], stats["misses"],
+                                      stats["hit_rate"], stats["cache_hits"]))
 
     def __exit__(self):
         self._vis.destroy_window()
 
+    def record(self, path, fps=10, max_queue=8):
+        """Record every displayed frame to path, see open_writer"""
+        self._recorder = BackgroundEncoder(open_writer(path, fps), max_queue)
+
+    def _close_recorder(self):
+        for encoder in (self._recorder, self._snapshots):
+            if encoder is not None:
+                encoder.close()
+                if encoder.dropped:
+                    logging.warning("Dropped {} of {} frames".format(
+                        encoder.dropped, encoder.dropped + encoder.written))
+        self._recorder = self._snapshots = None
+
     def _key_capture_callback(self, vis):
-        vis.capture_screen_image("{}.png".format(datetime.datetime.now()))
+        if self._snapshots is None:
+            self._snapshots = BackgroundEncoder(SnapshotWriter())
+        self._snapshots.submit(vis.capture_screen_float_buffer(False))
+
+    def _show_frame(self, vis, geometries):
+        if not geometries:
+            return False
+        frame = self._dataset.keys()[self._navigator.index]
+        with profiler.span("show_frame", frame=frame):
+            with profiler.span("add_geometry") as span:
+                vis.clear_geometries()
+                pointcloud = self._frame_pointcloud(vis, geometries)
+                vis.add_geometry(pointcloud)
+                for bbox in geometries['bboxes']:
+                    vis.add_geometry(bbox)
+                span.set(points=num_points(pointcloud),
+                         boxes=len(geometries['bboxes']))
+            if self._recorder is not None:
+                with profiler.span("render"):
+                    image = vis.capture_screen_float_buffer(True)
+                self._recorder.submit(image)
+            elif profiler.enabled():
+                # open3d renders after the key callback returns, redraw
+                # here to time it
+                with profiler.span("render"):
+                    vis.capture_screen_float_buffer(True)
+        return True
+
+    def _frame_pointcloud(self, vis, frame):
+        """Pointcloud of the frame within the LOD budget
+
+        A frame above the budget is shown strided and the voxel downsampled
+        cloud is computed in the background, it replaces the strided one
+        once ready (see _refine_callback) and is kept in the frame.
+
+        Tensor point clouds are converted to the legacy ones the window
+        needs after the LOD, so frames in the cache stay float32.
+        """
+        pointcloud = frame['pointcloud']
+        if self._pending is not None:
+            self._pending[2].cancel()
+            self._pending = None
+            vis.register_animation_callback(None)
+        if self.lod is None or not self.lod.needs_lod(pointcloud):
+            return to_legacy(pointcloud)
+        if 'lod' in frame:
+            return frame['lod']
+
+        with profiler.span("lod_coarse"):
+            coarse = to_legacy(self.lod.coarse(pointcloud))
+        if not self._playing:
+            if self._refiner is None:
+                self._refiner = ThreadPoolExecutor(max_workers=1)
+            self._pending = (frame, coarse,
+                             self._refiner.submit(self._refine, pointcloud))
+            vis.register_animation_callback(self._refine_callback)
+        return coarse
+
+    def _refine(self, pointcloud):
+        with profiler.span("lod_refine"):
+            return to_legacy(self.lod.refine(pointcloud))
+
+    def _refine_callback(self, vis):
+        if self._pending is None or not self._pending[2].done():
+            return False
+        frame, coarse, future = self._pending
+        self._pending = None
+        vis.register_animation_callback(None)
+        if future.cancelled() or future.exception() is not None:
+            return False
+        frame['lod'] = future.result()
+        # the frame is the current one, the refine is cancelled otherwise
+        self._navigator.update()
+        vis.remove_geometry(coarse, reset_bounding_box=False)
+        vis.add_geometry(frame['lod'], reset_bounding_box=False)
+        return True
 
     def _key_next_callback(self, vis):
-        image_datas = []
-        geometries = next(self._items, None)
-        if geometries:
-            vis.clear_geometries()
-            vis.add_geometry(geometries['pointcloud'])
-            for bbox in geometries['bboxes']:
-                vis.add_geometry(bbox)
-            if self.save_gif:
-                image_data = vis.capture_screen_float_buffer()
-                image_datas.append(image_data)
-                save_gif(image_datas, "test.gif")
-
-    def visualize_dataset(self, dataset):
+        return self._show_frame(vis, self._navigator.next())
+
+    def _key_prev_callback(self, vis):
+        return self._show_frame(vis, self._navigator.prev())
+
+    def _key_jump_forward_callback(self, vis):
+        index = min(self._navigator.index + JUMP_STEP,
+                    len(self._navigator) - 1)
+        return self._show_frame(vis, self._navigator.jump(index))
+
+    def _key_jump_backward_callback(self, vis):
+        index = max(self._navigator.index - JUMP_STEP, 0)
+        return self._show_frame(vis, self._navigator.jump(index))
+
+    def visualize_dataset(self, dataset, prefetch=None, cache_mb=1024,
+                          start=0):
         """Display the dataset
 
+        N or the right arrow shows the next frame, the left arrow the
+        previous one, up and down jump JUMP_STEP frames.
+
         Args:
-            dataset (_type_): _description_
+            dataset (BaseDataset): dataset to display
+            prefetch (dict, optional): PrefetchLoader options, "depth" and
+                "workers". Defaults to None.
+            cache_mb (int, optional): memory budget of the frame cache.
+                Defaults to 1024.
+            start (int, optional): index of the first frame. Defaults to 0.
         """
-        self._init_data(dataset)
+        self._init_data(dataset, prefetch, cache_mb)
         # first frame, next will display by callback(_key_next_callback)
-        geometries = next(self._items, None)
-        if geometries:
-            self._vis.add_geometry(geometries['pointcloud'])
-            for bbox in geometries['bboxes']:
-                self._vis.add_geometry(bbox)
+        self._show_frame(self._vis, self._navigator.jump(start))
         self._vis.run()
+        self._close_data()
 
     def visualize(self, data=[]):
         """Display a frame of point cloud or image, along with predicted and true values
@@ -103,14 +235,41 @@ class Visualizer:
             return
 
         data = data if isinstance(data, list) else [data]
-        for d in data:
-            self._vis.add_geometry(d)
+        if self.lod is not None:
+            with profiler.span("lod_refine"):
+                data = self._decimate(data)
+        with profiler.span("add_geometry"):
+            for d in data:
+                self._vis.add_geometry(to_legacy(d))
+        if self._recorder is not None:
+            # a single frame, recorded once before the window runs
+            with profiler.span("render"):
+                image = self._vis.capture_screen_float_buffer(True)
+            self._recorder.submit(image)
         self._vis.run()
+        self._close_recorder()
+
+    def _decimate(self, data):
+        """Share the LOD budget between the point clouds in data"""
+        def is_cloud(d):
+            return isinstance(d, o3d.geometry.PointCloud) or is_tensor(d)
+
+        total = sum(num_points(d) for d in data if is_cloud(d))
+        if total <= self.lod.budget:
+            return data
+        return [self.lod.refine(d, max(1, self.lod.budget * num_points(d)
+                                       // total))
+                if is_cloud(d) else d
+                for d in data]
 
-    def play_dataset(self, dataset):
-        self._init_data(dataset)
+    def play_dataset(self, dataset, prefetch=None, cache_mb=1024):
+        self._init_data(dataset, prefetch, cache_mb)
+        # frames change on every redraw, only the strided LOD is used
+        self._playing = True
         self._vis.register_animation_callback(self._key_next_callback)
         self._vis.run()
+        self._playing = False
+        self._close_data()
 
     def _init_user_interface(self, title, width, height):
         self.window = gui.Application.instance.create_window(
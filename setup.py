@@ -43,6 +43,12 @@ setuptools.setup(
         'pyyaml',
         'scikit-image',
     ],
+    extras_require={
+        # GIF and video recordings
+        'record': ['imageio', 'imageio-ffmpeg'],
+        # label charts of "pcdviz stats"
+        'stats': ['matplotlib', 'seaborn'],
+    },
     entry_points={
         'console_scripts': [
             'pcdviz = pcdviz.main:main',